@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the polling command path.
+
+Compares send_command() plus string parsing against the typed fast path
+(command_int / command_vector) for a typical status poll, and reports CPU
+time per sample. Runs against the simulator by default; pass a controller
+address to measure real hardware:
+
+    python benchmark_commands.py [address] [samples]
+"""
+import sys
+import time
+
+from constants import SIM_DEFAULT_ADDRESS
+from galil_interface import GalilController
+
+# One status sample: every axis position, error and velocity, plus A's status
+POLL_COMMANDS = ("TP", "TE", "TV", "MG _TSA")
+
+# Canned replies for the parse-only comparison
+SAMPLE_REPLY = " 1024, -2048, 409600, 0\r\n:"
+
+
+def poll_strings(controller):
+    sample = []
+    for command in POLL_COMMANDS:
+        response = controller.send_command(command)
+        sample.append([int(float(value)) for value in response.split(",")])
+    return sample
+
+
+def poll_typed(controller):
+    sample = [controller.command_vector(command, int) for command in POLL_COMMANDS[:3]]
+    sample.append([controller.command_int(POLL_COMMANDS[3])])
+    return sample
+
+
+def parse_strings(raw):
+    response = raw.decode("ASCII")[:-3].strip()
+    return [int(value) for value in response.split(",")]
+
+
+def parse_bytes(raw):
+    return [int(value) for value in raw[:-3].split(b",")]
+
+
+def cpu_per_call(function, argument, samples):
+    start = time.process_time()
+    for _ in range(samples):
+        function(argument)
+    return (time.process_time() - start) / samples
+
+
+def main():
+    address = sys.argv[1] if len(sys.argv) > 1 else SIM_DEFAULT_ADDRESS + "?latency=0"
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    raw = SAMPLE_REPLY.encode("ASCII")
+    print("Response parsing only:")
+    for name, function in (("strings", parse_strings), ("bytes", parse_bytes)):
+        print(f"  {name:<8}{cpu_per_call(function, raw, samples * 50) * 1e6:8.2f} us/reply")
+
+    controller = GalilController()
+    controller.connect(address, keepalive=False)
+    try:
+        print(f"Polling {', '.join(POLL_COMMANDS)} on {address}:")
+        for name, function in (("strings", poll_strings), ("typed", poll_typed)):
+            function(controller)  # warm up caches
+            cpu = cpu_per_call(function, controller, samples)
+            print(f"  {name:<8}{cpu * 1e6:8.1f} us CPU/sample")
+    finally:
+        controller.disconnect()
+
+
+if __name__ == "__main__":
+    main()
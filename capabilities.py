@@ -0,0 +1,147 @@
+"""
+Command-syntax capabilities, keyed by controller firmware.
+
+Older builds of the app tried several spellings of PA/BG, DP/RZ/ZP and IP on
+every call. Here each operation lists its candidate command templates in order
+of preference; the first time an operation runs against a firmware version the
+candidates are tried with the real arguments, and the one that worked is saved
+to CAPABILITIES_PATH. Later calls (and later connections to the same firmware)
+go straight to the resolved template.
+"""
+import json
+import logging
+import threading
+
+from constants import CAPABILITIES_PATH
+from galil_interface import BatchCommandError
+
+logger = logging.getLogger(__name__)
+
+# Operation -> candidate templates. Each candidate is a tuple of commands sent
+# together; fields are filled in with str.format().
+COMMAND_VARIANTS = {
+    "move_absolute": (
+        ("PA {axis}={position}", "BG {axis}"),
+        ("PA{axis}={position}", "BG{axis}"),
+        ("PA {axis} {position}", "BG {axis}"),
+    ),
+    "zero_position": (
+        ("DP{axis}=0",),   # Define position to 0 (most reliable)
+        ("DP {axis}=0",),
+        ("RZ{axis}",),     # Reset zero position
+        ("RZ {axis}",),
+        ("ZP{axis}=0",),   # Zero position
+        ("ZP {axis}=0",),
+    ),
+    "set_ip": (
+        ("IP {ip_commas}",),  # Documented form: IP 192,168,0,1
+        ("IP{ip}",),
+        ("IP {ip}",),
+        ("IP={ip}",),
+    ),
+}
+
+# TC error codes that mean the controller did not understand the syntax, as
+# opposed to rejecting the command in the current state (e.g. motor off)
+SYNTAX_ERROR_CODES = (1, 4, 18)
+
+
+def _error_code(error):
+    """TC code from a BatchCommandError reason such as '1 Unrecognized command', or None."""
+    try:
+        return int(str(error.reason).split()[0]) or None
+    except (IndexError, ValueError):
+        return None
+
+
+class CommandCapabilities:
+    """Resolved command templates for the controller behind a GalilController."""
+
+    def __init__(self, controller, path=CAPABILITIES_PATH):
+        self.controller = controller
+        self.path = path
+        self._firmware = None
+        self._lock = threading.Lock()
+        self._known = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        try:
+            with open(self.path, "w") as f:
+                json.dump(self._known, f, indent=4)
+        except OSError as e:
+            logger.warning(f"Could not save command capabilities: {e}")
+
+    @property
+    def firmware(self):
+        """Firmware string used as the cache key ("" if the controller won't say)."""
+        if self._firmware is None:
+            firmware = ""
+            for query in ("MG _FW", "MG _ID"):
+                try:
+                    firmware = self.controller.send_command(query).strip()
+                except Exception:
+                    continue
+                if firmware:
+                    break
+            self._firmware = firmware
+        return self._firmware
+
+    def templates(self, operation):
+        """The resolved template tuple for an operation, or None if not yet known."""
+        saved = self._known.get(self.firmware, {}).get(operation)
+        if saved is None:
+            return None
+        saved = tuple(saved)
+        # Ignore entries that no longer match a candidate
+        return saved if saved in COMMAND_VARIANTS[operation] else None
+
+    def table(self):
+        """Every resolved operation for this firmware, as {operation: templates}."""
+        return {operation: self.templates(operation) for operation in COMMAND_VARIANTS
+                if self.templates(operation) is not None}
+
+    def run(self, operation, **fields):
+        """
+        Send an operation with the given fields, e.g. run("move_absolute", axis="A",
+        position=1000). Returns the commands that were sent. Errors that are not
+        about syntax (motor off, axis moving, ...) are raised without trying other
+        spellings.
+        """
+        candidates = COMMAND_VARIANTS[operation]
+        resolved = self.templates(operation)
+        if resolved is not None:
+            # Known good first; fall back to the rest if the firmware changed under us
+            candidates = (resolved,) + tuple(c for c in candidates if c != resolved)
+
+        last_error = None
+        for templates in candidates:
+            commands = [template.format(**fields) for template in templates]
+            try:
+                self.controller.send_batch(commands)
+            except BatchCommandError as e:
+                code = _error_code(e)
+                if code is not None and code not in SYNTAX_ERROR_CODES:
+                    raise
+                logger.debug(f"{operation}: {commands} not accepted ({e.reason})")
+                last_error = e
+                continue
+            if templates != resolved:
+                self._record(operation, templates)
+            return commands
+        raise last_error
+
+    def _record(self, operation, templates):
+        firmware = self.firmware
+        if not firmware:
+            return
+        logger.info(f"[CAPS] {firmware}: {operation} uses {'; '.join(templates)}")
+        with self._lock:
+            self._known.setdefault(firmware, {})[operation] = list(templates)
+            self._save()
@@ -0,0 +1,149 @@
+"""
+Command latency and throughput statistics.
+
+Each opcode gets a fixed-bucket, HDR-style latency histogram: values are kept
+in microseconds with 16 sub-buckets per power of two, so any recorded latency
+lands in a bucket within ~6% of its true value and recording is a couple of
+integer operations and a list increment. Transaction times are recorded by
+GalilController on its I/O thread; the "queue" entry holds the time work spent
+waiting for that thread, which separates our own backlog from controller and
+network time.
+"""
+import threading
+import time
+
+QUEUE_WAIT = "queue"  # pseudo-opcode for time spent waiting for the I/O thread
+BATCH = "batch"       # pseudo-opcode for semicolon-packed send_batch() lines
+
+_SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS  # values below this are exact
+_HALF = _SUB_BUCKETS >> 1
+_MAX_MICROSECONDS = (1 << 27) - 1  # ~134 s; slower transactions are clamped
+_BUCKETS = _SUB_BUCKETS + (_MAX_MICROSECONDS.bit_length() - _SUB_BUCKET_BITS) * _HALF
+
+# Throughput is averaged over this many whole seconds
+RATE_WINDOW = 10
+
+
+def _bucket_index(us):
+    if us < _SUB_BUCKETS:
+        return us
+    shift = us.bit_length() - _SUB_BUCKET_BITS
+    return _SUB_BUCKETS + (shift - 1) * _HALF + (us >> shift) - _HALF
+
+
+def _bucket_upper(index):
+    """Largest microsecond value that falls in a bucket."""
+    if index < _SUB_BUCKETS:
+        return index
+    shift = (index - _SUB_BUCKETS) // _HALF + 1
+    mantissa = _HALF + (index - _SUB_BUCKETS) % _HALF
+    return ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0.0  # seconds
+        self.max = 0.0    # seconds
+
+    def record(self, seconds):
+        us = int(seconds * 1e6)
+        self.counts[_bucket_index(min(max(us, 0), _MAX_MICROSECONDS))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Latency in seconds at or below which p percent of samples fall."""
+        if not self.count:
+            return 0.0
+        target = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(_bucket_upper(index) / 1e6, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class CommandStats:
+    """Per-opcode latency histograms, error counts and overall throughput."""
+
+    def __init__(self):
+        # Recording happens on the I/O thread, reports are read from the Tk thread
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.errors = {}
+            self.started = time.monotonic()
+            self._rate_counts = [0] * RATE_WINDOW
+            self._rate_seconds = [0] * RATE_WINDOW
+
+    def record(self, opcode, seconds, error=False):
+        with self._lock:
+            histogram = self.histograms.get(opcode)
+            if histogram is None:
+                histogram = self.histograms[opcode] = LatencyHistogram()
+            histogram.record(seconds)
+            if error:
+                self.errors[opcode] = self.errors.get(opcode, 0) + 1
+            if opcode != QUEUE_WAIT:
+                self._count_rate()
+
+    def _count_rate(self):
+        second = int(time.monotonic())
+        slot = second % RATE_WINDOW
+        if self._rate_seconds[slot] != second:
+            self._rate_seconds[slot] = second
+            self._rate_counts[slot] = 0
+        self._rate_counts[slot] += 1
+
+    def commands_per_second(self):
+        """Transactions per second over the last RATE_WINDOW whole seconds."""
+        now = int(time.monotonic())
+        with self._lock:
+            total = sum(n for second, n in zip(self._rate_seconds, self._rate_counts)
+                        if now - RATE_WINDOW <= second < now)
+        window = min(RATE_WINDOW, max(1, now - int(self.started)))
+        return total / window
+
+    def snapshot(self):
+        """{opcode: {count, errors, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}}."""
+        result = {}
+        with self._lock:
+            for opcode, histogram in sorted(self.histograms.items()):
+                result[opcode] = self._summary(histogram, self.errors.get(opcode, 0))
+        return result
+
+    @staticmethod
+    def _summary(histogram, errors):
+        return {
+            "count": histogram.count,
+            "errors": errors,
+            "mean_ms": histogram.mean * 1e3,
+            "p50_ms": histogram.percentile(50) * 1e3,
+            "p90_ms": histogram.percentile(90) * 1e3,
+            "p99_ms": histogram.percentile(99) * 1e3,
+            "max_ms": histogram.max * 1e3,
+        }
+
+    def format_report(self):
+        """Text table for the diagnostics panel."""
+        lines = [f"Commands/s: {self.commands_per_second():.1f}",
+                 f"{'Opcode':<7}{'Count':>8}{'Err':>6}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'Max ms':>9}"]
+        for opcode, s in self.snapshot().items():
+            lines.append(f"{opcode:<7}{s['count']:>8}{s['errors']:>6}{s['p50_ms']:>9.2f}"
+                         f"{s['p90_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['max_ms']:>9.2f}")
+        return "\n".join(lines)
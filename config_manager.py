@@ -17,10 +17,14 @@ default_config = {
             "dc": 2560000,
             "tl": 8.2,
             "clicks_per_turn": 64000,
-            "turns_per_mm": 0.2
+            "turns_per_mm": 0.2,
+            # Lost motion on reversal in counts, as suggested by the repeatability test
+            "backlash_compensation": 0
         }
         for axis in ("A", "B", "C", "D")
-    }
+    },
+    # Groups of axes (e.g. "AB") the automated test must not move at the same time
+    "exclusive_axis_groups": []
 }
 
 def load_config():
@@ -37,12 +41,18 @@ def load_config():
             for axis in ("A", "B", "C", "D"):
                 if axis not in config["axis_presets"]:
                     config["axis_presets"][axis] = default_config["axis_presets"][axis]
+                config["axis_presets"][axis].setdefault("backlash_compensation", 0)
+            config.setdefault("exclusive_axis_groups", [])
             return config
     except (json.JSONDecodeError, IOError):
         # If the file is unreadable or malformed, overwrite with defaults
         save_config(default_config)
         return default_config.copy()
 
+def apply_compensation(config, axis, backlash):
+    """Store a measured backlash compensation (counts) in an axis preset."""
+    config["axis_presets"][axis]["backlash_compensation"] = int(backlash)
+
 def save_config(config_data):
     # Ensure the folder is there, then write
     os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
@@ -2,6 +2,10 @@ import os
 
 # Paths
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
+CAPABILITIES_PATH = os.path.join(os.path.dirname(__file__), "capabilities.json")  # Command syntax per firmware
+TEST_PLANS_PATH = os.path.join(os.path.dirname(__file__), "test_plans.json")  # Automated test plans
+RESULTS_DB_PATH = os.path.join(os.path.dirname(__file__), "results.db")  # Automated test results
+SOAK_DIR = os.path.join(os.path.dirname(__file__), "soak")  # Raw soak test samples, rotated
 
 # Window Dimensions
 WINDOW_WIDTH = 1000
@@ -13,6 +17,9 @@ CANVAS_HEIGHT = 300
 ENCODER_CENTER = (CANVAS_WIDTH // 2, CANVAS_HEIGHT // 2)
 ENCODER_RADIUS = 100  # Radius of encoder visual
 
+# Strip chart below the gauges
+CHART_HEIGHT = 180
+
 # Defaults
 DEFAULT_JOG_SPEED = 5000     # Default jog speed if nothing is configured
 DEFAULT_AXIS = "A"           # Default axis selection
@@ -24,5 +31,8 @@ VALID_AXES = ["A", "B", "C", "D"]
 # Servo bitmasks
 SERVO_BITS = {"A": 1, "B": 2, "C": 4, "D": 8}
 
+# Simulator
+SIM_DEFAULT_ADDRESS = "sim://dmc4143"  # Enter as the IP address to use the in-process simulator
+
 # Status
 STATUS_DISCONNECTED = "Disconnected"
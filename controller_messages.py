@@ -0,0 +1,133 @@
+"""
+Unsolicited controller messages (GMessage) as typed events.
+
+Programs running on the controller print with MG; those lines arrive on a
+handle opened with "--subscribe MG" rather than as command responses. Lines
+are parsed into:
+
+  PositionReport  - "POS 100, 200, 300, 400" or "POS A=100 C=300"
+  ControllerError - "ERR 20" / "ERR 20 text", or a line starting with "?"
+  UserMessage     - anything else
+
+so a program can push positions or report failures instead of being polled.
+"""
+import queue
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, NamedTuple, Optional
+
+from data_record import RECORD_AXES
+
+_ERROR_RE = re.compile(r"^ERR(?:OR)?\s*(-?\d+)\s*(.*)$", re.IGNORECASE)
+_PAIR_RE = re.compile(r"^([A-H])\s*=\s*(-?\d+(?:\.\d*)?)$", re.IGNORECASE)
+
+
+class PositionReport(NamedTuple):
+    """Positions pushed by a controller program."""
+    positions: Dict[str, int]
+    text: str
+    timestamp: float  # time.monotonic() at receipt
+
+
+class ControllerError(NamedTuple):
+    """An error reported by the controller or a program."""
+    code: Optional[int]
+    text: str
+    timestamp: float
+
+
+class UserMessage(NamedTuple):
+    """Any other line printed by a controller program."""
+    text: str
+    timestamp: float
+
+
+def parse_message(line, timestamp=None):
+    """Turn one line of unsolicited output into an event."""
+    if timestamp is None:
+        timestamp = time.monotonic()
+    text = line.strip()
+    if text.startswith("?"):
+        return ControllerError(None, text, timestamp)
+    match = _ERROR_RE.match(text)
+    if match:
+        return ControllerError(int(match.group(1)), text, timestamp)
+    if text[:3].upper() == "POS":
+        positions = _parse_positions(text[3:])
+        if positions:
+            return PositionReport(positions, text, timestamp)
+    return UserMessage(text, timestamp)
+
+
+def _parse_positions(text):
+    fields = [f for f in re.split(r"[,\s]+", text.strip()) if f]
+    positions = {}
+    try:
+        if all("=" in f for f in fields):
+            for f in fields:
+                match = _PAIR_RE.match(f)
+                if not match:
+                    return None
+                positions[match.group(1).upper()] = int(float(match.group(2)))
+        else:
+            if len(fields) > len(RECORD_AXES):
+                return None
+            for axis, f in zip(RECORD_AXES, fields):
+                positions[axis] = int(float(f))
+    except ValueError:
+        return None
+    return positions
+
+
+class MessageParser:
+    """Reassembles lines from GMessage chunks, which need not end on a line break."""
+
+    def __init__(self):
+        self._partial = ""
+
+    def feed(self, text):
+        """Add received text and return the events for every completed line."""
+        timestamp = time.monotonic()
+        lines = (self._partial + text.replace("\r", "")).split("\n")
+        self._partial = lines.pop()
+        return [parse_message(line, timestamp) for line in lines if line.strip()]
+
+
+class MessageSubscription:
+    """
+    A bounded queue of events for one subscriber. When it is full the oldest
+    event is dropped (and counted in `dropped`), so a slow consumer never
+    blocks the pump or grows without limit.
+    """
+
+    def __init__(self, maxsize=256, kinds=None):
+        self.kinds = tuple(kinds) if kinds else None
+        self.dropped = 0
+        self._events = deque(maxlen=maxsize)
+        self._ready = threading.Condition()
+
+    def wants(self, event):
+        return self.kinds is None or isinstance(event, self.kinds)
+
+    def put(self, event):
+        with self._ready:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Next event; raises queue.Empty if none arrives within timeout."""
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._events, timeout):
+                raise queue.Empty
+            return self._events.popleft()
+
+    def drain(self):
+        """All queued events, oldest first, without blocking."""
+        with self._ready:
+            events = list(self._events)
+            self._events.clear()
+            return events
@@ -0,0 +1,109 @@
+"""
+Binary data record (QR / DR) layout for the DMC-4143.
+
+A single record carries the status of all four axes, so one QR transaction
+(or one pushed DR record) replaces a TP, TE, TV, TT and TS round trip each.
+The layout is the DMC-40x0 record for a four-axis controller; all fields are
+little-endian.
+"""
+import struct
+from typing import NamedTuple, Tuple
+
+RECORD_AXES = ("A", "B", "C", "D")
+
+# GRecord methods, matching gclib's G_QR and G_DR
+QR_METHOD = 0
+DR_METHOD = 1
+
+# Header: axis-present flags, reserved byte, record size in bytes
+_HEADER_FORMAT = "BBH"
+# General block: sample number, 10 input bytes, 10 output bytes, error code,
+# thread status, amplifier status, contour segment count, contour buffer
+# space, then the S and T coordinate planes (segment count, move status,
+# distance, buffer space)
+_GENERAL_FORMAT = "H10B10BBBLLH" + "HHlH" * 2
+# Per axis: status, switches, stop code, reference position, motor position,
+# position error, auxiliary position, velocity, torque, analog input, hall
+# input, reserved, user variable ZA
+_AXIS_FORMAT = "HBBllllllhBBl"
+
+_RECORD = struct.Struct("<" + _HEADER_FORMAT + _GENERAL_FORMAT + _AXIS_FORMAT * len(RECORD_AXES))
+RECORD_SIZE = _RECORD.size
+
+_GENERAL_FIELDS = len(struct.unpack("<" + _HEADER_FORMAT + _GENERAL_FORMAT,
+                                    bytes(struct.calcsize("<" + _HEADER_FORMAT + _GENERAL_FORMAT))))
+_AXIS_FIELDS = len(struct.unpack("<" + _AXIS_FORMAT, bytes(struct.calcsize("<" + _AXIS_FORMAT))))
+_SAMPLE_NUMBER_FIELD = len(_HEADER_FORMAT)
+_ERROR_CODE_FIELD = _SAMPLE_NUMBER_FIELD + 1 + 10 + 10
+
+# Torque is reported as a 16-bit DAC value spanning +/-9.998 V
+_TORQUE_SCALE = 9.998 / 32767
+
+# Axis status word bits
+STATUS_MOVING = 0x8000
+STATUS_POSITION_MODE = 0x4000
+STATUS_NEGATIVE = 0x0080
+STATUS_SLEWING = 0x0020
+STATUS_STOPPING = 0x0010
+STATUS_MOTOR_OFF = 0x0001
+
+
+class AxisRecord(NamedTuple):
+    """One axis of a data record."""
+    position: int
+    error: int
+    velocity: int
+    torque: float  # volts
+    reference: int
+    status: int
+    switches: int
+    stop_code: int
+
+    @property
+    def moving(self) -> bool:
+        return bool(self.status & STATUS_MOVING)
+
+    @property
+    def motor_off(self) -> bool:
+        return bool(self.status & STATUS_MOTOR_OFF)
+
+
+class DataRecord(NamedTuple):
+    """A decoded data record for all axes."""
+    sample_number: int
+    error_code: int
+    axes: Tuple[AxisRecord, ...]
+
+    def axis(self, axis: str) -> AxisRecord:
+        return self.axes[RECORD_AXES.index(axis)]
+
+    @property
+    def positions(self) -> Tuple[int, ...]:
+        return tuple(a.position for a in self.axes)
+
+
+def parse_data_record(buffer) -> DataRecord:
+    """Decode a raw QR/DR record (bytes or ctypes buffer) into a DataRecord."""
+    fields = _RECORD.unpack_from(buffer)
+    axes = []
+    for i in range(len(RECORD_AXES)):
+        (status, switches, stop_code, reference, position, error, _aux,
+         velocity, torque, _analog, _hall, _reserved, _za) = \
+            fields[_GENERAL_FIELDS + i * _AXIS_FIELDS:_GENERAL_FIELDS + (i + 1) * _AXIS_FIELDS]
+        axes.append(AxisRecord(position, error, velocity, torque * _TORQUE_SCALE,
+                               reference, status, switches, stop_code))
+    return DataRecord(fields[_SAMPLE_NUMBER_FIELD], fields[_ERROR_CODE_FIELD], tuple(axes))
+
+
+def pack_data_record(sample_number, error_code, axes) -> bytes:
+    """
+    Build a raw record. axes is a sequence of AxisRecord, one per RECORD_AXES.
+    Used by the simulator to serve QR/DR exactly as the controller would.
+    """
+    general = [sample_number & 0xFFFF] + [0] * 10 + [0] * 10 + [error_code, 0, 0, 0, 0] + [0, 0, 0, 0] * 2
+    values = [0x80 | ((1 << len(RECORD_AXES)) - 1), 0, RECORD_SIZE] + general
+    for a in axes:
+        torque = max(-32767, min(32767, int(round(a.torque / _TORQUE_SCALE))))
+        values += [a.status, a.switches, a.stop_code, a.reference, a.position,
+                   a.error, 0, a.velocity, torque, 0, 0, 0, 0]
+    return _RECORD.pack(*values)
@@ -47,14 +47,14 @@ def get_diagnostics(controller):
     for axis in ("A", "B", "C", "D"):
         # 1) Position on this axis
         try:
-            pos = controller.send_command(f"TP {axis}").strip()
+            pos = controller.command_int(f"TP {axis}")
             lines.append(f"Position {axis}: {pos}")
         except Exception as e:
             lines.append(f"Position {axis}: error {e}")
 
         # 2) TS bit (motion status) on this axis
         try:
-            ts = controller.send_command(f"MG _TS{axis}").strip()
+            ts = controller.command_int(f"MG _TS{axis}")
             lines.append(f"TS{axis}: {ts}")
         except Exception as e:
             lines.append(f"TS{axis}: error {e}")
@@ -1,39 +1,104 @@
 import math
 import logging
+from collections import deque
+
+from constants import DEFAULT_CLICKS_PER_TURN
 
 logger = logging.getLogger(__name__)
 
+TRAIL_LENGTH = 24  # trail dots per axis, created once and reused
+RING_SPACING = 18  # pixels between the circles of successive axes
+AXIS_COLORS = {"A": "#3399ff", "B": "#33ff99", "C": "#ff9933", "D": "#ff33ff"}
+
+
 class EncoderOverlay:
-    def __init__(self, canvas, controller, center=(150, 150), radius=100, axis="A", clicks_per_turn=64000):
+    """
+    Encoder angle of several axes as dots on concentric circles, with the
+    multi-turn count and direction of travel and a trail of recent
+    angles.
+
+    Positions come from a shared sample source, such as a PositionSampler,
+    whose latest() returns (timestamp, {axis: position}); the overlay sends
+    no commands of its own. clicks_per_turn is one count for every axis or
+    {axis: count}, e.g. from the axis presets. Every canvas item is created once and then moved
+    with coords(); the trail reuses a fixed pool of items.
+    """
+
+    def __init__(self, canvas, source, center=(150, 150), radius=100, axes="A", clicks_per_turn=DEFAULT_CLICKS_PER_TURN,
+                 trail_length=TRAIL_LENGTH):
         self.canvas = canvas
-        self.controller = controller
+        self.source = source
         self.center = center
         self.radius = radius
-        self.axis = axis
-        self.clicks_per_turn = clicks_per_turn
-        self.dot = None
+        self.axes = tuple(axes)
+        if not isinstance(clicks_per_turn, dict):
+            clicks_per_turn = dict.fromkeys(self.axes, clicks_per_turn)
+        self.clicks_per_turn = {axis: int(clicks_per_turn.get(axis) or DEFAULT_CLICKS_PER_TURN)
+                                for axis in self.axes}
+        self._last_sample = None  # timestamp of the sample last drawn
+        self._items = {}
+        for index, axis in enumerate(self.axes):
+            self._items[axis] = self._create_axis(axis, index, trail_length)
+
+    def _create_axis(self, axis, index, trail_length):
+        ring = self.radius - index * RING_SPACING
+        cx, cy = self.center
+        color = AXIS_COLORS.get(axis, "red")
+        self.canvas.create_oval(cx - ring, cy - ring, cx + ring, cy + ring, outline="#404040")
+        # Trail dots start hidden and are handed out oldest first
+        trail = deque(self.canvas.create_oval(0, 0, 0, 0, fill=color, outline="", state="hidden")
+                      for _ in range(trail_length))
+        dot = self.canvas.create_oval(0, 0, 0, 0, fill=color, outline="", state="hidden")
+        label = self.canvas.create_text(cx, cy + (index - len(self.axes) / 2.0 + 0.5) * 14,
+                                        text="", fill=color, font=("Arial", 9, "bold"))
+        return {"ring": ring, "dot": dot, "label": label, "trail": trail, "hidden": trail_length,
+                "point": None, "position": None, "direction": "", "text": ""}
 
     def update(self):
-        # Only try to read position if we’re actually connected
+        """Redraw from the source's latest sample; does nothing if there is no new one."""
         try:
-            # TP <axis> needs a space
-            pos_str = self.controller.send_command(f"TP {self.axis}")
-            pos = int(pos_str.strip())
-            angle = (pos % self.clicks_per_turn) / self.clicks_per_turn * 2 * math.pi
-
-            x = self.center[0] + self.radius * math.cos(angle)
-            y = self.center[1] + self.radius * math.sin(angle)
-
-            if self.dot:
-                self.canvas.delete(self.dot)
-
-            self.dot = self.canvas.create_oval(
-                x - 5, y - 5, x + 5, y + 5,
-                fill="red", outline=""
-            )
-        except (ConnectionError, ValueError, AttributeError):
-            # Controller not connected yet, or bad parse—just skip drawing
-            return
+            latest = self.source.latest()
         except Exception as e:
-            # Other errors—log but don’t spam
             logger.debug(f"EncoderOverlay.update error: {e}")
+            return
+        if latest is None or latest[0] == self._last_sample:
+            return
+        self._last_sample, positions = latest
+        for axis in self.axes:
+            if axis in positions:
+                self._update_axis(axis, positions[axis])
+
+    def _update_axis(self, axis, position):
+        items = self._items[axis]
+        clicks_per_turn = self.clicks_per_turn[axis]
+        turns, clicks = divmod(position, clicks_per_turn)
+        angle = clicks / clicks_per_turn * 2 * math.pi
+        x = self.center[0] + items["ring"] * math.cos(angle)
+        y = self.center[1] + items["ring"] * math.sin(angle)
+
+        previous = items["point"]
+        if previous is None or abs(x - previous[0]) >= 1 or abs(y - previous[1]) >= 1:
+            if previous is not None:
+                # The oldest trail dot moves to where the axis just was
+                trail = items["trail"]
+                if trail:
+                    item = trail.popleft()
+                    self.canvas.coords(item, previous[0] - 2, previous[1] - 2, previous[0] + 2, previous[1] + 2)
+                    if items["hidden"]:
+                        self.canvas.itemconfig(item, state="normal")
+                        items["hidden"] -= 1
+                    trail.append(item)
+            self.canvas.coords(items["dot"], x - 5, y - 5, x + 5, y + 5)
+            if previous is None:
+                self.canvas.itemconfig(items["dot"], state="normal")
+            items["point"] = (x, y)
+
+        # The direction of the last change stays shown until the position changes again
+        last = items["position"]
+        if last is not None and position != last:
+            items["direction"] = "+" if position > last else "-"
+        items["position"] = position
+        text = f"{axis} {turns:+d} turns {items['direction']}".rstrip()
+        if text != items["text"]:
+            self.canvas.itemconfig(items["label"], text=text)
+            items["text"] = text
@@ -1,19 +1,851 @@
-import gclib
+import itertools
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from array import array
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from command_stats import BATCH, QUEUE_WAIT, CommandStats
+from controller_messages import MessageParser, MessageSubscription
+from data_record import DR_METHOD, QR_METHOD, parse_data_record
+from simulator import SIM_SCHEME, SimulatedController
+
+logger = logging.getLogger(__name__)
+
+# A streamed record older than this is considered stale
+RECORD_MAX_AGE = 0.5  # seconds
+
+# A record stream is switched off (DR 0) once every axis has been still this
+# long; the next motion start or a record showing motion switches it back on
+RECORD_STREAM_IDLE = 0.5  # seconds
+
+# Default limit for wait_motion_complete()
+MOTION_TIMEOUT = 30.0  # seconds
+
+# GMessage read timeout on the message handle; bounds how long stopping the pump takes
+MESSAGE_READ_TIMEOUT = 200  # ms
+
+# Elements per array transfer work item, so ST can get in between chunks
+ARRAY_CHUNK = 20000
+
+# Keepalive and reconnect
+KEEPALIVE_INTERVAL = 1.0     # seconds without traffic before a keepalive is sent
+KEEPALIVE_TIMEOUT = 2.0      # an unanswered keepalive after this long means the link is dead
+RECONNECT_BASE_DELAY = 0.25  # seconds before the first attempt, doubled per failure
+RECONNECT_MAX_DELAY = 10.0   # seconds
+
+# I/O queue priorities, lower runs first. Work of equal priority runs in
+# submission order, so a caller that needs ordering between its own
+# asynchronous commands should submit them at the same priority.
+PRIORITY_STOP = 0     # ST / AB / HX: jump ahead of everything queued
+PRIORITY_NORMAL = 10  # motion and configuration
+PRIORITY_POLL = 20    # status polling that can wait
+
+_STOP_OPCODES = ("ST", "AB", "HX")
+_MOTION_START_OPCODES = ("BG", "XQ")  # reported to motion listeners
+
+# Longest semicolon-joined line send_batch() will send in one transaction
+BATCH_LINE_LIMIT = 80
+
+# Axis parameters mirrored in the shadow cache (see apply_parameters)
+SHADOWED_PARAMETERS = ("KP", "KI", "KD", "SP", "AC", "DC", "TL")
+_ASSIGNMENT_RE = re.compile(r"^([A-Z]{2})([A-H])=([-+]?(?:\d+\.?\d*|\.\d+))$")
+
+def command_priority(command):
+    """Default queue priority for a command string."""
+    return PRIORITY_STOP if command.strip()[:2].upper() in _STOP_OPCODES else PRIORITY_NORMAL
+
+class BatchCommandError(RuntimeError):
+    """
+    A command in a send_batch() call was rejected. The controller stops executing
+    a line at the first '?', so nothing after `index` was run; `responses` holds
+    the responses of the commands that did succeed.
+    """
+
+    def __init__(self, index, command, responses, reason=None):
+        message = f"Command {index + 1} ({command}) failed: question mark returned by controller"
+        if reason:
+            message += f" - {reason}"
+        super().__init__(message)
+        self.index = index
+        self.command = command
+        self.responses = responses
+        self.reason = reason
+
+def _pack_commands(commands, line_limit):
+    """Group commands into lists whose semicolon-joined length fits line_limit."""
+    packets, current, length = [], [], 0
+    for command in commands:
+        if current and length + 1 + len(command) > line_limit:
+            packets.append(current)
+            current = []
+        length = length + 1 + len(command) if current else len(command)
+        current.append(command)
+    if current:
+        packets.append(current)
+    return packets
 
 class GalilController:
+    """
+    Connection to a controller. All traffic on the primary handle runs on a
+    single I/O worker thread fed from a priority queue, so the gclib handle
+    and its response buffer are never used from two threads at once.
+    """
+
     def __init__(self):
         self.g = None
+        self._address = None
+        self._record_stream = None
+        self._latest_record = None  # (monotonic receive time, DataRecord)
+        self._record_refresh = None  # pending asynchronous QR future
+        self._queue = None
+        self._io_thread = None
+        self._sequence = itertools.count()
+        self._shadow = {}  # (opcode, axis) -> last value the controller accepted
+        self._motion_waiter = None  # (handle, thread, stop event, request queue)
+        self._motion_futures = {}  # axis -> pending motion-complete Future
+        self._motion_lock = threading.Lock()
+        self._message_pump = None  # (handle, thread, stop event)
+        self._subscriptions = []
+        self._record_stream_args = None  # (period_ms, callback) to restart after a reconnect
+        self._record_stream_paused = False  # pause_record_stream() is in effect
+        self._session_lock = threading.RLock()
+        self._keepalive = None  # (thread, stop event)
+        self._last_io = 0.0  # monotonic time of the last completed I/O
+        self._busy_since = None  # monotonic start of the work the I/O thread is running, if any
+        self._connection_listeners = []
+        self._motion_listeners = []
+        self.command_stats = CommandStats()  # per-opcode latency, errors and throughput
+
+    @property
+    def address(self):
+        """Address of the current (or last) connection."""
+        return self._address
+
+    def _open_handle(self, address):
+        """Open a new connection handle to the given address."""
+        if address.startswith(SIM_SCHEME):
+            handle = SimulatedController()
+        else:
+            # Imported lazily so the simulator works without the gclib libraries
+            import gclib
+            handle = gclib.py()
+        handle.GOpen(f"{address}")
+        return handle
+
+    def connect(self, address, keepalive=True):
+        """
+        Open the controller. With keepalive, an idle link is checked every
+        KEEPALIVE_INTERVAL and a dead one is reopened automatically.
+        """
+        if self.g or self._keepalive:
+            self.disconnect()
+        with self._session_lock:
+            self._open_session(address)
+            self.invalidate_shadow()
+            if keepalive:
+                stop_event = threading.Event()
+                thread = threading.Thread(target=self._keepalive_loop, args=(stop_event,),
+                                          name="galil-keepalive", daemon=True)
+                self._keepalive = (thread, stop_event)
+                thread.start()
+
+    def _open_session(self, address):
+        handle = self._open_handle(address)
+        self.g = handle
+        self._address = address
+        self._last_io = time.monotonic()
+        self._queue = queue.PriorityQueue()
+        self._io_thread = threading.Thread(target=self._io_loop, args=(self._queue, handle),
+                                           name="galil-io", daemon=True)
+        self._io_thread.start()
+
+    def _close_session(self, io_timeout=5.0):
+        self.stop_record_stream()
+        self.stop_message_pump()
+        self._stop_motion_waiter()
+        handle, self.g = self.g, None
+        if not self._stop_io_thread(io_timeout):
+            # The I/O thread is still inside a call on this handle; closing it
+            # underneath would be unsafe, so leave it to be collected
+            return
+        if handle:
+            try:
+                handle.GClose()
+            except Exception as e:
+                logger.debug(f"Error closing controller handle: {e}")
+
+    # I/O worker ----------------------------------------------------------
+
+    def _io_loop(self, work_queue, handle):
+        while True:
+            _, _, enqueued, work, future = work_queue.get()
+            if work is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.command_stats.record(QUEUE_WAIT, time.perf_counter() - enqueued)
+            self._busy_since = time.monotonic()
+            try:
+                result = work(handle)
+            except BaseException as e:
+                self._busy_since = None
+                future.set_exception(e)
+            else:
+                self._last_io = time.monotonic()
+                self._busy_since = None
+                future.set_result(result)
+
+    def submit(self, work, priority=PRIORITY_NORMAL):
+        """
+        Queue work(handle) to run on the I/O thread and return a Future for its result.
+        """
+        # One read: _stop_io_thread() may clear the queue at any moment
+        work_queue = self._queue
+        if not self.g or work_queue is None:
+            raise ConnectionError("Controller not connected.")
+        future = Future()
+        work_queue.put((priority, next(self._sequence), time.perf_counter(), work, future))
+        return future
+
+    def submit_command(self, command, priority=None):
+        """Queue a command and return a Future for its response. ST/AB default to PRIORITY_STOP."""
+        if priority is None:
+            priority = command_priority(command)
+        return self.submit(lambda g: self._command(g, command), priority)
+
+    def _call(self, work, priority, timeout=None):
+        """Run work on the I/O thread and wait for the result."""
+        if threading.current_thread() is self._io_thread:
+            # Already on the I/O thread (e.g. inside submitted work): run inline
+            return work(self.g)
+        return self.submit(work, priority).result(timeout)
+
+    def send_command(self, command, timeout=None):
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+        return self._call(lambda g: self._command(g, command), command_priority(command), timeout)
+
+    def _command(self, g, command):
+        response = self._transaction(command.strip()[:2].upper(), g.GCommand, command)
+        self._track(command)
+        return response
+
+    # Typed queries -------------------------------------------------------
+    # Polling fast path: the reply stays as bytes (see GCommandBytes) and is
+    # parsed straight to numbers. For queries only; nothing is shadow-tracked.
+
+    def command_int(self, command, priority=PRIORITY_NORMAL, timeout=None):
+        """Send a query with one numeric reply (e.g. "TPA", "MG _TSA") and return it as an int."""
+        return int(float(self._query(command, priority, timeout)))
+
+    def command_float(self, command, priority=PRIORITY_NORMAL, timeout=None):
+        """Send a query with one numeric reply and return it as a float."""
+        return float(self._query(command, priority, timeout))
+
+    def command_vector(self, command, convert=float, priority=PRIORITY_NORMAL, timeout=None):
+        """
+        Send a query with a comma-separated reply (e.g. "TP", "TE") and return a
+        list of its values, each passed through convert (float, or int for counts).
+        """
+        return [convert(value) for value in self._query(command, priority, timeout).split(b",")]
+
+    def _query(self, command, priority, timeout):
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+        return self._call(
+            lambda g: self._transaction(command.strip()[:2].upper(), g.GCommandBytes, command),
+            priority, timeout)
+
+    def _transaction(self, opcode, call, *args):
+        """Make one gclib call, recording its latency under opcode."""
+        start = time.perf_counter()
+        try:
+            result = call(*args)
+        except Exception:
+            self.command_stats.record(opcode, time.perf_counter() - start, error=True)
+            raise
+        self.command_stats.record(opcode, time.perf_counter() - start)
+        return result
+
+    def send_batch(self, commands, priority=PRIORITY_NORMAL, line_limit=BATCH_LINE_LIMIT):
+        """
+        Send commands packed into as few semicolon-joined lines as fit line_limit
+        and return one trimmed response per command ("" for commands without data).
+        The whole batch runs as one unit on the I/O thread, in order. Commands whose
+        response may itself contain ':' (e.g. MG of a string) should not be batched.
+        Raises BatchCommandError naming the first command that was rejected.
+        """
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+        commands = [command.strip() for command in commands]
+        return self._call(lambda g: self._batch(g, commands, line_limit), priority)
+
+    def _batch(self, g, commands, line_limit=BATCH_LINE_LIMIT):
+        responses = []
+        for packet in _pack_commands(commands, line_limit):
+            start = time.perf_counter()
+            parts = g.GCommandRaw(";".join(packet)).split(":")
+            failed = parts[-1].strip().endswith("?")
+            self.command_stats.record(BATCH, time.perf_counter() - start, error=failed)
+            # Every completed command contributes one colon
+            for command, part in zip(packet, parts[:-1]):
+                self._track(command)
+                responses.append(part.strip())
+            if failed:
+                index = len(responses)
+                try:
+                    reason = self._command(g, "TC1")
+                except Exception:
+                    reason = None
+                raise BatchCommandError(index, commands[index], responses, reason)
+        return responses
+
+    # Shadow parameters ---------------------------------------------------
+
+    def apply_parameters(self, axis_parameters, priority=PRIORITY_NORMAL):
+        """
+        Write axis parameters, skipping values the controller already holds.
+        axis_parameters maps axis -> {opcode: value}, e.g. {"A": {"KP": 6.0}}.
+        Values are compared against the shadow of what this connection last
+        wrote; anything not in the shadow is sent. Returns the commands sent.
+        """
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+
+        def work(g):
+            commands = []
+            for axis, parameters in axis_parameters.items():
+                for opcode, value in parameters.items():
+                    if self._shadow.get((opcode, axis)) != float(value):
+                        commands.append(f"{opcode}{axis}={value}")
+            if commands:
+                self._batch(g, commands)
+            return commands
+
+        return self._call(work, priority)
+
+    def invalidate_shadow(self, axis=None):
+        """
+        Forget shadowed parameters for one axis, or all of them. Call this when
+        something other than this connection may have changed the controller.
+        """
+        if axis is None:
+            self._shadow.clear()
+            return
+        for key in [key for key in self._shadow if key[1] == axis]:
+            self._shadow.pop(key, None)
+
+    def _track(self, command):
+        """Keep the shadow in step with a command the controller accepted."""
+        command = command.replace(" ", "").upper()
+        opcode = command[:2]
+        if opcode in _MOTION_START_OPCODES:
+            self._wake_record_stream()
+            for callback in list(self._motion_listeners):
+                try:
+                    callback()
+                except Exception as e:
+                    logger.debug(f"Motion listener error: {e}")
+        if opcode == "RS":
+            self.invalidate_shadow()
+        elif opcode in SHADOWED_PARAMETERS:
+            match = _ASSIGNMENT_RE.match(command)
+            if match:
+                self._shadow[(opcode, match.group(2))] = float(match.group(3))
+            elif not command.endswith("?"):
+                # Some other assignment form (e.g. "KP 1,2,3"): forget the opcode
+                for key in [key for key in self._shadow if key[0] == opcode]:
+                    self._shadow.pop(key, None)
+
+    # Arrays --------------------------------------------------------------
+
+    def upload_array(self, name, first=-1, last=-1, use_numpy=False, callback=None):
+        """
+        Upload a controller array as an array('d') (or numpy array if use_numpy).
+        Each ARRAY_CHUNK elements are a separate I/O work item, so stop commands
+        are not held up by a large transfer. With callback, chunks are passed to
+        callback(first_index, values) as they arrive and None is returned.
+        """
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+        if first < 0:
+            first = 0
+        if last < 0:
+            last = int(float(self.send_command(f"MG {name}[-1]"))) - 1
+        result = None
+        if callback is None:
+            if use_numpy:
+                import numpy
+                result = numpy.empty(last - first + 1)
+            else:
+                result = array('d')
+        for start in range(first, last + 1, ARRAY_CHUNK):
+            end = min(last, start + ARRAY_CHUNK - 1)
+            values = self._call(
+                lambda g, start=start, end=end: self._transaction(
+                    "QU", g.GArrayUploadTyped, name, start, end, use_numpy),
+                PRIORITY_NORMAL)
+            if callback is not None:
+                callback(start, values)
+            elif use_numpy:
+                result[start - first:end - first + 1] = values
+            else:
+                result.extend(values)
+        return result
 
-    def connect(self, address):
-        self.g = gclib.py()
-        self.g.GOpen(f"{address}")
+    def download_array(self, name, values, first=0, progress=None):
+        """
+        Download values into a dimensioned controller array starting at first.
+        Like upload_array, each ARRAY_CHUNK elements are a separate I/O work item;
+        progress(elements_sent, total) is called as the transfer advances.
+        """
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+        total = len(values)
+        for offset in range(0, total, ARRAY_CHUNK):
+            chunk = values[offset:offset + ARRAY_CHUNK]
+            sent_before = offset
+
+            def chunk_progress(sent, _chunk_total, sent_before=sent_before):
+                if progress is not None:
+                    progress(sent_before + sent, total)
+
+            self._call(
+                lambda g, chunk=chunk, start=first + offset, report=chunk_progress: self._transaction(
+                    "QD", g.GArrayDownload, name, start, start + len(chunk) - 1, chunk, report),
+                PRIORITY_NORMAL)
+
+    # Programs ------------------------------------------------------------
+
+    def download_program(self, program, preprocessor=""):
+        """Replace the controller's program buffer with DMC program text (run it with XQ)."""
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+        self._call(lambda g: self._transaction("DL", g.GProgramDownload, program, preprocessor),
+                   PRIORITY_NORMAL)
+
+    # Data records --------------------------------------------------------
+
+    def read_data_record(self, priority=PRIORITY_NORMAL):
+        """Fetch position, error, velocity, torque and status of every axis in one QR transaction."""
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+        record = self._call(self._read_record, priority)
+        self._note_record(record)
+        return record
+
+    def _note_record(self, record):
+        """Keep a polled record for latest_data_record(); motion in it restarts an idle stream."""
+        self._latest_record = (time.monotonic(), record)
+        if self._record_stream and any(axis.moving for axis in record.axes):
+            self._wake_record_stream()
+
+    def _read_record(self, g):
+        return parse_data_record(self._transaction("QR", g.GRecord, QR_METHOD))
+
+    def latest_data_record(self, max_age=RECORD_MAX_AGE):
+        """Return the newest record received within max_age seconds, or None. Never blocks."""
+        latest = self._latest_record
+        if latest is not None and time.monotonic() - latest[0] <= max_age:
+            return latest[1]
+        return None
+
+    def get_data_record(self, max_age=RECORD_MAX_AGE):
+        """Return the latest streamed record if it is fresh, otherwise read one with QR."""
+        record = self.latest_data_record(max_age)
+        if record is not None:
+            return record
+        return self.read_data_record()
+
+    def refresh_data_record(self):
+        """
+        Queue a low-priority QR whose result becomes latest_data_record().
+        Returns the pending Future; only one refresh is outstanding at a time.
+        """
+        pending = self._record_refresh
+        if pending is not None and not pending.done():
+            return pending
+
+        def work(g):
+            record = self._read_record(g)
+            self._note_record(record)
+            return record
+
+        self._record_refresh = self.submit(work, PRIORITY_POLL)
+        return self._record_refresh
+
+    def start_record_stream(self, period_ms=2, callback=None):
+        """
+        Have the controller push DR records every period_ms on a secondary handle.
+        The newest record is kept for get_data_record(); callback, if given, is
+        called with each DataRecord on the streaming thread.
+
+        The stream only runs while there is something to see: once every axis
+        has been still for RECORD_STREAM_IDLE it is switched off with DR 0, and
+        a motion start (BG/XQ) or a polled record showing motion switches it
+        back on. pause_record_stream() switches it off until resumed.
+        """
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+        self.stop_record_stream()
+
+        handle = self._open_handle(f"{self._address} --subscribe DR")
+        handle.GCommand(f"DR {int(period_ms)}")
+        self._record_stream_args = (period_ms, callback)
+        stop_event = threading.Event()
+        wake = threading.Event()  # set to switch an idle or paused stream back on
+
+        def pump():
+            streaming, still_since = True, None
+            while not stop_event.is_set():
+                idle = still_since is not None and time.monotonic() - still_since >= RECORD_STREAM_IDLE
+                if idle or self._record_stream_paused:
+                    if streaming:
+                        streaming = not self._set_record_period(handle, 0)
+                    wake.wait()
+                    wake.clear()
+                    still_since = None
+                    continue
+                if not streaming:
+                    streaming = self._set_record_period(handle, period_ms)
+                try:
+                    record = parse_data_record(handle.GRecord(DR_METHOD))
+                except Exception as e:
+                    logger.debug(f"Data record stream error: {e}")
+                    stop_event.wait(0.1)
+                    continue
+                self._latest_record = (time.monotonic(), record)
+                if any(axis.moving for axis in record.axes):
+                    still_since = None
+                elif still_since is None:
+                    still_since = time.monotonic()
+                if callback:
+                    try:
+                        callback(record)
+                    except Exception as e:
+                        logger.debug(f"Data record callback error: {e}")
+
+        thread = threading.Thread(target=pump, name="galil-dr-stream", daemon=True)
+        self._record_stream = (handle, thread, stop_event, wake)
+        thread.start()
+
+    @staticmethod
+    def _set_record_period(handle, period_ms):
+        """Send DR on the streaming handle; returns True if the controller accepted it."""
+        try:
+            handle.GCommand(f"DR {int(period_ms)}")
+            return True
+        except Exception as e:
+            logger.debug(f"Could not set data record period {period_ms}: {e}")
+            return False
+
+    def pause_record_stream(self):
+        """Switch pushed data records off (e.g. while no one can see them) until resume_record_stream()."""
+        self._record_stream_paused = True
+        self._wake_record_stream()
 
-    def send_command(self, command):
+    def resume_record_stream(self):
+        self._record_stream_paused = False
+        self._wake_record_stream()
+
+    def _wake_record_stream(self):
+        stream = self._record_stream
+        if stream:
+            stream[3].set()
+
+    def stop_record_stream(self):
+        """Stop pushed data records and close the streaming handle."""
+        if not self._record_stream:
+            return
+        handle, thread, stop_event, wake = self._record_stream
+        self._record_stream = None
+        stop_event.set()
+        wake.set()
+        thread.join(timeout=1.0)
+        try:
+            handle.GCommand("DR 0")
+            handle.GClose()
+        except Exception as e:
+            logger.debug(f"Error closing data record stream: {e}")
+        self._latest_record = None
+
+    # Unsolicited messages ------------------------------------------------
+
+    def start_message_pump(self):
+        """
+        Read unsolicited messages (MG output of controller programs) on a
+        dedicated handle and publish them as events to every subscription.
+        """
+        if not self.g:
+            raise ConnectionError("Controller not connected.")
+        self.stop_message_pump()
+
+        handle = self._open_handle(f"{self._address} --subscribe MG")
+        handle.GTimeout(MESSAGE_READ_TIMEOUT)
+        stop_event = threading.Event()
+        parser = MessageParser()
+
+        def pump():
+            while not stop_event.is_set():
+                try:
+                    text = handle.GMessage()
+                except Exception as e:
+                    # Read timeouts just mean nothing was sent
+                    if "timeout" not in str(e).lower() and "timed out" not in str(e).lower():
+                        logger.debug(f"Message pump error: {e}")
+                        stop_event.wait(0.1)
+                    continue
+                for event in parser.feed(text):
+                    self._publish(event)
+
+        thread = threading.Thread(target=pump, name="galil-messages", daemon=True)
+        self._message_pump = (handle, thread, stop_event)
+        thread.start()
+
+    def stop_message_pump(self):
+        """Stop reading unsolicited messages and close the message handle."""
+        if not self._message_pump:
+            return
+        handle, thread, stop_event = self._message_pump
+        self._message_pump = None
+        stop_event.set()
+        thread.join(timeout=1.0)
+        try:
+            handle.GClose()
+        except Exception as e:
+            logger.debug(f"Error closing message handle: {e}")
+
+    def subscribe_messages(self, maxsize=256, kinds=None):
+        """
+        Return a MessageSubscription receiving future events, optionally only of
+        the given types (e.g. (ControllerError,)). Subscriptions survive reconnects.
+        """
+        subscription = MessageSubscription(maxsize, kinds)
+        self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe_messages(self, subscription):
+        self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+
+    def _publish(self, event):
+        for subscription in self._subscriptions:
+            if subscription.wants(event):
+                subscription.put(event)
+
+    # Motion completion ---------------------------------------------------
+
+    def motion_complete(self, axis):
+        """
+        Return a Future resolved with a fresh DataRecord once the axis has stopped.
+        Waits run GMotionComplete on a secondary handle, so they neither poll on
+        nor hold up the primary I/O queue. Requests are served in order, one axis
+        at a time; a jogging axis only completes once it is stopped.
+        """
         if not self.g:
             raise ConnectionError("Controller not connected.")
-        return self.g.GCommand(command)
+        axis = axis.upper()
+        with self._motion_lock:
+            pending = self._motion_futures.get(axis)
+            if pending is not None and not pending.done():
+                return pending
+            if self._motion_waiter is None:
+                handle = self._open_handle(self._address)
+                requests = queue.Queue()
+                stop_event = threading.Event()
+                thread = threading.Thread(target=self._motion_loop, args=(handle, requests, stop_event),
+                                          name="galil-motion", daemon=True)
+                self._motion_waiter = (handle, thread, stop_event, requests)
+                thread.start()
+            future = Future()
+            self._motion_futures[axis] = future
+            self._motion_waiter[3].put((axis, future))
+            return future
+
+    def wait_motion_complete(self, axes, timeout=MOTION_TIMEOUT):
+        """
+        Block until every axis in axes (e.g. "A" or "ABD") has stopped and return
+        the DataRecord read after the last one did. Raises TimeoutError.
+        """
+        deadline = time.monotonic() + timeout
+        futures = [(axis, self.motion_complete(axis)) for axis in axes]
+        record = None
+        for axis, future in futures:
+            try:
+                record = future.result(max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                raise TimeoutError(f"Axis {axis} still moving after {timeout} s")
+        return record
+
+    def _motion_loop(self, handle, requests, stop_event):
+        while not stop_event.is_set():
+            try:
+                axis, future = requests.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if stop_event.is_set() or not future.set_running_or_notify_cancel():
+                continue
+            try:
+                handle.GMotionComplete(axis)
+                record = parse_data_record(handle.GRecord(QR_METHOD))
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(record)
+
+    def _stop_motion_waiter(self):
+        with self._motion_lock:
+            waiter, self._motion_waiter = self._motion_waiter, None
+            futures, self._motion_futures = self._motion_futures, {}
+        if waiter is None:
+            return
+        handle, thread, stop_event, _ = waiter
+        stop_event.set()
+        # A wait on a still-moving axis only returns once it stops; don't hang on it
+        thread.join(timeout=1.0)
+        try:
+            handle.GClose()
+        except Exception as e:
+            logger.debug(f"Error closing motion handle: {e}")
+        for future in futures.values():
+            # A running wait fails by itself once its handle is closed
+            if not future.running() and not future.done() and future.set_running_or_notify_cancel():
+                future.set_exception(ConnectionError("Controller disconnected."))
+
+    # Keepalive and reconnect ---------------------------------------------
+
+    def add_connection_listener(self, callback):
+        """
+        Call callback(connected) when the link is lost (False) and when it has
+        been re-established (True). Called on the keepalive thread.
+        """
+        self._connection_listeners.append(callback)
+
+    def add_motion_listener(self, callback):
+        """
+        Call callback() whenever a command that starts motion (BG, or XQ of a
+        program) has been accepted. Called on the I/O thread; keep it short.
+        """
+        self._motion_listeners.append(callback)
+
+    def _notify_connection(self, connected):
+        for callback in list(self._connection_listeners):
+            try:
+                callback(connected)
+            except Exception as e:
+                logger.debug(f"Connection listener error: {e}")
+
+    def _keepalive_loop(self, stop_event):
+        while not stop_event.wait(KEEPALIVE_INTERVAL / 2):
+            if time.monotonic() - self._last_io < KEEPALIVE_INTERVAL or self._busy_since is not None:
+                continue  # recent or running I/O shows the link is in use
+            try:
+                # NO is the controller's no-operation command
+                self._probe(self.submit_command("NO", PRIORITY_POLL))
+            except Exception as e:
+                if stop_event.is_set():
+                    break
+                if "question mark" in str(e):
+                    continue  # The controller answered, so the link is up
+                self._reconnect(stop_event, e)
+
+    def _probe(self, future):
+        """
+        Wait for the keepalive future. Time the I/O thread spends on other work
+        (a long array chunk, a program download) doesn't count: the probe is
+        only overdue once it has had KEEPALIVE_TIMEOUT of its own.
+        """
+        deadline = time.monotonic() + KEEPALIVE_TIMEOUT
+        while True:
+            try:
+                return future.result(max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                if future.running() or self._busy_since is None:
+                    raise TimeoutError(f"No keepalive reply within {KEEPALIVE_TIMEOUT} s")
+                # Still queued behind other work that is running: restart the clock
+                deadline = time.monotonic() + KEEPALIVE_TIMEOUT
+
+    def _reconnect(self, stop_event, reason):
+        """Reopen the link with capped exponential backoff and replay the shadow."""
+        with self._session_lock:
+            if stop_event.is_set():
+                return
+            address = self._address
+            stream_args = self._record_stream_args if self._record_stream else None
+            message_pump = self._message_pump is not None
+            shadow = dict(self._shadow)
+            logger.warning(f"Controller link lost ({reason}); reconnecting to {address}")
+            self._close_session(io_timeout=0.5)
+        self._notify_connection(False)
+
+        attempt = 0
+        while True:
+            delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt)
+            # Jitter keeps several stations from retrying in lockstep
+            if stop_event.wait(random.uniform(delay / 2, delay)):
+                return
+            attempt += 1
+            with self._session_lock:
+                if stop_event.is_set():
+                    return
+                try:
+                    self._open_session(address)
+                    self.invalidate_shadow()
+                    self._replay_shadow(shadow)
+                except Exception as e:
+                    logger.info(f"Reconnect attempt {attempt} to {address} failed: {e}")
+                    self._close_session(io_timeout=0.5)
+                    continue
+                try:
+                    if stream_args:
+                        self.start_record_stream(*stream_args)
+                    if message_pump:
+                        self.start_message_pump()
+                except Exception as e:
+                    logger.warning(f"Could not restart streams after reconnect: {e}")
+            logger.info(f"Reconnected to {address} after {attempt} attempt(s)")
+            self._notify_connection(True)
+            return
+
+    def _replay_shadow(self, shadow):
+        """Re-send the parameters this connection had written before the link dropped."""
+        parameters = {}
+        for (opcode, axis), value in shadow.items():
+            parameters.setdefault(axis, {})[opcode] = int(value) if value.is_integer() else value
+        if parameters:
+            self.apply_parameters(parameters)
 
     def disconnect(self):
-        if self.g:
-            self.g.GClose()
-            self.g = None
+        keepalive, self._keepalive = self._keepalive, None
+        if keepalive:
+            thread, stop_event = keepalive
+            stop_event.set()
+            if thread is not threading.current_thread():
+                thread.join(timeout=1.0)
+        with self._session_lock:
+            self._close_session()
+
+    def _stop_io_thread(self, timeout=5.0):
+        """Stop the I/O thread, failing queued work. Returns False if it did not exit in time."""
+        work_queue, thread = self._queue, self._io_thread
+        if work_queue is None:
+            return True
+        self._queue = None
+        # Sentinel sorts ahead of everything so queued work is abandoned promptly
+        work_queue.put((PRIORITY_STOP - 1, -1, 0.0, None, None))
+        stopped = True
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=timeout)
+            stopped = not thread.is_alive()
+        self._io_thread = None
+        while True:
+            try:
+                _, _, _, work, future = work_queue.get_nowait()
+            except queue.Empty:
+                break
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(ConnectionError("Controller disconnected."))
+        return stopped
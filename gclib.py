@@ -7,6 +7,11 @@ Contact softwaresupport@galil.com with questions, comments, and suggestions.
 # Part of implementation, don't use directly.
 ###############################################################################
 import platform #for distinguishing 'Windows', 'Linux', 'Darwin'
+import re
+import threading
+from array import array
+from contextlib import contextmanager
+from functools import lru_cache
 from ctypes import *
 
 if platform.system() == 'Windows':
@@ -36,6 +41,7 @@ if platform.system() == 'Windows':
         setattr(_gclib, 'GOpen', getattr(_gclib, '_GOpen@8'))
         setattr(_gclib, 'GProgramDownload', getattr(_gclib, '_GProgramDownload@12'))
         setattr(_gclib, 'GProgramUpload', getattr(_gclib, '_GProgramUpload@12'))
+        setattr(_gclib, 'GRecord', getattr(_gclib, '_GRecord@12'))
         #gclibo calls (open source component/convenience functions)
         setattr(_gclibo, 'GAddresses', getattr(_gclibo, '_GAddresses@8'))
         setattr(_gclibo, 'GArrayDownloadFile', getattr(_gclibo, '_GArrayDownloadFile@8'))
@@ -97,6 +103,7 @@ _gclib.GMessage.argtypes = [_GCon, _GCStringOut, _GSize]
 _gclib.GOpen.argtypes = [_GCStringIn, _GCon_ptr]
 _gclib.GProgramDownload.argtypes = [_GCon, _GCStringIn, _GCStringIn]
 _gclib.GProgramUpload.argtypes = [_GCon, _GCStringOut, _GSize]
+_gclib.GRecord.argtypes = [_GCon, c_void_p, _GOption]
 #gclibo calls (open source component/convenience functions)
 _gclibo.GAddresses.argtypes = [_GCStringOut, _GSize]
 _gclibo.GArrayDownloadFile.argtypes = [_GCon, _GCStringIn]
@@ -122,8 +129,25 @@ _gclibo.GSetupDownloadFile.argtypes = [_GCon, _GCStringIn, _GOption, _GCStringOu
 
 #Set up some constants
 _enc = "ASCII" #byte encoding for going between python strings and c strings.
-_buf_size = 500000 #size of response buffer. Big enough to fit entire 4000 program via UL/LS, or 24000 elements of array data.
+_buf_size = 500000 #size of a pooled transfer buffer. Big enough to fit entire 4000 program via UL/LS, or 24000 elements of array data.
+_small_buf_size = 4096 #per-connection buffer for command responses, which are almost always under 100 bytes.
+_pool_idle = 2 #transfer buffers kept for reuse once no transfer is using them.
+_command_cache_size = 256 #most recently used command strings kept pre-encoded, see _encode_command().
 _error_buf = create_string_buffer(128)    #buffer for retrieving error code descriptions.
+_record_size = 512 #size of data record buffer. Larger than the biggest union GDataRecord.
+_array_chunk = 20000 #elements per array upload. At the widest ASCII value (~17 bytes + comma) this fits _buf_size.
+_array_download_chunk = 2000 #elements per array download, keeping each QD transfer to a few tens of KB.
+_array_value = re.compile(rb'[^,\s]+') #one value of a comma delimited array upload
+_large_response = re.compile(r'(?:^|;)\s*(?:LS|LA|LL|LV|QU|UL)', re.IGNORECASE) #listings that can outgrow _small_buf_size
+
+#return code for a '?' response, see GCommandRaw()
+G_BAD_RESPONSE_QUESTION_MARK = -1010
+#return code for a response that did not fit the buffer
+G_BAD_FULL_MEMORY = -1012
+
+#GRecord methods
+G_QR = 0 #request a record with the QR command
+G_DR = 1 #wait for the next record pushed by the DR command
     
 def _rc(return_code):
     """Checks return codes from gclib and raises a python error if result is exceptional."""
@@ -135,6 +159,38 @@ def _rc(return_code):
 class GclibError(Exception):
     """Error class for non-zero gclib return codes."""
     pass 
+
+class _BufferPool:
+    """
+    Large transfer buffers shared by every connection. A buffer is borrowed only
+    for the length of an upload, so memory follows the number of transfers in
+    flight rather than the number of open connections.
+    """
+    def __init__(self, size, idle):
+        self._size = size
+        self._idle = idle
+        self._free = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def borrow(self):
+        with self._lock:
+            buf = self._free.pop() if self._free else None
+        if buf is None:
+            buf = create_string_buffer(self._size)
+        try:
+            yield buf
+        finally:
+            with self._lock:
+                if len(self._free) < self._idle:
+                    self._free.append(buf)
+
+_transfer_buffers = _BufferPool(_buf_size, _pool_idle)
+
+@lru_cache(maxsize=_command_cache_size)
+def _encode_command(command):
+    """C string for a command; the _command_cache_size most recently used are kept for reuse."""
+    return _GCStringIn(command.encode(_enc))
  
 class py:
     """Represents a single Python connection to a Galil Controller or PLC."""
@@ -142,7 +198,10 @@ class py:
     def __init__(self):
         """Constructor for the Connection class. Initializes gclib's handle and read buffer."""
         self._gcon = _GCon(0) #handle to connection
-        self._buf = create_string_buffer(_buf_size)
+        self._buf = create_string_buffer(_small_buf_size) #large transfers borrow from _transfer_buffers
+        self._read = _GSize(0) #bytes returned by the last GCommand
+        self._read_ptr = pointer(self._read)
+        self._record = create_string_buffer(_record_size)
         self._timeout = 5000
         return        
     
@@ -182,10 +241,51 @@ class py:
         Trims the response.
         """
         self._cc()
-        c_command = _GCStringIn(command.encode(_enc))
-        _rc(_gclib.GCommand(self._gcon, c_command, self._buf, _buf_size, None))
-        response = str(self._buf.value.decode(_enc))
-        return response[:-3].strip() # trim trailing /r/n: and leading space
+        rc, response = self._command(command)
+        _rc(rc)
+        return str(response.decode(_enc))[:-3].strip() # trim trailing /r/n: and leading space
+
+    def GCommandBytes(self, command):
+        """
+        GCommand fast path for polling. Returns the response bytes without the
+        trailing /r/n: and without decoding or stripping; int(), float() and
+        bytes.split(b',') accept the result as it is.
+        """
+        self._cc()
+        rc, response = self._command(command)
+        _rc(rc)
+        return response[:-3] if response.endswith(b"\r\n:") else response[:-1]
+
+    def GCommandRaw(self, command):
+        """
+        Performs a command-and-response transaction without trimming the response.
+        A semicolon-separated line returns each command's data followed by its colon.
+        A '?' response does not raise; the reply then ends with '?' in place of the
+        colon of the command that failed.
+        """
+        self._cc()
+        rc, response = self._command(command)
+        if rc != G_BAD_RESPONSE_QUESTION_MARK:
+            _rc(rc)
+        return str(response.decode(_enc))
+
+    def _command(self, command):
+        """
+        GCommand into the connection's small buffer, or into a pooled transfer
+        buffer for the listings in _large_response (e.g. LS of a long program).
+        A command is sent exactly once: one whose response still does not fit
+        fails with G_BAD_FULL_MEMORY rather than being sent again, as it may not
+        be safe to repeat. Returns (return code, response bytes). Successful
+        responses are copied using the returned length rather than scanning the
+        buffer for its end.
+        """
+        c_command = _encode_command(command)
+        if not _large_response.search(command):
+            rc = _gclib.GCommand(self._gcon, c_command, self._buf, _small_buf_size, self._read_ptr)
+            return rc, (string_at(self._buf, self._read.value) if rc == 0 else self._buf.value)
+        with _transfer_buffers.borrow() as buf:
+            rc = _gclib.GCommand(self._gcon, c_command, buf, _buf_size, self._read_ptr)
+            return rc, (string_at(buf, self._read.value) if rc == 0 else buf.value)
 
         
     def GSleep(self, val):
@@ -200,11 +300,11 @@ class py:
         """
         Provides the gclib version number. Please include the output of this function on all support cases.
         """
-        _rc(_gclibo.GVersion(self._buf, _buf_size))
+        _rc(_gclibo.GVersion(self._buf, _small_buf_size))
         return "py." + str(self._buf.value.decode(_enc))
         
     def GServerStatus(self):
-        _rc(_gclibo.GServerStatus(self._buf, _buf_size))
+        _rc(_gclibo.GServerStatus(self._buf, _small_buf_size))
         return str(self._buf.value.decode(_enc))
 		
     def GSetServer(self, server_name):
@@ -213,8 +313,9 @@ class py:
         return
         
     def GListServers(self):
-        _rc(_gclibo.GListServers(self._buf, _buf_size))
-        return str(self._buf.value.decode(_enc))
+        with _transfer_buffers.borrow() as buf:
+            _rc(_gclibo.GListServers(buf, _buf_size))
+            return str(buf.value.decode(_enc))
 		
     def GPublishServer(self, server_name, publish, save):
         c_server_name = _GCStringIn(server_name.encode(_enc))
@@ -222,14 +323,15 @@ class py:
         return
 		
     def GRemoteConnections(self):
-        _rc(_gclibo.GRemoteConnections(self._buf, _buf_size))
-        return str(self._buf.value.decode(_enc))
+        with _transfer_buffers.borrow() as buf:
+            _rc(_gclibo.GRemoteConnections(buf, _buf_size))
+            return str(buf.value.decode(_enc))
 		
     def GInfo(self):
         """
         Provides a useful connection string. Please include the output of this function on all support cases.
         """
-        _rc(_gclibo.GInfo(self._gcon, self._buf, _buf_size))
+        _rc(_gclibo.GInfo(self._gcon, self._buf, _small_buf_size))
         return str(self._buf.value.decode(_enc))
         
         
@@ -242,9 +344,11 @@ class py:
         
         Linux/OS X users must be root to use GIpRequests() and have UDP access to bind and listen on port 67.
         """
-        _rc(_gclibo.GIpRequests(self._buf, _buf_size)) #get the c string from gclib
+        with _transfer_buffers.borrow() as buf:
+            _rc(_gclibo.GIpRequests(buf, _buf_size)) #get the c string from gclib
+            requests = str(buf.value.decode(_enc))
         ip_req_dict = {}
-        for line in str(self._buf.value.decode(_enc)).splitlines():
+        for line in requests.splitlines():
             line = line.replace(' ', '') #trim spaces throughout
             if (line == ""): continue
             fields = line.split(',')
@@ -271,9 +375,11 @@ class py:
         Returns a dictionary mapping 'address' -> 'revision reports', where possible
         e.g. {}
         """
-        _rc(_gclibo.GAddresses(self._buf, _buf_size))
+        with _transfer_buffers.borrow() as buf:
+            _rc(_gclibo.GAddresses(buf, _buf_size))
+            addresses = str(buf.value.decode(_enc))
         addr_dict = {}
-        for line in str(self._buf.value.decode(_enc)).splitlines():
+        for line in addresses.splitlines():
             fields = line.split(',')
             if len(fields) >= 2:
                 addr_dict[fields[0]] = fields[1]
@@ -300,8 +406,9 @@ class py:
         Uploads a program from the controller's program buffer.
         """
         self._cc()
-        _rc(_gclib.GProgramUpload(self._gcon, self._buf, _buf_size))
-        return str(self._buf.value.decode(_enc))
+        with _transfer_buffers.borrow() as buf:
+            _rc(_gclib.GProgramUpload(self._gcon, buf, _buf_size))
+            return str(buf.value.decode(_enc))
         
         
     def GProgramDownloadFile(self, file_path, preprocessor=""):
@@ -324,18 +431,27 @@ class py:
         _rc(_gclibo.GProgramUploadFile(self._gcon, c_path))
         return
         
-    def GArrayDownload(self, name, first, last, array_data):
+    def GArrayDownload(self, name, first, last, array_data, progress=None):
         """
         Downloads array data to a pre-dimensioned array in the controller's array table. 
-        array_data should be a list of values (e.g. int or float)
+        array_data should be a sequence of values (e.g. list, array or numpy array of int or float).
+        Data is sent in chunks of _array_download_chunk elements starting at first
+        (-1 for the start of the array); last is implied by the data length.
+        If given, progress(elements_sent, total) is called after each chunk.
         """
         self._cc()
         c_name = _GCStringIn(name.encode(_enc))
-        array_string = ""
-        for val in array_data:
-            array_string += str(val) + ","
-        c_data = _GCStringIn(array_string[:-1].encode(_enc)) #trim trailing command
-        _rc(_gclib.GArrayDownload(self._gcon, c_name, first, last, c_data))
+        if first < 0:
+            first = 0
+        total = len(array_data)
+        for offset in range(0, total, _array_download_chunk):
+            chunk = array_data[offset:offset + _array_download_chunk]
+            #fixed-point like the controller; str() could produce exponents it can't parse
+            c_data = _GCStringIn(",".join(map("{:.4f}".format, chunk)).encode(_enc))
+            chunk_first = first + offset
+            _rc(_gclib.GArrayDownload(self._gcon, c_name, chunk_first, chunk_first + len(chunk) - 1, c_data))
+            if progress is not None:
+                progress(offset + len(chunk), total)
         return
         
         
@@ -370,14 +486,52 @@ class py:
         """
         Uploads array data from the controller's array table.
         """
+        return self.GArrayUploadTyped(name, first, last).tolist()
+    
+    
+    def GArrayUploadTyped(self, name, first=-1, last=-1, use_numpy=False, callback=None):
+        """
+        Uploads array data as an array('d'), or a numpy float64 array if use_numpy.
+        first/last of -1 mean the start/end of the array. Ranges longer than
+        _array_chunk elements are uploaded in several transfers. If callback is
+        given it is called as callback(first_index, values) for each chunk as it
+        arrives, and nothing is accumulated or returned.
+        """
         self._cc()
+        if use_numpy:
+            import numpy
+        if first < 0:
+            first = 0
+        if last < 0:
+            last = self._array_length(name) - 1
+        result = None
+        if callback is None:
+            result = numpy.empty(last - first + 1) if use_numpy else array('d')
         c_name = _GCStringIn(name.encode(_enc))
-        _rc(_gclib.GArrayUpload(self._gcon, c_name, first, last, 1, self._buf, _buf_size)) #1 is comma delimiter
-        string_list = str(self._buf.value.decode(_enc)).split(',')
-        float_list = []
-        for s in string_list:
-            float_list.append(float(s))
-        return float_list
+        start = first
+        with _transfer_buffers.borrow() as buf:
+            while start <= last:
+                end = min(last, start + _array_chunk - 1)
+                _rc(_gclib.GArrayUpload(self._gcon, c_name, start, end, 1, buf, _buf_size)) #1 is comma delimiter
+                raw = buf.value
+                #parse straight from the response bytes, one value at a time, without an intermediate list
+                if use_numpy:
+                    values = numpy.fromstring(raw, dtype=float, sep=',')
+                else:
+                    values = array('d', (float(match.group()) for match in _array_value.finditer(raw)))
+                if callback is not None:
+                    callback(start, values)
+                elif use_numpy:
+                    result[start - first:end - first + 1] = values
+                else:
+                    result.extend(values)
+                start = end + 1
+        return result
+    
+    
+    def _array_length(self, name):
+        """Number of elements in a dimensioned array (name[-1] on the controller)."""
+        return int(float(self.GCommand("MG " + name + "[-1]")))
     
     
     def GTimeout(self, timeout):
@@ -421,7 +575,7 @@ class py:
         Provides access to unsolicited messages from the controller.
         """
         self._cc()
-        _rc(_gclib.GMessage(self._gcon, self._buf, _buf_size))
+        _rc(_gclib.GMessage(self._gcon, self._buf, _small_buf_size)) #polled continuously, so each read holds only a few lines
         return str(self._buf.value.decode(_enc))
      
      
@@ -434,6 +588,17 @@ class py:
         _rc(_gclibo.GMotionComplete(self._gcon, c_axes))
         return
 
+    def GRecord(self, method=G_QR):
+        """
+        Provides a binary data record, either requested now (G_QR) or the next one pushed by DR (G_DR).
+        Returns the raw record bytes; see data_record.py for decoding.
+        """
+        self._cc()
+        _rc(_gclib.GRecord(self._gcon, self._record, method))
+        raw = self._record.raw
+        size = raw[2] | (raw[3] << 8) #bytes 2-3 of the header hold the record size
+        return raw[:size]
+
     def GInterrupt(self):
         """   
         Provides access to PCI and UDP interrupts from the controller.
@@ -453,12 +618,14 @@ class py:
         self._cc()
         c_path = _GCStringIn(file_path.encode(_enc))
 
-        rc = _gclibo.GSetupDownloadFile(self._gcon, c_path, options, self._buf, _buf_size)
-        if (options != 0):
-            _rc(rc)
+        with _transfer_buffers.borrow() as buf:
+            rc = _gclibo.GSetupDownloadFile(self._gcon, c_path, options, buf, _buf_size)
+            if (options != 0):
+                _rc(rc)
+            info = str(buf.value.decode(_enc))
 
         info_dict = {}
-        for line in str(self._buf.value.decode(_enc)).split("\"\n"):
+        for line in info.split("\"\n"):
             fields = line.split(',',1)
 
             if (fields[0] == ""): continue
@@ -1,32 +1,50 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-from galil_interface import GalilController
+from galil_interface import PRIORITY_STOP, GalilController
+from capabilities import CommandCapabilities
 from utils import find_galil_com_ports, install_all_gclib_dlls, check_dll_installation
 from diagnostics import get_controller_info, get_diagnostics
-from motor_setup import tune_axis, configure_axis
+from motor_setup import tune_axis, configure_axis, configure_axes
 from encoder_overlay import EncoderOverlay
-from config_manager import load_config, save_config
+from config_manager import apply_compensation, load_config, save_config
 from network_utils import (
     discover_galil_controllers, ping_controller, validate_ip_address,
     test_controller_connection, get_controller_network_settings, set_controller_network_settings
 )
 from network_config import NetworkConfigurator, check_network_configuration_permissions
+from data_record import RECORD_AXES
+from controller_messages import ControllerError, PositionReport
+from step_program import halt_commands, schedule_axes, step_targets, run_step_programs
+from plan_runner import PlanRunner, format_result, load_test_plans, result_samples
+from results_store import ResultStore, controller_identity
+from repeatability import DEFAULT_CYCLES, format_result as format_repeatability, run_repeatability
+from soak import SoakTest, format_status as format_soak_status
+from position_sampler import PositionSampler, RING_FIELDS
+from strip_chart import StripChart
 import os
+import re
+import threading
 import time
 from ctypes import cdll
 from constants import (
     CONFIG_PATH, WINDOW_WIDTH, WINDOW_HEIGHT, STATUS_DISCONNECTED,
-    CANVAS_WIDTH, CANVAS_HEIGHT, ENCODER_CENTER, ENCODER_RADIUS,
-    DEFAULT_JOG_SPEED, DEFAULT_AXIS, DEFAULT_CLICKS_PER_TURN,
-    SERVO_BITS, VALID_AXES
+    CANVAS_WIDTH, CANVAS_HEIGHT, CHART_HEIGHT, ENCODER_CENTER, ENCODER_RADIUS,
+    DEFAULT_JOG_SPEED, DEFAULT_AXIS,
+    SERVO_BITS, VALID_AXES, SIM_DEFAULT_ADDRESS
 )
-from gclib import GclibError
 import math
 
 class GaugeVisualizer:
-    def __init__(self, canvas, controller):
+    MAX_POSITION = 50000  # counts at full needle deflection; adjust to the controller's range
+    NEEDLE_STEPS = 1024   # needle angles in the lookup table, well under a pixel apart
+    FRAME_MS = 16         # redraws are coalesced to about one per display frame
+    REFRESH_MS = 33       # how often the sampler's latest positions are taken over
+
+    def __init__(self, canvas, controller, sampler=None):
         self.canvas = canvas
         self.controller = controller
+        self.sampler = sampler
+        self._sample_count = 0  # sampler samples already shown
         self.axis_positions = {"A": 0, "B": 0, "C": 0, "D": 0}
         self.axis_colors = {"A": "#0066cc", "B": "#00cc66", "C": "#cc6600", "D": "#cc00cc"}
         self.highlighted_colors = {"A": "#3399ff", "B": "#33ff99", "C": "#ff9933", "D": "#ff33ff"}
@@ -39,6 +57,15 @@ class GaugeVisualizer:
         self.gauge_radius = 80
         self.selected_axis = "A"
         
+        # Needle tip offsets from the gauge center, from full left (-1) to full right (+1)
+        needle_length = self.gauge_radius - 20
+        self._needle_table = []
+        for i in range(self.NEEDLE_STEPS + 1):
+            needle_rad = math.radians(180 + i * 180 / self.NEEDLE_STEPS)
+            self._needle_table.append((needle_length * math.cos(needle_rad),
+                                       -needle_length * math.sin(needle_rad)))
+        self._redraw_pending = None  # after() id of the scheduled redraw
+        
         # Create gauges
         self.create_gauges()
         
@@ -47,6 +74,10 @@ class GaugeVisualizer:
         # Clear canvas
         self.canvas.delete("all")
         
+        # Canvas item IDs per axis, and what each gauge currently shows
+        self._items = {}
+        self._drawn_needles = {}
+        self._drawn_values = {}
         for axis in ["A", "B", "C", "D"]:
             self.create_gauge(axis)
     
@@ -97,7 +128,7 @@ class GaugeVisualizer:
                                       tags=f"scale_{axis}_{i}")
         
         # Center hub
-        self.canvas.create_oval(
+        hub = self.canvas.create_oval(
             center_x - 8, center_y - 8,
             center_x + 8, center_y + 8,
             fill=color, outline='#ffffff', width=2,
@@ -111,90 +142,90 @@ class GaugeVisualizer:
         needle_x = center_x + needle_length * math.cos(needle_rad)
         needle_y = center_y - needle_length * math.sin(needle_rad)
         
-        self.canvas.create_line(
+        needle = self.canvas.create_line(
             center_x, center_y, needle_x, needle_y,
             fill=color, width=4, tags=f"needle_{axis}"
         )
         
         # Axis label
-        self.canvas.create_text(
+        label = self.canvas.create_text(
             center_x, center_y + radius + 20,
             text=f"Axis {axis}", fill=color, font=("Arial", 12, "bold"),
             tags=f"label_{axis}"
         )
         
         # Position value display
-        self.canvas.create_text(
+        value = self.canvas.create_text(
             center_x, center_y + radius + 40,
             text="0", fill='#ffffff', font=("Arial", 10, "bold"),
             tags=f"value_{axis}"
         )
+        
+        self._items[axis] = {"hub": hub, "needle": needle, "label": label, "value": value}
+        self._drawn_needles[axis] = (needle_x, needle_y)
+        self._drawn_values[axis] = 0
     
     def update_position(self, axis, position):
-        """Update gauge needle position for an axis"""
-        center_x, center_y = self.gauge_centers[axis]
-        radius = self.gauge_radius
-        
-        # Normalize position to -10 to +10 scale (centered at zero)
-        max_position = 50000  # Adjust based on your controller's range
-        normalized_pos = max(-1, min(1, position / max_position))
-        
-        # Calculate needle angle (180 to 360 degrees, with 270 as center/zero)
-        start_angle = 180
-        extent = 180
-        # Map -1 to 180 degrees (left), 0 to 270 degrees (center), +1 to 360 degrees (right)
-        needle_angle = start_angle + ((normalized_pos + 1) * extent / 2)
-        needle_rad = math.radians(needle_angle)
-        
-        # Update needle position
-        needle_length = radius - 20
-        needle_x = center_x + needle_length * math.cos(needle_rad)
-        needle_y = center_y - needle_length * math.sin(needle_rad)
-        
-        # Update needle line
-        self.canvas.coords(f"needle_{axis}", center_x, center_y, needle_x, needle_y)
-        
-        # Update position value
-        self.canvas.itemconfig(f"value_{axis}", text=str(position))
-        
-        # Store position
+        """Update gauge needle position for an axis; the canvas is redrawn on the next frame"""
         self.axis_positions[axis] = position
+        if self._redraw_pending is None:
+            self._redraw_pending = self.canvas.after(self.FRAME_MS, self._redraw)
+    
+    def _redraw(self):
+        """Bring every gauge up to date with axis_positions, touching only what visibly changed"""
+        self._redraw_pending = None
+        for axis, position in self.axis_positions.items():
+            items = self._items[axis]
+            if position != self._drawn_values[axis]:
+                self.canvas.itemconfig(items["value"], text=str(position))
+                self._drawn_values[axis] = position
+            
+            # -1 (full left) .. +1 (full right) picks an entry of the needle table
+            normalized_pos = max(-1.0, min(1.0, position / self.MAX_POSITION))
+            offset_x, offset_y = self._needle_table[int(round((normalized_pos + 1) * self.NEEDLE_STEPS / 2))]
+            center_x, center_y = self.gauge_centers[axis]
+            needle_x, needle_y = center_x + offset_x, center_y + offset_y
+            
+            # Moves of less than a pixel would not show
+            drawn_x, drawn_y = self._drawn_needles[axis]
+            if abs(needle_x - drawn_x) >= 1 or abs(needle_y - drawn_y) >= 1:
+                self.canvas.coords(items["needle"], center_x, center_y, needle_x, needle_y)
+                self._drawn_needles[axis] = (needle_x, needle_y)
     
     def highlight_axis(self, axis):
         """Highlight the selected axis gauge"""
-        self.selected_axis = axis
+        previous, self.selected_axis = self.selected_axis, axis
         
-        # Update all gauge elements to show which one is selected
-        for ax in ["A", "B", "C", "D"]:
+        # Only the previously and newly selected gauges change color
+        for ax in {previous, axis}:
             color = self.highlighted_colors[ax] if ax == axis else self.axis_colors[ax]
-            
-            # Update hub color
-            if f"hub_{ax}" in self.canvas.find_all():
-                self.canvas.itemconfig(f"hub_{ax}", fill=color)
-            
-            # Update needle color
-            if f"needle_{ax}" in self.canvas.find_all():
-                self.canvas.itemconfig(f"needle_{ax}", fill=color)
-            
-            # Update label color
-            if f"label_{ax}" in self.canvas.find_all():
-                self.canvas.itemconfig(f"label_{ax}", fill=color)
+            for part in ("hub", "needle", "label"):
+                self.canvas.itemconfig(self._items[ax][part], fill=color)
     
     def update_from_controller(self):
         """Update positions from controller data"""
         try:
             if hasattr(self.controller, 'g') and self.controller.g:
-                # Get position data from controller
-                response = self.controller.send_command("TP")
-                if response:
-                    positions = response.split(',')
-                    if len(positions) >= 4:
-                        for i, axis in enumerate(["A", "B", "C", "D"]):
-                            try:
-                                pos = int(positions[i])
-                                self.update_position(axis, pos)
-                            except (ValueError, IndexError):
-                                pass
+                if self.sampler is not None:
+                    # The sampler thread does the I/O; only its latest slot is read here
+                    if self.sampler.ring.count == self._sample_count:
+                        return
+                    self._sample_count = self.sampler.ring.count
+                    latest = self.sampler.latest()
+                    if latest is None:
+                        return
+                    for axis, position in latest[1].items():
+                        self.update_position(axis, position)
+                    return
+                # One data record carries every axis; streamed records cost no round trip.
+                # Without a stream, queue a low-priority QR instead of blocking the Tk thread.
+                if self.controller.latest_data_record(max_age=0.1) is None:
+                    self.controller.refresh_data_record()
+                record = self.controller.latest_data_record()
+                if record is None:
+                    return
+                for axis, axis_record in zip(RECORD_AXES, record.axes):
+                    self.update_position(axis, axis_record.position)
         except Exception:
             pass
 
@@ -209,28 +240,73 @@ class GalilSetupApp:
         self.setup_dark_theme()
         
         if not self.check_gclib_dll():
-            messagebox.showerror(
+            if not messagebox.askyesno(
                 "Missing DLL",
-                "Could not load gclib.dll. Make sure it is in the application folder or in your system PATH."
-            )
-            self.root.destroy()
-            return
+                "Could not load gclib.dll. Make sure it is in the application folder or in your system PATH.\n\n"
+                f"Continue with the built-in simulator only? (connect to {SIM_DEFAULT_ADDRESS} over Network)"
+            ):
+                self.root.destroy()
+                return
 
         # Initialize controller as instance variable
         self.controller = GalilController()
+        self.capabilities = CommandCapabilities(self.controller)
         self.config = load_config()
         
+        # Set by stop_automated_test(); host-driven test threads wait on the event so a stop cuts their pauses short
+        self._stop_test = False
+        self._stop_event = threading.Event()
+        # What stop_automated_test() sends for the running test: its axes' ST, plus
+        # HX for the program threads of a controller-side test
+        self._test_halt = [f"ST{''.join(RECORD_AXES)}"]
+        
+        # Local database of automated test results
+        try:
+            self.results = ResultStore()
+        except Exception as e:
+            # The diagnostics log is created with the layout below
+            self.root.after(0, self.log_warning, f"Test results will not be stored: {str(e)}")
+            self.results = None
+        
         # Initialize network configurator
         self.network_configurator = NetworkConfigurator()
         
         # Create main container with futuristic styling
         self.create_futuristic_layout()
         
+        # Positions are sampled on a background thread at a fixed rate; the gauges
+        # read the newest sample and never wait on the controller
+        self.sampler = PositionSampler(self.controller)
+        self.sampler.start()
+        # Nobody sees the gauges while the window is minimized
+        self.root.bind("<Unmap>", self._on_window_unmap, add="+")
+        self.root.bind("<Map>", self._on_window_map, add="+")
+        
         # Initialize gauge visualizer
-        self.visualizer = GaugeVisualizer(self.canvas, self.controller)
+        self.visualizer = GaugeVisualizer(self.canvas, self.controller, self.sampler)
+        
+        # Encoder angle and turns of every axis, from the same samples as the gauges,
+        # scaled by each axis's configured counts per turn
+        presets = self.config.get("axis_presets", {})
+        self.encoder_overlay = EncoderOverlay(self.encoder_canvas, self.sampler, ENCODER_CENTER, ENCODER_RADIUS,
+                                              axes=RECORD_AXES,
+                                              clicks_per_turn={axis: presets.get(axis, {}).get("clicks_per_turn")
+                                                               for axis in RECORD_AXES})
+        
+        # History of the sampled axes; drawn from the sampler's ring only
+        self.strip_chart = StripChart(self.chart_canvas, self.sampler.ring)
+        self.strip_chart.start()
         
         # Start position updates
         self.root.after(200, self.update_gauge_position)
+        
+        # The controller reconnects by itself after a dropped link; reflect that in the UI
+        self.controller.add_connection_listener(
+            lambda connected: self.root.after(0, self._on_connection_change, connected))
+        
+        # Unsolicited controller messages are drained into the log
+        self.controller_messages = self.controller.subscribe_messages()
+        self.root.after(200, self.process_controller_messages)
 
     def select_axis(self, axis):
         """Select an axis and update the UI"""
@@ -522,6 +598,18 @@ class GalilSetupApp:
         tk.Button(auto_test_frame, text="RUN AUTOMATED TEST", command=self.run_automated_test,
                  bg='#cc6600', fg='#ffffff', font=("Arial", 9, "bold"),
                  relief='raised', bd=3).pack(pady=2)
+        tk.Button(auto_test_frame, text="RUN TEST PLAN", command=self.run_test_plan,
+                 bg='#cc6600', fg='#ffffff', font=("Arial", 9, "bold"),
+                 relief='raised', bd=3).pack(pady=2)
+        tk.Button(auto_test_frame, text="REPEATABILITY TEST", command=self.run_repeatability_test,
+                 bg='#cc6600', fg='#ffffff', font=("Arial", 9, "bold"),
+                 relief='raised', bd=3).pack(pady=2)
+        tk.Button(auto_test_frame, text="SOAK TEST", command=self.run_soak_test,
+                 bg='#cc6600', fg='#ffffff', font=("Arial", 9, "bold"),
+                 relief='raised', bd=3).pack(pady=2)
+        tk.Button(auto_test_frame, text="RESULT TRENDS", command=self.show_result_trends,
+                 bg='#0066cc', fg='#ffffff', font=("Arial", 9, "bold"),
+                 relief='raised', bd=3).pack(pady=2)
         tk.Button(auto_test_frame, text="STOP AUTOMATED TEST", command=self.stop_automated_test,
                  bg='#cc0000', fg='#ffffff', font=("Arial", 9, "bold"),
                  relief='raised', bd=3).pack(pady=2)
@@ -552,6 +640,9 @@ class GalilSetupApp:
         tk.Button(config_frame, text="CONFIGURE AXIS", command=self.configure_selected_axis,
                  bg='#0066cc', fg='#ffffff', font=("Arial", 9, "bold"),
                  relief='raised', bd=3).pack(pady=2)
+        tk.Button(config_frame, text="CONFIGURE ALL AXES", command=self.configure_all_axes,
+                 bg='#0066cc', fg='#ffffff', font=("Arial", 9, "bold"),
+                 relief='raised', bd=3).pack(pady=2)
         tk.Button(config_frame, text="SAVE CONFIG", command=self.save_current_config,
                  bg='#0066cc', fg='#ffffff', font=("Arial", 9, "bold"),
                  relief='raised', bd=3).pack(pady=2)
@@ -642,16 +733,64 @@ class GalilSetupApp:
             fg='#ffffff'
         ).pack(pady=10)
         
+        # Gauges and the encoder overlay side by side
+        dial_frame = tk.Frame(viz_frame, bg='#1a1a1a')
+        dial_frame.pack(pady=10)
+        
         # Canvas for gauge visualization
         self.canvas = tk.Canvas(
-            viz_frame,
+            dial_frame,
             width=CANVAS_WIDTH,
             height=CANVAS_HEIGHT,
             bg='#0a0a0a',
             highlightthickness=2,
             highlightbackground='#0066cc'
         )
-        self.canvas.pack(pady=10)
+        self.canvas.pack(side="left", padx=5)
+        
+        # Canvas for the encoder overlay
+        self.encoder_canvas = tk.Canvas(
+            dial_frame,
+            width=CANVAS_WIDTH,
+            height=CANVAS_HEIGHT,
+            bg='#0a0a0a',
+            highlightthickness=2,
+            highlightbackground='#0066cc'
+        )
+        self.encoder_canvas.pack(side="left", padx=5)
+        
+        # Strip chart controls: field, zoom and pause (the mouse wheel zooms too)
+        chart_controls = tk.Frame(viz_frame, bg='#1a1a1a')
+        chart_controls.pack(fill="x")
+        self.chart_field = tk.StringVar(value=RING_FIELDS[0])
+        for field in RING_FIELDS:
+            tk.Radiobutton(chart_controls, text=field.upper(), variable=self.chart_field, value=field,
+                           command=lambda: self.strip_chart.set_field(self.chart_field.get()),
+                           bg='#1a1a1a', fg='#ffffff', selectcolor='#404040',
+                           font=("Arial", 8, "bold")).pack(side="left")
+        self.chart_pause_button = tk.Button(chart_controls, text="PAUSE", command=self.toggle_chart_pause,
+                                            bg='#404040', fg='#ffffff', font=("Arial", 8, "bold"))
+        self.chart_pause_button.pack(side="right", padx=2)
+        tk.Button(chart_controls, text="ZOOM -", command=lambda: self.strip_chart.zoom(1),
+                 bg='#404040', fg='#ffffff', font=("Arial", 8, "bold")).pack(side="right", padx=2)
+        tk.Button(chart_controls, text="ZOOM +", command=lambda: self.strip_chart.zoom(-1),
+                 bg='#404040', fg='#ffffff', font=("Arial", 8, "bold")).pack(side="right", padx=2)
+        
+        # Canvas for the strip chart
+        self.chart_canvas = tk.Canvas(
+            viz_frame,
+            width=CANVAS_WIDTH,
+            height=CHART_HEIGHT,
+            bg='#0a0a0a',
+            highlightthickness=2,
+            highlightbackground='#0066cc'
+        )
+        self.chart_canvas.pack(pady=10)
+
+    def toggle_chart_pause(self):
+        """Freeze or resume the strip chart; zooming still works while paused."""
+        paused = self.strip_chart.toggle_pause()
+        self.chart_pause_button.config(text="RESUME" if paused else "PAUSE")
 
     def create_diagnostics_panel(self):
         """Create the diagnostics panel with enhanced logging capabilities"""
@@ -716,19 +855,60 @@ class GalilSetupApp:
         """Update gauge position display"""
         try:
             self.visualizer.update_from_controller()
+            self.encoder_overlay.update()
             # Also update the position display
             self.update_position_display()
         except Exception:
             pass
-        self.root.after(100, self.update_gauge_position)  # Increased frequency for more responsive updates
+        self.root.after(GaugeVisualizer.REFRESH_MS, self.update_gauge_position)
+    
+    def _on_window_unmap(self, event):
+        """Pause position sampling and the record stream while the main window is minimized."""
+        if event.widget is self.root:
+            self.sampler.pause()
+            self.controller.pause_record_stream()
+    
+    def _on_window_map(self, event):
+        """Resume position sampling and the record stream when the main window is shown again."""
+        if event.widget is self.root:
+            self.controller.resume_record_stream()
+            self.sampler.resume()
+    
+    def _on_connection_change(self, connected):
+        """Update the status when the controller link drops or comes back."""
+        if connected:
+            self.sampler.wake()
+            self.status_var.set(f"Connected: {self.controller.address}")
+            self.log_success(f"Reconnected to controller at {self.controller.address}")
+        else:
+            self.status_var.set(f"Reconnecting: {self.controller.address}")
+            self.log_warning("Controller link lost - reconnecting automatically")
+    
+    def process_controller_messages(self):
+        """Log unsolicited controller messages and apply pushed positions."""
+        try:
+            for event in self.controller_messages.drain():
+                if isinstance(event, ControllerError):
+                    self.log_error(f"Controller: {event.text}")
+                elif isinstance(event, PositionReport):
+                    for axis, position in event.positions.items():
+                        self.visualizer.update_position(axis, position)
+                else:
+                    self.log_status(f"Controller: {event.text}")
+        except Exception:
+            pass
+        self.root.after(200, self.process_controller_messages)
     
     def update_position_display(self):
         """Update the position display for the currently selected axis"""
         try:
             current_axis = self.selected_axis.get()
             if hasattr(self.visualizer, 'axis_positions'):
-                position = self.visualizer.axis_positions.get(current_axis, 0)
-                self.position_label.config(text=str(position))
+                position = str(self.visualizer.axis_positions.get(current_axis, 0))
+                # Runs every gauge refresh; only touch the label when the text changes
+                if position != getattr(self, "_shown_position", None):
+                    self.position_label.config(text=position)
+                    self._shown_position = position
         except Exception:
             pass
 
@@ -761,11 +941,12 @@ class GalilSetupApp:
     def _limit_log_lines(self):
         """Limit the number of lines in the log to prevent memory issues."""
         try:
-            lines = self.diagnostics_text.get("1.0", tk.END).split('\n')
-            if len(lines) > self.max_log_lines:
+            # The index of the end gives the line count without copying the text out;
+            # every entry ends in a newline, so the last line is always empty
+            entries = int(self.diagnostics_text.index("end-1c").split(".")[0]) - 1
+            if entries > self.max_log_lines:
                 # Remove oldest lines (keep the last max_log_lines)
-                excess_lines = len(lines) - self.max_log_lines
-                self.diagnostics_text.delete("1.0", f"{excess_lines + 1}.0")
+                self.diagnostics_text.delete("1.0", f"{entries - self.max_log_lines + 1}.0")
         except Exception:
             pass
 
@@ -844,16 +1025,10 @@ class GalilSetupApp:
             # Log position if controller is connected
             if hasattr(self.controller, 'g') and self.controller.g:
                 try:
-                    response = self.controller.send_command("TP")
-                    if response:
-                        positions = response.split(',')
-                        if len(positions) >= 4:
-                            for i, axis in enumerate(["A", "B", "C", "D"]):
-                                try:
-                                    pos = int(positions[i])
-                                    self.log_status(f"Axis {axis} Position: {pos}")
-                                except (ValueError, IndexError):
-                                    pass
+                    record = self.controller.latest_data_record()
+                    if record is not None:
+                        for axis, axis_record in zip(RECORD_AXES, record.axes):
+                            self.log_status(f"Axis {axis} Position: {axis_record.position}")
                 except:
                     pass
             
@@ -881,6 +1056,11 @@ class GalilSetupApp:
                 for line in diag.split('\n'):
                     if line.strip():
                         self.log_status(line.strip())
+                
+                # Where time goes: controller/network per opcode vs. our own queueing
+                self.log_info("=== COMMAND LATENCY ===")
+                for line in self.controller.command_stats.format_report().split('\n'):
+                    self.log_status(line)
                         
             except Exception as e:
                 self.log_error(f"Error retrieving diagnostics: {str(e)}")
@@ -921,10 +1101,27 @@ class GalilSetupApp:
         try:
             self.log_info("Establishing connection...")
             self.controller.connect(address)
+            # Command syntax is resolved per firmware; a new connection may be a different controller
+            self.capabilities = CommandCapabilities(self.controller)
             self.status_var.set(f"Connected: {address}")
+            self.sampler.wake()
             
             self.log_success(f"Successfully connected to controller at {address}")
             
+            # Have the controller push data records so gauges need no polling round trips
+            try:
+                # Every pushed record goes into the sampler's ring for the strip chart
+                self.controller.start_record_stream(callback=self.sampler.feed)
+                self.log_info("Data record streaming started")
+            except Exception as e:
+                self.log_warning(f"Data record streaming unavailable, using QR polling: {str(e)}")
+            
+            # Receive MG output and errors from programs running on the controller
+            try:
+                self.controller.start_message_pump()
+            except Exception as e:
+                self.log_warning(f"Controller messages unavailable: {str(e)}")
+            
             # Update status color
             for widget in self.root.winfo_children():
                 if isinstance(widget, tk.Label) and widget.cget("textvariable") == self.status_var:
@@ -937,10 +1134,18 @@ class GalilSetupApp:
             self.status_var.set(STATUS_DISCONNECTED)
 
     def jog_positive(self):
+        self._jog(1)
+
+    def jog_negative(self):
+        self._jog(-1)
+
+    def _jog(self, sign):
+        """Start jogging the selected axis; the commands are queued so the UI never waits on the link."""
         axis = self.selected_axis.get()
         speed = self.jog_speed_entry.get()
+        label = "positive" if sign > 0 else "negative"
         
-        self.log_info(f"=== JOG POSITIVE - AXIS {axis} ===")
+        self.log_info(f"=== JOG {label.upper()} - AXIS {axis} ===")
         self.log_info(f"Speed: {speed}")
         
         # Check if controller is connected
@@ -969,103 +1174,54 @@ class GalilSetupApp:
                 messagebox.showerror("Invalid Speed", "Speed must be a valid number.")
                 return
 
-            # Apply preset if any
             preset = self.config.get("axis_presets", {}).get(axis, {})
-            if preset:
-                self.log_info("Applying axis preset configuration")
-                configure_axis(self.controller, axis, preset)
+            commands = [f"SH{axis}", f"JG{axis}={sign * speed_val}", f"BG{axis}"]
+            for command in commands:
+                self.log_command(f"Jog command: {command}")
 
-            # Execute jog commands
-            self.log_command(f"Servo-on command: SH{axis}")
-            self.controller.send_command(f"SH{axis}")
-            
-            self.log_command(f"Jog command: JG{axis}={speed}")
-            self.controller.send_command(f"JG{axis}={speed}")
-            
-            self.log_command(f"Begin command: BG{axis}")
-            self.controller.send_command(f"BG{axis}")
-            
-            self.log_success(f"Axis {axis} jogging positive at speed {speed}")
-            
-            # Update gauge display with actual position
-            self.update_position_from_controller(axis)
-            
-            # Schedule additional updates for smooth visual feedback
-            def delayed_update():
-                self.update_position_from_controller(axis)
-                self.visualizer.update_from_controller()
-            
-            # Update after a short delay to show movement
-            self.root.after(50, delayed_update)
+            def work(g):
+                # Runs on the I/O thread, so the preset and the jog go out back to back;
+                # only parameters that changed since the last write are sent
+                sent = configure_axis(self.controller, axis, preset) if preset else []
+                self.controller.send_batch(commands)
+                return sent
+
+            future = self.controller.submit(work)
+            self._when_done(future, lambda f: self._finish_jog(axis, label, speed_val, f))
             
         except Exception as e:
-            self.log_error(f"Jog positive failed: {str(e)}")
+            self.log_error(f"Jog {label} failed: {str(e)}")
             messagebox.showerror("Jog Error", f"Error: {str(e)}")
 
-    def jog_negative(self):
-        axis = self.selected_axis.get()
-        speed = self.jog_speed_entry.get()
+    def _finish_jog(self, axis, label, speed, future):
+        """Report the result of a queued jog on the Tk thread."""
+        error = future.exception()
+        if error is not None:
+            self.log_error(f"Jog {label} failed: {str(error)}")
+            messagebox.showerror("Jog Error", f"Error: {str(error)}")
+            return
+        sent = future.result()
+        if sent:
+            self.log_info(f"Applied axis preset changes: {'; '.join(sent)}")
+        self.log_success(f"Axis {axis} jogging {label} at speed {speed}")
         
-        self.log_info(f"=== JOG NEGATIVE - AXIS {axis} ===")
-        self.log_info(f"Speed: {speed}")
+        # Update gauge display with actual position
+        self.update_position_from_controller(axis)
         
-        # Check if controller is connected
-        if not getattr(self.controller, "g", None):
-            self.log_error("Controller not connected - cannot jog")
-            messagebox.showerror("Connection Error", "Controller not connected. Please click Connect first.")
-            return
-            
-        try:
-            # Validate axis
-            if axis not in SERVO_BITS:
-                self.log_error(f"Invalid axis: {axis}")
-                messagebox.showerror("Invalid Axis", f"Axis {axis} is not valid. Use A, B, C, or D.")
-                return
-                
-            # Validate speed
-            try:
-                speed_val = int(speed)
-                if speed_val <= 0:
-                    self.log_error(f"Invalid speed: {speed} (must be positive)")
-                    messagebox.showerror("Invalid Speed", "Speed must be a positive number.")
-                    return
-                self.log_info(f"Speed validated: {speed_val}")
-            except ValueError:
-                self.log_error(f"Invalid speed format: {speed}")
-                messagebox.showerror("Invalid Speed", "Speed must be a valid number.")
-                return
-
-            preset = self.config.get("axis_presets", {}).get(axis, {})
-            if preset:
-                self.log_info("Applying axis preset configuration")
-                configure_axis(self.controller, axis, preset)
-
-            # Execute jog commands
-            self.log_command(f"Servo-on command: SH{axis}")
-            self.controller.send_command(f"SH{axis}")
-            
-            self.log_command(f"Jog command: JG{axis}=-{speed}")
-            self.controller.send_command(f"JG{axis}=-{speed}")
-            
-            self.log_command(f"Begin command: BG{axis}")
-            self.controller.send_command(f"BG{axis}")
-            
-            self.log_success(f"Axis {axis} jogging negative at speed {speed}")
-            
-            # Update gauge display with actual position
+        # Schedule additional updates for smooth visual feedback
+        def delayed_update():
             self.update_position_from_controller(axis)
-            
-            # Schedule additional updates for smooth visual feedback
-            def delayed_update():
-                self.update_position_from_controller(axis)
-                self.visualizer.update_from_controller()
-            
-            # Update after a short delay to show movement
-            self.root.after(50, delayed_update)
-            
-        except Exception as e:
-            self.log_error(f"Jog negative failed: {str(e)}")
-            messagebox.showerror("Jog Error", f"Error: {str(e)}")
+            self.visualizer.update_from_controller()
+        
+        # Update after a short delay to show movement
+        self.root.after(50, delayed_update)
+
+    def _when_done(self, future, callback, poll_ms=20):
+        """Call callback(future) on the Tk thread once future has completed, polling with after()."""
+        if future.done():
+            callback(future)
+        else:
+            self.root.after(poll_ms, self._when_done, future, callback, poll_ms)
 
     def stop_motion(self):
         axis = self.selected_axis.get()
@@ -1085,39 +1241,44 @@ class GalilSetupApp:
                 messagebox.showerror("Invalid Axis", f"Axis {axis} is not valid. Use A, B, C, or D.")
                 return
                 
-            # Stop command
+            # Stop command jumps ahead of queued traffic; don't block the UI waiting for it
             self.log_command(f"Stop command: ST{axis}")
-            self.controller.send_command(f"ST{axis}")
-            
-            self.log_success(f"Axis {axis} motion stopped")
-            
-            # Update gauge display with actual position
-            self.update_position_from_controller(axis)
+            future = self.controller.submit_command(f"ST{axis}")
+            future.add_done_callback(
+                lambda f: self.root.after(0, self._finish_stop_motion, axis, f.exception()))
             
         except Exception as e:
             self.log_error(f"Stop motion failed: {str(e)}")
             messagebox.showerror("Stop Error", str(e))
 
+    def _finish_stop_motion(self, axis, error):
+        """Report the result of an asynchronous ST on the Tk thread."""
+        if error is not None:
+            self.log_error(f"Stop motion failed: {str(error)}")
+            messagebox.showerror("Stop Error", str(error))
+            return
+        self.log_success(f"Axis {axis} motion stopped")
+        
+        # Update gauge display with actual position
+        self.update_position_from_controller(axis)
+
     def update_position_from_controller(self, axis):
         """Update gauge display with actual position from controller"""
         try:
             if hasattr(self.controller, 'g') and self.controller.g:
-                response = self.controller.send_command("TP")
-                if response:
-                    positions = response.split(',')
-                    if len(positions) >= 4:
-                        axis_index = {"A": 0, "B": 1, "C": 2, "D": 3}.get(axis, 0)
-                        try:
-                            pos = int(positions[axis_index])
-                            self.visualizer.update_position(axis, pos)
-                            # Log position updates periodically (not every time to avoid spam)
-                            if hasattr(self, '_last_position_log') and time.time() - self._last_position_log.get(axis, 0) > 5:
-                                self.log_status(f"Axis {axis} position: {pos}")
-                                self._last_position_log[axis] = time.time()
-                            elif not hasattr(self, '_last_position_log'):
-                                self._last_position_log = {axis: time.time()}
-                        except (ValueError, IndexError):
-                            pass
+                record = self.controller.latest_data_record(max_age=0.1)
+                if record is None:
+                    # Refresh in the background; the gauge loop picks up the result
+                    self.controller.refresh_data_record()
+                    return
+                pos = record.axis(axis).position
+                self.visualizer.update_position(axis, pos)
+                # Log position updates periodically (not every time to avoid spam)
+                if hasattr(self, '_last_position_log') and time.time() - self._last_position_log.get(axis, 0) > 5:
+                    self.log_status(f"Axis {axis} position: {pos}")
+                    self._last_position_log[axis] = time.time()
+                elif not hasattr(self, '_last_position_log'):
+                    self._last_position_log = {axis: time.time()}
         except Exception:
             pass
 
@@ -1344,6 +1505,35 @@ class GalilSetupApp:
             self.log_error(f"Error configuring axis {axis}: {str(e)}")
             messagebox.showerror("Configuration Error", f"Error configuring axis {axis}: {str(e)}")
 
+    def configure_all_axes(self):
+        """Apply the preset of every axis in one batch of commands."""
+        self.log_info("=== CONFIGURE ALL AXES ===")
+        
+        # Check if controller is connected
+        if not getattr(self.controller, "g", None):
+            self.log_error("Controller not connected - cannot configure axes")
+            messagebox.showerror("Connection Error", "Controller not connected. Please click Connect first.")
+            return
+        
+        presets = {axis: preset for axis, preset in self.config.get("axis_presets", {}).items() if preset}
+        if not presets:
+            self.log_error("No axis presets found")
+            messagebox.showerror("Configuration Error", "No axis presets found in the configuration.")
+            return
+        
+        try:
+            # Only parameters that changed since the last write are sent
+            sent = configure_axes(self.controller, presets)
+            if sent:
+                self.log_info(f"Applied axis preset changes: {'; '.join(sent)}")
+            self.log_success(f"Axes {', '.join(sorted(presets))} configured with preset settings")
+            messagebox.showinfo("Configuration Success",
+                                f"Axes {', '.join(sorted(presets))} configured with preset settings.\n\n"
+                                f"{len(sent)} parameter(s) changed.")
+        except Exception as e:
+            self.log_error(f"Error configuring axes: {str(e)}")
+            messagebox.showerror("Configuration Error", f"Error configuring axes: {str(e)}")
+
     def load_pid_values_to_tuning_block(self, axis, preset):
         """Load PID values from preset into the tuning block entry fields."""
         try:
@@ -1456,15 +1646,15 @@ class GalilSetupApp:
                     self.root.after(0, self._append_diagnostic, f"Axis {axis}: speed set failed: {e}")
                     continue
 
-                # ±1 cm moves (positive then negative)
+                # ±1 cm moves (positive then negative): one second's travel at SPEED
                 for direction in (SPEED, -SPEED):
                     try:
-                        # Use JG for continuous movement
-                        self.controller.send_command(f"JG{axis}={direction}")
+                        # Relative move, so completion can be waited on instead of timed
+                        self.controller.send_command(f"PR{axis}={direction}")
                         self.controller.send_command(f"BG{axis}")
                         self.root.after(
                             0, self._append_diagnostic,
-                            f"Axis {axis}: moving {direction:+} speed..."
+                            f"Axis {axis}: moving {direction:+} counts..."
                         )
                     except Exception as e:
                         self.root.after(
@@ -1474,20 +1664,26 @@ class GalilSetupApp:
                         continue
 
                     # Wait for movement to complete
-                    time.sleep(1)  # Simple wait instead of complex polling
-                    
-                    # Stop the movement
                     try:
-                        self.controller.send_command(f"ST{axis}")
+                        self.controller.wait_motion_complete(axis, timeout=TIMEOUT_S)
                         self.root.after(
                             0, self._append_diagnostic,
-                            f"Axis {axis}: movement stopped"
+                            f"Axis {axis}: movement complete"
                         )
                     except Exception as e:
                         self.root.after(
                             0, self._append_diagnostic,
-                            f"Axis {axis}: stop failed: {e}"
+                            f"Axis {axis}: move did not complete: {e}"
                         )
+                        # Stop the movement
+                        try:
+                            self.controller.send_command(f"ST{axis}")
+                            self.controller.wait_motion_complete(axis, timeout=TIMEOUT_S)
+                        except Exception as e:
+                            self.root.after(
+                                0, self._append_diagnostic,
+                                f"Axis {axis}: stop failed: {e}"
+                            )
 
                 self.root.after(
                     0, self._append_diagnostic,
@@ -1507,6 +1703,7 @@ class GalilSetupApp:
                 time.sleep(2)  # Let it move for 2 seconds
                 
                 self.controller.send_command("STA")
+                self.controller.wait_motion_complete("A", timeout=5.0)
                 self.root.after(0, self._append_diagnostic, "Axis A: Movement stopped")
             except Exception as e:
                 self.root.after(0, self._append_diagnostic, f"Simple movement test failed: {e}")
@@ -1599,23 +1796,13 @@ class GalilSetupApp:
             # If controller is connected, try to set the IP on the controller
             if getattr(self.controller, "g", None):
                 try:
-                    # Set the IP address on the controller - try different formats
-                    ip_commands = [
-                        f"IP{new_ip}",
-                        f"IP {new_ip}",
-                        f"IP={new_ip}",
-                        f"IP {new_ip}",
-                        f"IP{new_ip.replace('.', '')}"  # Some controllers use IP192168001
-                    ]
-                    
+                    # Set the IP address on the controller using the syntax this firmware accepts
                     success = False
-                    for cmd in ip_commands:
-                        try:
-                            self.controller.send_command(cmd)
-                            success = True
-                            break
-                        except Exception:
-                            continue
+                    try:
+                        self.capabilities.run("set_ip", ip=new_ip, ip_commas=new_ip.replace('.', ','))
+                        success = True
+                    except Exception:
+                        pass
                     
                     if success:
                         messagebox.showinfo("IP Set", f"Controller IP address set to: {new_ip}\nNote: You may need to reconnect after IP change.")
@@ -1815,22 +2002,11 @@ class GalilSetupApp:
                 
             # Step 2: Reset the encoder count to zero (this is the key step)
             encoder_reset_success = False
-            encoder_reset_commands = [
-                f"DP{axis}=0",     # Define position to 0 (most reliable)
-                f"DP {axis}=0",    # Define position to 0 with space
-                f"RZ{axis}",       # Reset zero position
-                f"RZ {axis}",      # Reset zero position with space
-                f"ZP{axis}=0",     # Zero position
-                f"ZP {axis}=0",    # Zero position with space
-            ]
-            
-            for cmd in encoder_reset_commands:
-                try:
-                    self.controller.send_command(cmd)
-                    encoder_reset_success = True
-                    break
-                except Exception:
-                    continue
+            try:
+                self.capabilities.run("zero_position", axis=axis)
+                encoder_reset_success = True
+            except Exception:
+                pass
             
             if not encoder_reset_success:
                 messagebox.showerror("Reset Error", f"Could not reset encoder count for axis {axis}")
@@ -2048,6 +2224,23 @@ class GalilSetupApp:
                           bg='#1a1a1a', fg='#ffffff', selectcolor='#1a1a1a',
                           font=("Arial", 9)).pack(side="left", padx=5)
         
+        # Run the steps as a program on the controller instead of from the PC
+        program_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(dialog, text="Run steps on the controller (DMC program)", variable=program_var,
+                      bg='#1a1a1a', fg='#ffffff', selectcolor='#1a1a1a',
+                      font=("Arial", 9)).pack(pady=(10, 0))
+        
+        # Move the selected axes at the same time, except those that must not move together
+        concurrent_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(dialog, text="Test axes concurrently", variable=concurrent_var,
+                      bg='#1a1a1a', fg='#ffffff', selectcolor='#1a1a1a',
+                      font=("Arial", 9)).pack()
+        tk.Label(dialog, text="Axes that must not move together (e.g. AB CD):", bg='#1a1a1a', fg='#ffffff', 
+                font=("Arial", 10)).pack(pady=5)
+        exclusive_entry = tk.Entry(dialog, width=20, bg='#1a1a1a', fg='#ffffff', insertbackground='#ffffff')
+        exclusive_entry.insert(0, " ".join(self.config.get("exclusive_axis_groups", [])))
+        exclusive_entry.pack(pady=5)
+        
         result = {}
         
         def apply_config():
@@ -2057,6 +2250,16 @@ class GalilSetupApp:
                 result['delay'] = float(delay_entry.get())
                 result['speed'] = int(speed_entry.get())
                 result['axes'] = [axis for axis, var in axis_vars.items() if var.get()]
+                result['controller_program'] = program_var.get()
+                result['concurrent'] = concurrent_var.get()
+                groups = [group for group in re.split(r"[\s,;]+", exclusive_entry.get().upper()) if group]
+                if any(len(group) < 2 or set(group) - set("ABCD") for group in groups):
+                    messagebox.showerror("Error", "Exclusive axis groups are two or more of A-D, e.g. AB CD.")
+                    return
+                result['exclusive_groups'] = groups
+                if groups != self.config.get("exclusive_axis_groups", []):
+                    self.config["exclusive_axis_groups"] = groups
+                    save_config(self.config)
                 
                 if not result['axes']:
                     messagebox.showerror("Error", "Please select at least one axis to test.")
@@ -2104,28 +2307,42 @@ class GalilSetupApp:
             
             # Reset stop flag
             self._stop_test = False
+            self._stop_event.clear()
+            tested = "".join(axis for axis in RECORD_AXES if axis in axes_to_test)
+            self._test_halt = halt_commands(tested) if test_config.get('controller_program') else [f"ST{tested}"]
             
             # Get current positions
             current_positions = {}
             try:
-                response = self.controller.send_command("TP")
-                if response:
-                    positions = response.split(',')
-                    if len(positions) >= 4:
-                        for i, axis in enumerate(["A", "B", "C", "D"]):
-                            try:
-                                current_positions[axis] = int(positions[i])
-                            except (ValueError, IndexError):
-                                current_positions[axis] = 0
+                record = self.controller.read_data_record()
+                for axis, axis_record in zip(RECORD_AXES, record.axes):
+                    current_positions[axis] = axis_record.position
             except Exception:
                 for axis in ["A", "B", "C", "D"]:
                     current_positions[axis] = 0
             
-            # Test each selected axis
-            for axis in axes_to_test:
-                if self._stop_test:
-                    break
-                self._test_single_axis(axis, current_positions[axis], total_distance, step_size, delay_ms, speed)
+            # Axes run at the same time unless an exclusive group keeps them apart;
+            # one group holding every axis tests them one after another
+            if test_config.get('concurrent'):
+                exclusive_groups = test_config.get('exclusive_groups', [])
+            else:
+                exclusive_groups = ["".join(axes_to_test)]
+            
+            test_started = time.time()
+            if test_config.get('controller_program'):
+                samples = self._test_axes_program(axes_to_test, current_positions, total_distance, step_size,
+                                                  delay_ms, speed, exclusive_groups)
+            else:
+                samples = []
+                for round_axes in schedule_axes(axes_to_test, exclusive_groups):
+                    if self._stop_test:
+                        break
+                    self._test_axes_concurrently(round_axes, current_positions, total_distance, step_size,
+                                                 delay_ms, speed, samples)
+            
+            self._store_test_run("step_program" if test_config.get('controller_program') else "host",
+                                 "automated test", samples, duration_s=time.time() - test_started,
+                                 started=test_started, details=dict(test_config, stopped=self._stop_test))
             
             # Show completion message
             if not self._stop_test:
@@ -2136,19 +2353,77 @@ class GalilSetupApp:
             error_msg = str(e)
             self.root.after(0, lambda: messagebox.showerror("Test Error", f"Error during automated test: {error_msg}"))
     
-    def _test_single_axis(self, axis, start_position, total_distance, step_size, delay_ms, speed):
-        """Test a single axis with the movement pattern."""
+    def _test_axes_program(self, axes, start_positions, total_distance, step_size, delay_ms, speed, exclusive_groups):
+        """Test axes with the movement pattern run as DMC programs on the controller, one thread per axis."""
+        axis_targets = {axis: step_targets(start_positions[axis], total_distance, step_size) for axis in axes}
+        
+        def progress(axis, done, total):
+            if done:
+                self.root.after(0, self.visualizer.update_position, axis, axis_targets[axis][done - 1])
+        
+        results = run_step_programs(self.controller, axis_targets, speed, delay_ms, exclusive_groups,
+                                    should_stop=lambda: self._stop_test, progress=progress)
+        samples = [(axis, step, target, position, None)
+                   for axis, result in results.items()
+                   for step, (target, position) in enumerate(zip(result.targets, result.positions))]
+        
+        def report():
+            for axis, result in results.items():
+                if not result.positions:
+                    continue
+                self.visualizer.update_position(axis, result.positions[-1])
+                worst = max(result.errors, key=abs)
+                self.log_status(f"Axis {axis} step test: {len(result.positions)}/{len(result.targets)} steps, "
+                                f"worst settling error {worst} counts")
+            self.update_position_display()
+        
+        self.root.after(0, report)
+        return samples
+    
+    def _test_axes_concurrently(self, axes, start_positions, total_distance, step_size, delay_ms, speed, samples=None):
+        """Run the host-driven test on several axes at once, one thread per axis."""
+        if len(axes) == 1:
+            self._test_single_axis(axes[0], start_positions[axes[0]], total_distance, step_size, delay_ms, speed,
+                                   samples)
+            return
+        
+        errors = {}
+        
+        def run(axis):
+            try:
+                self._test_single_axis(axis, start_positions[axis], total_distance, step_size, delay_ms, speed,
+                                       samples)
+            except Exception as e:
+                errors[axis] = e
+        
+        threads = [threading.Thread(target=run, args=(axis,), daemon=True, name=f"axis-test-{axis}")
+                   for axis in axes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise RuntimeError("; ".join(f"axis {axis}: {e}" for axis, e in sorted(errors.items())))
+    
+    def _test_single_axis(self, axis, start_position, total_distance, step_size, delay_ms, speed, samples=None):
+        """
+        Test a single axis with the movement pattern. If samples is a list, one
+        (axis, step, commanded, actual, seconds) tuple is appended per completed move.
+        """
         error_count = 0
         max_errors = 10  # Maximum consecutive errors before stopping
+        step_index = 0
         
         try:
-            # Stop any current motion
-            self.controller.send_command("ST")
-            self.root.after(delay_ms)
+            # Stop any current motion on this axis (others may be under test concurrently)
+            self.controller.send_command(f"ST{axis}")
+            if self._stop_event.wait(delay_ms / 1000.0):
+                return
             
             # Servo on the axis
             self.controller.send_command(f"SH{axis}")
-            self.root.after(delay_ms)
+            if self._stop_event.wait(delay_ms / 1000.0):
+                return
             
             # Set speed for precise movements
             self.controller.send_command(f"SP{axis}={speed}")
@@ -2181,98 +2456,47 @@ class GalilSetupApp:
                     
                     # Move to next position - use absolute positioning
                     try:
+                        step_started = time.perf_counter()
+                        
                         # Stop any current motion first
-                        self.controller.send_command("ST")
-                        self.root.after(100)
+                        self.controller.send_command(f"ST{axis}")
+                        if self._stop_event.wait(0.1):
+                            return
                         
                         # Ensure servo is on
                         self.controller.send_command(f"SH{axis}")
-                        self.root.after(100)
+                        if self._stop_event.wait(0.1):
+                            return
                         
                         # Set speed for this movement
                         self.controller.send_command(f"SP{axis}={speed}")
-                        self.root.after(50)
+                        if self._stop_event.wait(0.05):
+                            return
                         
-                        # Send position command with proper spacing - try different formats
-                        movement_success = False
+                        # Send position command using the syntax this firmware accepts
+                        self.capabilities.run("move_absolute", axis=axis, position=next_pos)
                         
-                        # Try format 1: PA {axis}={pos}
+                        # Wait for the move to complete (5 seconds max); the record read
+                        # on completion also carries the settled position
                         try:
-                            self.controller.send_command(f"PA {axis}={next_pos}")
-                            self.root.after(50)
-                            self.controller.send_command(f"BG {axis}")
-                            movement_success = True
-                        except Exception as e1:
-                            if "question mark" in str(e1).lower():
-                                # Try format 2: PA{axis}={pos}
-                                try:
-                                    self.controller.send_command(f"PA{axis}={next_pos}")
-                                    self.root.after(50)
-                                    self.controller.send_command(f"BG{axis}")
-                                    movement_success = True
-                                except Exception as e2:
-                                    if "question mark" in str(e2).lower():
-                                        # Try format 3: PA {axis} {pos}
-                                        try:
-                                            self.controller.send_command(f"PA {axis} {next_pos}")
-                                            self.root.after(50)
-                                            self.controller.send_command(f"BG {axis}")
-                                            movement_success = True
-                                        except Exception as e3:
-                                            raise e3  # Re-raise the last error
-                                    else:
-                                        raise e2
-                            else:
-                                raise e1
-                        
-                        if not movement_success:
-                            raise Exception("All command formats failed")
+                            record = self.controller.wait_motion_complete(axis, timeout=5.0)
+                        except Exception:
+                            record = None
                         
-                        # Wait for movement to complete by checking if axis is still moving
-                        max_wait_time = 5000  # 5 seconds max wait
-                        wait_count = 0
-                        while wait_count < max_wait_time:
-                            # Check if user wants to stop during wait
-                            if hasattr(self, '_stop_test') and self._stop_test:
-                                return
-                            
-                            try:
-                                # Check if axis is still moving
-                                response = self.controller.send_command("MG _BG")
-                                if response and axis not in response:
-                                    break  # Axis has stopped moving
-                            except:
-                                break
-                            
-                            # Small delay while checking
-                            self.root.after(50)
-                            wait_count += 50
+                        # Check if user wants to stop (stop_automated_test ends the move early)
+                        if hasattr(self, '_stop_test') and self._stop_test:
+                            return
                         
-                        # Verify position was reached
-                        try:
-                            actual_response = self.controller.send_command("TP")
-                            if actual_response:
-                                positions = actual_response.split(',')
-                                if len(positions) >= 4:
-                                    axis_index = {"A": 0, "B": 1, "C": 2, "D": 3}.get(axis, 0)
-                                    try:
-                                        actual_pos = int(positions[axis_index])
-                                        # Update display with actual position
-                                        self.visualizer.update_position(axis, actual_pos)
-                                        self.update_position_display()
-                                    except (ValueError, IndexError):
-                                        # If we can't read actual position, use expected
-                                        self.visualizer.update_position(axis, next_pos)
-                                        self.update_position_display()
-                                else:
-                                    self.visualizer.update_position(axis, next_pos)
-                                    self.update_position_display()
-                            else:
-                                self.visualizer.update_position(axis, next_pos)
-                                self.update_position_display()
-                        except:
-                            self.visualizer.update_position(axis, next_pos)
-                            self.update_position_display()
+                        # Update display with actual position, or expected if it could not be read
+                        if record is not None:
+                            self.root.after(0, self.visualizer.update_position, axis, record.axis(axis).position)
+                            if samples is not None:
+                                samples.append((axis, step_index, next_pos, record.axis(axis).position,
+                                                time.perf_counter() - step_started))
+                            step_index += 1
+                        else:
+                            self.root.after(0, self.visualizer.update_position, axis, next_pos)
+                        self.root.after(0, self.update_position_display)
                         
                     except Exception as e:
                         # If movement fails, log error and continue with next position
@@ -2290,76 +2514,41 @@ class GalilSetupApp:
                             current_pos = next_pos  # Move to next position anyway
                         continue
                     
-                    # Wait specified delay
-                    self.root.after(delay_ms)
+                    # Wait specified delay; a stop request ends the wait at once
+                    if self._stop_event.wait(delay_ms / 1000.0):
+                        return
                     
                     current_pos = next_pos
             
             # Return to original position
             try:
                 # Stop any current motion
-                self.controller.send_command("ST")
-                self.root.after(100)
+                self.controller.send_command(f"ST{axis}")
+                if self._stop_event.wait(0.1):
+                    return
                 
                 # Ensure servo is on
                 self.controller.send_command(f"SH{axis}")
-                self.root.after(100)
+                if self._stop_event.wait(0.1):
+                    return
                 
                 # Set speed
                 self.controller.send_command(f"SP{axis}={speed}")
-                self.root.after(50)
-                
-                # Send position command with proper spacing - try different formats
-                movement_success = False
-                
-                # Try format 1: PA {axis}={pos}
-                try:
-                    self.controller.send_command(f"PA {axis}={start_position}")
-                    self.root.after(50)
-                    self.controller.send_command(f"BG {axis}")
-                    movement_success = True
-                except Exception as e1:
-                    if "question mark" in str(e1).lower():
-                        # Try format 2: PA{axis}={pos}
-                        try:
-                            self.controller.send_command(f"PA{axis}={start_position}")
-                            self.root.after(50)
-                            self.controller.send_command(f"BG{axis}")
-                            movement_success = True
-                        except Exception as e2:
-                            if "question mark" in str(e2).lower():
-                                # Try format 3: PA {axis} {pos}
-                                try:
-                                    self.controller.send_command(f"PA {axis} {start_position}")
-                                    self.root.after(50)
-                                    self.controller.send_command(f"BG {axis}")
-                                    movement_success = True
-                                except Exception as e3:
-                                    raise e3  # Re-raise the last error
-                            else:
-                                raise e2
-                    else:
-                        raise e1
+                if self._stop_event.wait(0.05):
+                    return
                 
-                if not movement_success:
-                    raise Exception("All command formats failed")
+                # Send position command using the syntax this firmware accepts
+                self.capabilities.run("move_absolute", axis=axis, position=start_position)
                 
                 # Wait for final movement to complete
-                max_wait_time = 5000
-                wait_count = 0
-                while wait_count < max_wait_time:
-                    try:
-                        response = self.controller.send_command("MG _BG")
-                        if response and axis not in response:
-                            break
-                    except:
-                        break
-                    self.root.after(50)
-                    wait_count += 50
+                try:
+                    self.controller.wait_motion_complete(axis, timeout=5.0)
+                except Exception:
+                    pass
                 
                 # Update final position
-                self.visualizer.update_position(axis, start_position)
-                self.update_position_display()
+                self.root.after(0, self.visualizer.update_position, axis, start_position)
+                self.root.after(0, self.update_position_display)
                 
             except Exception as e:
                 print(f"Error returning to start position: {str(e)}")
@@ -2367,21 +2556,242 @@ class GalilSetupApp:
         except Exception as e:
             # Stop motion on error
             try:
-                self.controller.send_command("ST")
+                self.controller.send_command(f"ST{axis}")
             except:
                 pass
             raise e
     
+    def run_test_plan(self):
+        """Run a test plan from test_plans.json."""
+        if not getattr(self.controller, "g", None):
+            messagebox.showerror("Connection Error", "Controller not connected. Please click Connect first.")
+            return
+        
+        try:
+            plans = load_test_plans()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Test Plan Error", f"Could not load test plans: {str(e)}")
+            return
+        if not plans:
+            messagebox.showerror("Test Plan Error", "test_plans.json contains no plans.")
+            return
+        
+        name = simpledialog.askstring("Run Test Plan", "Plan to run:\n" + "\n".join(plans),
+                                      initialvalue=next(iter(plans)), parent=self.root)
+        if not name:
+            return
+        if name not in plans:
+            messagebox.showerror("Test Plan Error", f"No test plan named {name}.")
+            return
+        
+        self._stop_test = False
+        self._stop_event.clear()
+        self._test_halt = [f"ST{''.join(plans[name]['axes'])}"]
+        self.log_status(f"Running test plan {name}")
+        threading.Thread(target=self._run_test_plan_thread, args=(plans[name],), daemon=True).start()
+    
+    def _run_test_plan_thread(self, plan):
+        """Run a test plan in a separate thread and report the result on the Tk thread."""
+        runner = PlanRunner(self.controller, should_stop=lambda: self._stop_test)
+        try:
+            result = runner.run(plan)
+        except Exception as e:
+            error_msg = str(e)
+            self.root.after(0, lambda: messagebox.showerror("Test Plan Error", f"Error running test plan: {error_msg}"))
+            return
+        details = {key: result[key] for key in ("description", "stopped", "phases")}
+        details["failures"] = [f"{step['path']}: {failure}" for step in result["steps"] for failure in step["failures"]]
+        self._store_test_run("plan", result["plan"], result_samples(result), passed=result["passed"],
+                             duration_s=result["duration_s"], details=details)
+        self.root.after(0, self._report_test_plan, result)
+    
+    def run_repeatability_test(self):
+        """Measure repeatability and backlash of the selected axis around its current position."""
+        if not getattr(self.controller, "g", None):
+            messagebox.showerror("Connection Error", "Controller not connected. Please click Connect first.")
+            return
+        
+        axis = self.selected_axis.get()
+        offsets = simpledialog.askstring(
+            "Repeatability Test",
+            f"Target positions for axis {axis}, in counts relative to the current position:",
+            initialvalue="-20000, -10000, 0, 10000, 20000", parent=self.root)
+        if not offsets:
+            return
+        try:
+            offsets = [int(value) for value in offsets.replace(",", " ").split()]
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Target positions must be whole numbers of counts.")
+            return
+        overshoot = simpledialog.askinteger("Repeatability Test", "Overshoot before each approach (counts):",
+                                            initialvalue=2000, minvalue=1, parent=self.root)
+        if overshoot is None:
+            return
+        cycles = simpledialog.askinteger("Repeatability Test", "Bidirectional cycles:",
+                                         initialvalue=DEFAULT_CYCLES, minvalue=2, parent=self.root)
+        if cycles is None:
+            return
+        
+        try:
+            start = self.controller.command_int(f"TP{axis}")
+        except Exception as e:
+            messagebox.showerror("Repeatability Test Error", f"Could not read axis {axis} position: {str(e)}")
+            return
+        self._stop_test = False
+        self._stop_event.clear()
+        self._test_halt = halt_commands(axis)
+        self.log_status(f"Repeatability test on axis {axis}: {len(offsets)} targets, {cycles} cycles")
+        threading.Thread(target=self._run_repeatability_thread,
+                         args=(axis, [start + offset for offset in offsets], overshoot, cycles),
+                         daemon=True).start()
+    
+    def _run_repeatability_thread(self, axis, positions, overshoot, cycles):
+        """Run a repeatability test in a separate thread and report the result on the Tk thread."""
+        started = time.time()
+        try:
+            results, runs = run_repeatability(self.controller, {axis: positions}, overshoot, cycles,
+                                              should_stop=lambda: self._stop_test)
+        except Exception as e:
+            error_msg = str(e)
+            self.root.after(0, lambda: messagebox.showerror("Repeatability Test Error",
+                                                            f"Error running repeatability test: {error_msg}"))
+            return
+        result, run = results[axis], runs[axis]
+        samples = [(axis, step, target, actual, None)
+                   for step, (target, actual) in enumerate(zip(run.targets, run.positions))]
+        details = {"positions": positions, "overshoot": overshoot, "cycles": cycles,
+                   "stopped": not run.completed,
+                   "statistics": None if result is None else result._asdict()}
+        self._store_test_run("repeatability", f"axis {axis}", samples,
+                             duration_s=time.time() - started, started=started, details=details)
+        self.root.after(0, self._report_repeatability, axis, result)
+    
+    def _report_repeatability(self, axis, result):
+        """Log a repeatability result and offer its backlash compensation for the axis preset."""
+        self.update_position_display()
+        if result is None:
+            self.log_status(f"Repeatability test on axis {axis} ended before two complete cycles")
+            return
+        summary = format_repeatability(result)
+        for line in summary.splitlines():
+            self.log_status(line)
+        current = self.config["axis_presets"][axis].get("backlash_compensation", 0)
+        if messagebox.askyesno("Repeatability Test",
+                               f"{summary}\n\nStore {result.suggested_backlash} counts as the backlash "
+                               f"compensation of the axis {axis} preset (currently {current})?"):
+            apply_compensation(self.config, axis, result.suggested_backlash)
+            save_config(self.config)
+            self.log_success(f"Axis {axis} preset backlash compensation set to {result.suggested_backlash} counts")
+    
+    def run_soak_test(self):
+        """Cycle axes back and forth for hours, reporting rolling statistics as it runs."""
+        if not getattr(self.controller, "g", None):
+            messagebox.showerror("Connection Error", "Controller not connected. Please click Connect first.")
+            return
+        
+        axes = simpledialog.askstring("Soak Test", "Axes to cycle (e.g. AB):",
+                                      initialvalue=self.selected_axis.get(), parent=self.root)
+        if not axes:
+            return
+        axes = "".join(axis for axis in RECORD_AXES if axis in axes.upper())
+        if not axes:
+            messagebox.showerror("Invalid Input", "Enter one or more of the axes A, B, C and D.")
+            return
+        hours = simpledialog.askfloat("Soak Test", "Duration (hours):", initialvalue=24.0,
+                                      minvalue=0.01, parent=self.root)
+        if hours is None:
+            return
+        distance = simpledialog.askinteger("Soak Test", "Travel per stroke (counts):", initialvalue=20000,
+                                           minvalue=2, parent=self.root)
+        if distance is None:
+            return
+        
+        self._stop_test = False
+        self._stop_event.clear()
+        self._test_halt = [f"ST{axes}"]
+        self.log_status(f"Soak test on axes {axes} for {hours:g} h, {distance} counts per stroke")
+        threading.Thread(target=self._run_soak_thread, args=(axes, distance, hours), daemon=True).start()
+    
+    def _run_soak_thread(self, axes, distance, hours):
+        """Run a soak test in a separate thread; status reports are logged on the Tk thread."""
+        started = time.time()
+        soak = SoakTest(self.controller, axes, distance, duration_s=hours * 3600.0,
+                        should_stop=lambda: self._stop_test,
+                        report=lambda status: self.root.after(0, self._report_soak, status))
+        try:
+            status = soak.run()
+        except Exception as e:
+            error_msg = str(e)
+            self.root.after(0, lambda: messagebox.showerror("Soak Test Error", f"Error running soak test: {error_msg}"))
+            return
+        details = {"axes": axes, "distance": distance, "hours": hours, "cycles": status.cycles,
+                   "cycles_per_hour": status.cycles_per_hour, "stopped": self._stop_test,
+                   "failures": status.failures, "reason": status.reason,
+                   "windows": {metric: window._asdict() for metric, window in status.windows.items()},
+                   "trends": status.trends, "spill_files": list(soak.spill.files)}
+        self._store_test_run("soak", f"axes {axes}", [], duration_s=status.elapsed_s,
+                             started=started, details=details)
+        self.root.after(0, self._report_soak, status)
+    
+    def _report_soak(self, status):
+        """Log a soak test status report."""
+        for line in format_soak_status(status):
+            self.log_status(line)
+    
+    def _store_test_run(self, kind, name, samples, passed=None, duration_s=None, started=None, details=None):
+        """Queue a test run for the results database; writing happens in the background."""
+        if self.results is None:
+            return
+        try:
+            serial, firmware = controller_identity(self.controller)
+            self.results.record_run(kind, name, serial, samples, passed=passed, duration_s=duration_s,
+                                    firmware=firmware, address=self.controller.address,
+                                    started=started, details=details)
+        except Exception as e:
+            # Called from test threads; the log belongs to the Tk thread
+            self.root.after(0, self.log_error, f"Could not record test results: {str(e)}")
+    
+    def show_result_trends(self):
+        """Log the position error distribution of the selected axis over the last 90 days."""
+        if self.results is None:
+            messagebox.showerror("Results Error", "The test results database is not available.")
+            return
+        if not getattr(self.controller, "g", None):
+            messagebox.showerror("Connection Error", "Controller not connected. Please click Connect first.")
+            return
+        
+        axis = self.selected_axis.get()
+        serial, _ = controller_identity(self.controller)
+        distribution = self.results.error_distribution(axis, serial, days=90)
+        if distribution is None:
+            self.log_info(f"No stored test results for axis {axis} on controller {serial or 'unknown'}")
+            return
+        self.log_status(f"Axis {axis} on controller {serial}, last 90 days: {distribution.count} steps, "
+                        f"mean error {distribution.mean:+.1f}, std {distribution.std:.1f}, "
+                        f"p95 {distribution.p95}, p99 {distribution.p99}, "
+                        f"range [{distribution.minimum}, {distribution.maximum}] counts")
+    
+    def _report_test_plan(self, result):
+        """Log a test plan result and show its summary."""
+        summary = format_result(result)
+        for line in summary.splitlines():
+            self.log_status(line)
+        self.update_position_display()
+        if not result["stopped"]:
+            title = "Test Plan Passed" if result["passed"] else "Test Plan Failed"
+            messagebox.showinfo(title, summary)
+    
     def stop_automated_test(self):
         """Stop the automated test."""
         self._stop_test = True
+        self._stop_event.set()
         try:
-            # Stop all motion
-            self.controller.send_command("ST")
+            # Halt only the test's own program threads and axes, ahead of queued test traffic
+            self.controller.send_batch(self._test_halt, priority=PRIORITY_STOP)
             # Wait a moment for stop to take effect
             self.root.after(100)
-            # Stop again to ensure all axes are stopped
-            self.controller.send_command("ST")
+            # Stop again to ensure the test's axes are stopped
+            self.controller.send_batch(self._test_halt[-1:], priority=PRIORITY_STOP)
         except Exception as e:
             print(f"Error stopping motion: {str(e)}")
         
@@ -2541,32 +2951,8 @@ class GalilSetupApp:
             # Move 1mm in positive direction
             target_pos = current_pos + 1000  # 1mm = 1000 encoder units
             
-            # Send movement command with proper spacing - try different formats
-            try:
-                # Try PA command first
-                self.controller.send_command(f"PA {axis}={target_pos}")
-                self.root.after(50)
-                self.controller.send_command(f"BG {axis}")
-            except Exception as e:
-                if "question mark" in str(e).lower():
-                    # Try alternative command format
-                    try:
-                        self.controller.send_command(f"PA{axis}={target_pos}")
-                        self.root.after(50)
-                        self.controller.send_command(f"BG{axis}")
-                    except Exception as e2:
-                        if "question mark" in str(e2).lower():
-                            # Try with different spacing
-                            try:
-                                self.controller.send_command(f"PA {axis} {target_pos}")
-                                self.root.after(50)
-                                self.controller.send_command(f"BG {axis}")
-                            except Exception as e3:
-                                raise e3  # Re-raise the last error
-                        else:
-                            raise e2
-                else:
-                    raise e
+            # Send movement command using the syntax this firmware accepts
+            self.capabilities.run("move_absolute", axis=axis, position=target_pos)
             
             # Wait for movement
             self.root.after(1000)
@@ -2909,3 +3295,8 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = GalilSetupApp(root)
     root.mainloop()
+    if getattr(app, "sampler", None) is not None:
+        app.sampler.stop()
+    # Write any test results still queued
+    if getattr(app, "results", None) is not None:
+        app.results.close()
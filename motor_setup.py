@@ -23,30 +23,51 @@ def tune_axis(controller, axis, kp, ki, kd):
     logger.info(f"[TUNE] Axis {axis}: KP={kp}, KI={ki}, KD={kd}")
 
     try:
-        # Stop axis
-        controller.send_command(f"ST{axis}")
-
-        # Set PID
-        controller.send_command(f"KP{axis}={kp}")
-        controller.send_command(f"KI{axis}={ki}")
-        controller.send_command(f"KD{axis}={kd}")
-
-        # Servo on - use axis letter (no space)
-        controller.send_command(f"SH{axis}")
-
-        # Jog zero speed (no move)
-        controller.send_command(f"JG{axis}=0")
-
-        # Begin (applies servo-on / keeps it alive)
-        controller.send_command(f"BG{axis}")
+        controller.send_batch([
+            # Stop axis
+            f"ST{axis}",
+            # Set PID
+            f"KP{axis}={kp}",
+            f"KI{axis}={ki}",
+            f"KD{axis}={kd}",
+            # Servo on - use axis letter (no space)
+            f"SH{axis}",
+            # Jog zero speed (no move)
+            f"JG{axis}=0",
+            # Begin (applies servo-on / keeps it alive)
+            f"BG{axis}",
+        ])
 
         logger.info(f"[TUNE] Axis {axis} tune sequence complete")
     except Exception as e:
         raise RuntimeError(f"Error tuning axis {axis}: {e}")
 
+def preset_parameters(preset):
+    """
+    Convert a preset dictionary to {opcode: value} for KP/KI/KD/SP/AC/DC/TL.
+    """
+    parameters = {}
+    if "kp" in preset:
+        parameters["KP"] = float(preset['kp'])
+    if "ki" in preset:
+        parameters["KI"] = float(preset['ki'])
+    if "kd" in preset:
+        parameters["KD"] = float(preset['kd'])
+    if "sp" in preset:
+        parameters["SP"] = int(float(preset['sp']))
+    if "ac" in preset:
+        parameters["AC"] = int(float(preset['ac']))
+    if "dc" in preset:
+        parameters["DC"] = int(float(preset['dc']))
+    if "tl" in preset:
+        parameters["TL"] = float(preset['tl'])
+    return parameters
+
 def configure_axis(controller, axis, preset):
     """
     Apply a stored preset dictionary to the axis (KP/KI/KD/SP/AC/DC/TL).
+    Only values that differ from what was last written are sent; returns the
+    commands that were.
     """
     axis = axis.upper()
     
@@ -54,21 +75,28 @@ def configure_axis(controller, axis, preset):
     if axis not in SERVO_BITS:
         raise ValueError(f"Invalid axis '{axis}'. Must be one of {list(SERVO_BITS.keys())}")
     try:
-        if "kp" in preset:
-            controller.send_command(f"KP{axis}={float(preset['kp'])}")
-        if "ki" in preset:
-            controller.send_command(f"KI{axis}={float(preset['ki'])}")
-        if "kd" in preset:
-            controller.send_command(f"KD{axis}={float(preset['kd'])}")
-        if "sp" in preset:
-            controller.send_command(f"SP{axis}={int(float(preset['sp']))}")
-        if "ac" in preset:
-            controller.send_command(f"AC{axis}={int(float(preset['ac']))}")
-        if "dc" in preset:
-            controller.send_command(f"DC{axis}={int(float(preset['dc']))}")
-        if "tl" in preset:
-            controller.send_command(f"TL{axis}={float(preset['tl'])}")
+        sent = controller.apply_parameters({axis: preset_parameters(preset)})
 
-        logger.info(f"[CONFIG] Axis {axis} configured with preset {preset}")
+        logger.info(f"[CONFIG] Axis {axis} configured with preset {preset} ({len(sent)} changed)")
+        return sent
     except Exception as e:
         raise RuntimeError(f"Error configuring axis {axis}: {e}")
+
+def configure_axes(controller, presets):
+    """
+    Apply presets to several axes at once, e.g. the config's "axis_presets".
+    All axes share one batch, so four axes take a few round trips.
+    """
+    parameters = {}
+    for axis, preset in presets.items():
+        axis = axis.upper()
+        if axis not in SERVO_BITS:
+            raise ValueError(f"Invalid axis '{axis}'. Must be one of {list(SERVO_BITS.keys())}")
+        parameters[axis] = preset_parameters(preset)
+    try:
+        sent = controller.apply_parameters(parameters)
+
+        logger.info(f"[CONFIG] Axes {', '.join(presets)} configured ({len(sent)} changed)")
+        return sent
+    except Exception as e:
+        raise RuntimeError(f"Error configuring axes {', '.join(presets)}: {e}")
@@ -1,4 +1,3 @@
-import gclib
 import socket
 import struct
 from typing import Dict, List, Optional, Tuple
@@ -11,6 +10,7 @@ def discover_galil_controllers() -> Dict[str, str]:
         Dictionary mapping controller addresses to their information
     """
     try:
+        import gclib
         g = gclib.py()
         addresses = g.GAddresses()
         return addresses
@@ -135,6 +135,7 @@ def test_controller_connection(ip_address: str) -> Dict[str, any]:
     
     # Try to connect and get information
     try:
+        import gclib
         g = gclib.py()
         g.GOpen(ip_address)
         
@@ -0,0 +1,362 @@
+"""
+Declarative automated test plans.
+
+Plans live in test_plans.json next to config.json. A plan names the axes it
+uses and a list of steps:
+
+  {"type": "settings", "axes": {"A": {"SP": 5000, "AC": 256000}}}
+      Axis parameters, written only where they differ from what was last sent.
+  {"type": "command", "commands": ["SHA", "DPA=0"]}
+      Raw commands, sent as one batch.
+  {"type": "move", "axes": {"A": 1000}, "relative": true, "speed": 5000,
+   "timeout": 5.0, "tolerance": 20, "max_time": 1.0}
+      PA/PR and BG for every listed axis in one batch, then a wait for motion
+      to complete. Fails if a settled position is more than tolerance counts
+      from its target or the move takes longer than max_time seconds.
+  {"type": "dwell", "ms": 200}
+  {"type": "capture", "name": "home", "fields": ["position", "error"],
+   "limits": {"error": [-50, 50]}}
+      One data record; fails if a field of a plan axis is outside its limits.
+  {"type": "repeat", "count": 50, "steps": [...]}
+
+Every step may have a "name". Move and settings steps may only use the
+plan's axes. A command error, lost connection or timeout fails the step it
+happened in and ends the plan. PlanRunner times each phase (command,
+motion, capture, dwell) and returns a JSON-serialisable result record. Plans
+run the same way against hardware or a sim:// address, so they can be
+compared from the command line:
+
+    python plan_runner.py [plan ...] [--address sim://dmc4143?time_scale=10]
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from constants import SIM_DEFAULT_ADDRESS, TEST_PLANS_PATH
+from data_record import RECORD_AXES
+from galil_interface import PRIORITY_STOP, BatchCommandError
+
+logger = logging.getLogger(__name__)
+
+STEP_TYPES = ("settings", "command", "move", "dwell", "capture", "repeat")
+CAPTURE_FIELDS = ("position", "error", "velocity", "torque", "reference", "status", "stop_code")
+PHASES = ("command", "motion", "capture", "dwell")
+
+MOVE_TIMEOUT = 5.0  # seconds, unless a move step sets "timeout"
+# Controller errors that fail the current step and end the plan; the result is still returned
+STEP_ERRORS = (BatchCommandError, ConnectionError, TimeoutError, FutureTimeoutError)
+
+
+def _sweep_plan():
+    """The classic automated test: 0 -> +5 cm -> -5 cm -> 0 in 1 mm steps on axis A."""
+    def leg(count, step):
+        return {"type": "repeat", "count": count, "steps": [
+            {"type": "move", "axes": {"A": step}, "relative": True, "tolerance": 50},
+            {"type": "dwell", "ms": 100},
+        ]}
+    return {
+        "name": "step_sweep",
+        "description": "10 cm sweep in 1 mm steps, settling checked on every step",
+        "axes": ["A"],
+        "steps": [
+            {"type": "command", "name": "servo on", "commands": ["SHA"]},
+            {"type": "settings", "axes": {"A": {"SP": 5000}}},
+            dict(leg(50, 1000), name="out"),
+            dict(leg(100, -1000), name="back"),
+            dict(leg(50, 1000), name="return"),
+            {"type": "capture", "name": "final", "fields": ["position", "error"],
+             "limits": {"error": [-50, 50]}},
+        ],
+    }
+
+
+def _quick_plan():
+    return {
+        "name": "quick_check",
+        "description": "One out-and-back move per axis, all axes together",
+        "axes": ["A", "B", "C", "D"],
+        "steps": [
+            {"type": "command", "name": "servo on", "commands": ["SH"]},
+            {"type": "capture", "name": "start", "fields": ["position", "error"]},
+            {"type": "move", "name": "out", "axes": {a: 2000 for a in RECORD_AXES},
+             "relative": True, "speed": 10000, "tolerance": 20, "max_time": 2.0},
+            {"type": "dwell", "ms": 100},
+            {"type": "move", "name": "back", "axes": {a: -2000 for a in RECORD_AXES},
+             "relative": True, "speed": 10000, "tolerance": 20, "max_time": 2.0},
+            {"type": "capture", "name": "end", "fields": ["position", "error"],
+             "limits": {"error": [-20, 20]}},
+        ],
+    }
+
+
+default_plans = {"plans": [_quick_plan(), _sweep_plan()]}
+
+
+def load_test_plans(path=TEST_PLANS_PATH):
+    """
+    Plans by name, from path. A missing file is created with the default plans.
+    Raises ValueError if the file or a plan in it is malformed.
+    """
+    if not os.path.exists(path):
+        with open(path, "w") as f:
+            json.dump(default_plans, f, indent=4)
+    with open(path, "r") as f:
+        data = json.load(f)
+    plans = {}
+    for plan in data.get("plans", []):
+        validate_plan(plan)
+        plans[plan["name"]] = plan
+    return plans
+
+
+def validate_plan(plan):
+    """Raise ValueError describing the first problem in a plan."""
+    if not isinstance(plan, dict) or not plan.get("name"):
+        raise ValueError("Every test plan needs a name.")
+    axes = plan.get("axes", [])
+    if not axes or set(axes) - set(RECORD_AXES):
+        raise ValueError(f"Plan {plan['name']}: axes must be a non-empty list of {', '.join(RECORD_AXES)}.")
+    _validate_steps(plan["name"], set(axes), plan.get("steps"), "")
+
+
+def _validate_steps(name, axes, steps, prefix):
+    if not isinstance(steps, list) or not steps:
+        raise ValueError(f"Plan {name}: step list {prefix or 'steps'} is empty.")
+    for i, step in enumerate(steps):
+        where = f"Plan {name}, step {prefix}{i}"
+        kind = step.get("type") if isinstance(step, dict) else None
+        if kind not in STEP_TYPES:
+            raise ValueError(f"{where}: type must be one of {', '.join(STEP_TYPES)}.")
+        if kind in ("settings", "move"):
+            step_axes = step.get("axes")
+            if not isinstance(step_axes, dict) or not step_axes or set(step_axes) - set(RECORD_AXES):
+                raise ValueError(f"{where}: axes must map axis letters to values.")
+            if set(step_axes) - axes:
+                raise ValueError(f"{where}: axes {', '.join(sorted(set(step_axes) - axes))} are not in the plan's axes.")
+        elif kind == "command":
+            if not step.get("commands"):
+                raise ValueError(f"{where}: commands is empty.")
+        elif kind == "dwell":
+            if not isinstance(step.get("ms"), (int, float)) or step["ms"] < 0:
+                raise ValueError(f"{where}: ms must be a non-negative number.")
+        elif kind == "capture":
+            unknown = set(step.get("fields", CAPTURE_FIELDS)) | set(step.get("limits", {}))
+            if unknown - set(CAPTURE_FIELDS):
+                raise ValueError(f"{where}: fields must be among {', '.join(CAPTURE_FIELDS)}.")
+            for field, limit in step.get("limits", {}).items():
+                if (not isinstance(limit, (list, tuple)) or len(limit) != 2
+                        or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in limit)
+                        or limit[0] > limit[1]):
+                    raise ValueError(f"{where}: limits of {field} must be a numeric [low, high] pair.")
+        elif kind == "repeat":
+            if not isinstance(step.get("count"), int) or step["count"] < 1:
+                raise ValueError(f"{where}: count must be a positive integer.")
+            _validate_steps(name, axes, step.get("steps"), f"{prefix}{i}.")
+
+
+class PlanStopped(Exception):
+    """Raised inside the runner when should_stop() asks for the plan to end."""
+
+
+class PlanRunner:
+    """Executes test plans against a connected GalilController."""
+
+    def __init__(self, controller, should_stop=None, progress=None):
+        self.controller = controller
+        self.should_stop = should_stop
+        self.progress = progress  # progress(step_result) after every step
+        self._targets = {}
+
+    def run(self, plan):
+        """
+        Run a plan and return its result record. A controller error ends the
+        plan early; the record then has passed False and the error text in "error".
+        """
+        validate_plan(plan)
+        started = datetime.datetime.now()
+        start = time.perf_counter()
+        result = {
+            "plan": plan["name"],
+            "description": plan.get("description", ""),
+            "address": self.controller.address,
+            "started": started.isoformat(timespec="seconds"),
+            "passed": True,
+            "stopped": False,
+            "error": None,
+            "steps": [],
+        }
+        try:
+            # Relative moves are checked against where they were commanded to, so
+            # settling errors don't accumulate from one step into the next
+            record = self.controller.read_data_record()
+            self._targets = {axis: record.axis(axis).position for axis in plan["axes"]}
+            self._run_steps(plan, plan["steps"], "", result)
+        except PlanStopped:
+            result["stopped"] = True
+            result["passed"] = False
+        except STEP_ERRORS as e:
+            result["error"] = str(e) or type(e).__name__
+            result["passed"] = False
+            logger.warning(f"[PLAN] {plan['name']}: ended by {result['error']}")
+        result["duration_s"] = time.perf_counter() - start
+        result["phases"] = {phase: sum(step["phases"].get(phase, 0.0) for step in result["steps"])
+                            for phase in PHASES}
+        logger.info(f"[PLAN] {plan['name']}: {'PASS' if result['passed'] else 'FAIL'} "
+                    f"in {result['duration_s']:.2f} s")
+        return result
+
+    def _run_steps(self, plan, steps, prefix, result):
+        for i, step in enumerate(steps):
+            if step["type"] == "repeat":
+                for iteration in range(step["count"]):
+                    self._run_steps(plan, step["steps"], f"{prefix}{i}.{iteration}.", result)
+                continue
+            if self.should_stop is not None and self.should_stop():
+                raise PlanStopped()
+            step_result = {
+                "path": f"{prefix}{i}",
+                "type": step["type"],
+                "name": step.get("name", ""),
+                "phases": {},
+                "values": {},
+                "failures": [],
+            }
+            start = time.perf_counter()
+            error = None
+            try:
+                getattr(self, f"_step_{step['type']}")(plan, step, step_result)
+            except STEP_ERRORS as e:
+                error = e
+                step_result["failures"].append(str(e) or type(e).__name__)
+            step_result["duration_s"] = time.perf_counter() - start
+            step_result["passed"] = not step_result["failures"]
+            if not step_result["passed"]:
+                result["passed"] = False
+            result["steps"].append(step_result)
+            if self.progress is not None:
+                self.progress(step_result)
+            if error is not None:
+                raise error  # no further steps; run() records it on the plan
+
+    def _timed(self, step_result, phase, work, *args):
+        start = time.perf_counter()
+        try:
+            return work(*args)
+        finally:
+            step_result["phases"][phase] = step_result["phases"].get(phase, 0.0) + time.perf_counter() - start
+
+    # Steps ---------------------------------------------------------------
+
+    def _step_settings(self, plan, step, step_result):
+        sent = self._timed(step_result, "command", self.controller.apply_parameters, step["axes"])
+        step_result["values"]["sent"] = sent
+
+    def _step_command(self, plan, step, step_result):
+        step_result["values"]["responses"] = self._timed(
+            step_result, "command", self.controller.send_batch, step["commands"])
+
+    def _step_dwell(self, plan, step, step_result):
+        self._timed(step_result, "dwell", time.sleep, step["ms"] / 1000.0)
+
+    def _step_move(self, plan, step, step_result):
+        axes = "".join(axis for axis in RECORD_AXES if axis in step["axes"])
+        relative = step.get("relative", False)
+        commands = []
+        for axis in axes:
+            value = int(step["axes"][axis])
+            if "speed" in step:
+                commands.append(f"SP{axis}={int(step['speed'])}")
+            commands.append(f"{'PR' if relative else 'PA'}{axis}={value}")
+            self._targets[axis] = (self._targets.get(axis, 0) + value) if relative else value
+        commands.append(f"BG{axes}")
+        self._timed(step_result, "command", self.controller.send_batch, commands)
+        try:
+            record = self._timed(step_result, "motion", self.controller.wait_motion_complete,
+                                 axes, step.get("timeout", MOVE_TIMEOUT))
+        except TimeoutError:
+            # Don't leave the axes running under the steps that would follow
+            try:
+                self.controller.send_batch([f"ST{axes}"], priority=PRIORITY_STOP)
+            except STEP_ERRORS as e:
+                logger.warning(f"[PLAN] Could not stop axes {axes}: {e}")
+            raise
+        motion_time = step_result["phases"]["motion"]
+        if "max_time" in step and motion_time > step["max_time"]:
+            step_result["failures"].append(f"move took {motion_time:.3f} s, limit {step['max_time']} s")
+        for axis in axes:
+            position = record.axis(axis).position
+            target = self._targets[axis]
+            step_result["values"][axis] = {"target": target, "position": position}
+            tolerance = step.get("tolerance")
+            if tolerance is not None and abs(position - target) > tolerance:
+                step_result["failures"].append(
+                    f"axis {axis} settled at {position}, {position - target:+d} from {target}")
+
+    def _step_capture(self, plan, step, step_result):
+        record = self._timed(step_result, "capture", self.controller.read_data_record)
+        fields = step.get("fields", CAPTURE_FIELDS)
+        limits = step.get("limits", {})
+        for axis in plan["axes"]:
+            axis_record = record.axis(axis)
+            values = {field: getattr(axis_record, field) for field in fields}
+            step_result["values"][axis] = values
+            for field, (low, high) in limits.items():
+                value = getattr(axis_record, field)
+                if not low <= value <= high:
+                    step_result["failures"].append(f"axis {axis} {field} {value} outside [{low}, {high}]")
+
+
+def result_samples(result):
+    """(axis, step, commanded, actual, seconds) for every axis of every move in a result record."""
+    samples = []
+    moves = [step for step in result["steps"] if step["type"] == "move"]
+    for index, step in enumerate(moves):
+        for axis in RECORD_AXES:
+            values = step["values"].get(axis)
+            if values is not None:
+                samples.append((axis, index, values["target"], values["position"], step["duration_s"]))
+    return samples
+
+
+def format_result(result):
+    """Short text summary of a result record."""
+    phases = ", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in result["phases"].items() if seconds)
+    status = "STOPPED" if result["stopped"] else ("PASS" if result["passed"] else "FAIL")
+    lines = [f"{result['plan']}: {status} in {result['duration_s']:.2f} s ({phases})"]
+    if result.get("error"):
+        lines.append(f"  ended early: {result['error']}")
+    for step in result["steps"]:
+        for failure in step["failures"]:
+            label = f"{step['path']} {step['name']}".strip()
+            lines.append(f"  step {label}: {failure}")
+    return "\n".join(lines)
+
+
+def main():
+    from galil_interface import GalilController
+
+    parser = argparse.ArgumentParser(description="Run test plans and compare their runtimes.")
+    parser.add_argument("plans", nargs="*", help="plan names (default: all)")
+    parser.add_argument("--address", default=SIM_DEFAULT_ADDRESS, help="controller address or sim:// URL")
+    parser.add_argument("--file", default=TEST_PLANS_PATH, help="test plan file")
+    parser.add_argument("--json", action="store_true", help="print full result records")
+    args = parser.parse_args()
+
+    plans = load_test_plans(args.file)
+    names = args.plans or list(plans)
+    controller = GalilController()
+    controller.connect(args.address, keepalive=False)
+    try:
+        for name in names:
+            result = PlanRunner(controller).run(plans[name])
+            print(json.dumps(result, indent=2) if args.json else format_result(result))
+    finally:
+        controller.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Background position sampler.
+
+A daemon thread takes one data record per period on a monotonic-clock
+schedule and stores position, following error and velocity of every axis in
+a PositionRing. Streamed records (see GalilController.start_record_stream)
+are used when they are fresh; otherwise the sampler reads one with a
+low-priority QR. When the stream's callback is feed(), every pushed record
+goes into the ring (up to 1 kHz) and the sampler reads nothing itself; it
+only checks every STREAM_TIMEOUT that the stream is still coming, so it
+takes over within that time once the stream pauses. A slow controller
+only delays the sampler thread: the Tk loop reads the latest slot of the
+ring and never waits on the network.
+
+The schedule does not drift. Ticks are period apart on the monotonic
+clock, and ticks missed while a read was slow are skipped (and counted in
+overruns) rather than run in a burst.
+
+The rate adapts to what there is to see. While any axis moves the sampler
+runs at min_period; each idle sample doubles the period up to max_period.
+wake() returns to full rate at once; GalilController calls it through a
+motion listener whenever a BG or XQ is sent. Nothing is sent while the
+controller is disconnected or the sampler is paused (e.g. the window is
+minimized).
+"""
+import logging
+import threading
+import time
+from array import array
+
+from data_record import RECORD_AXES
+from galil_interface import PRIORITY_POLL
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_PERIOD = 0.02     # seconds between samples while moving (50 Hz)
+IDLE_PERIOD = 2.0        # longest period once every axis has been idle for a while
+IDLE_BACKOFF = 2.0       # period multiplier per idle sample
+STREAM_TIMEOUT = 0.1    # seconds without a fed record before the sampler reads its own
+RING_CAPACITY = 16384    # samples kept per axis (16 s of a 1 kHz stream, over 5 minutes at 50 Hz)
+RING_FIELDS = ("position", "error", "velocity")  # AxisRecord fields kept in the ring
+
+
+class PositionRing:
+    """
+    Preallocated ring of timestamped samples of every RING_FIELDS field of
+    every axis. Writers are serialised; any thread may read. A slot is filled
+    before count is advanced, so readers never see a half-written latest sample.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY, axes=RECORD_AXES):
+        self.capacity = capacity
+        self.axes = tuple(axes)
+        self.times = array("d", bytes(8 * capacity))  # time.monotonic() of each sample
+        self.values = {field: {axis: array("q", bytes(8 * capacity)) for axis in self.axes}
+                       for field in RING_FIELDS}
+        self.positions = self.values["position"]
+        self.count = 0  # samples written since creation
+        self._write_lock = threading.Lock()
+
+    def append(self, timestamp, record):
+        """Store one sample from a DataRecord."""
+        with self._write_lock:
+            slot = self.count % self.capacity
+            self.times[slot] = timestamp
+            for axis, axis_record in zip(self.axes, record.axes):
+                for field in RING_FIELDS:
+                    self.values[field][axis][slot] = getattr(axis_record, field)
+            self.count += 1
+
+    def latest(self):
+        """(timestamp, {axis: position}) of the newest sample, or None if empty."""
+        count = self.count
+        if not count:
+            return None
+        slot = (count - 1) % self.capacity
+        return self.times[slot], {axis: self.positions[axis][slot] for axis in self.axes}
+
+    def history(self, axis, samples=None, field="position"):
+        """(timestamps, values) of the newest samples of an axis as lists, oldest first."""
+        count = self.count
+        samples = min(count, self.capacity, self.capacity if samples is None else samples)
+        slots = [(count - samples + i) % self.capacity for i in range(samples)]
+        values = self.values[field][axis]
+        return [self.times[slot] for slot in slots], [values[slot] for slot in slots]
+
+    def since(self, start, field="position"):
+        """
+        Samples numbered start onwards that are still in the ring, as (number of
+        the first one returned, timestamps, {axis: values}), oldest first.
+        """
+        count = self.count
+        first = max(start, count - self.capacity, 0)
+        slots = [n % self.capacity for n in range(first, count)]
+        values = self.values[field]
+        return (first, [self.times[slot] for slot in slots],
+                {axis: [values[axis][slot] for slot in slots] for axis in self.axes})
+
+
+class PositionSampler:
+    """Fill a PositionRing from a GalilController at a fixed cadence on a daemon thread."""
+
+    def __init__(self, controller, min_period=SAMPLE_PERIOD, max_period=IDLE_PERIOD, ring=None):
+        self.controller = controller
+        self.min_period = min_period
+        self.max_period = max_period
+        self.period = min_period  # current period
+        self.ring = PositionRing() if ring is None else ring
+        self.overruns = 0  # ticks skipped because a read took longer than a period
+        self.paused = False
+        self._fed_at = float("-inf")  # monotonic time of the last record passed to feed()
+        self._stopped = False
+        self._wake = threading.Event()  # interrupts the wait for the next tick
+        self._thread = None
+        if hasattr(controller, "add_motion_listener"):
+            controller.add_motion_listener(self.wake)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="position-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def wake(self):
+        """Sample at full rate from now on, starting immediately."""
+        self.period = self.min_period
+        self._wake.set()
+
+    def pause(self):
+        """Stop sampling until resume(); the ring keeps its contents."""
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self.wake()
+
+    def latest(self):
+        """(timestamp, {axis: position}) of the newest sample, or None. Never blocks."""
+        return self.ring.latest()
+
+    def feed(self, record):
+        """Append a pushed DataRecord; meant as the data record stream callback."""
+        self._fed_at = time.monotonic()
+        self.ring.append(self._fed_at, record)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stopped:
+            if self.paused or not getattr(self.controller, "g", None):
+                # No I/O; only check back now and then for a connection
+                self._wake.wait(self.max_period)
+                self._wake.clear()
+                next_tick = time.monotonic()
+                continue
+            try:
+                moving = self._sample()
+            except Exception as e:
+                logger.debug(f"Position sample failed: {e}")
+            else:
+                if moving is None:
+                    # Fed by the stream; look again as soon as it could have gone stale
+                    self.period = max(self.min_period, STREAM_TIMEOUT)
+                else:
+                    self.period = (self.min_period if moving
+                                   else min(self.max_period, self.period * IDLE_BACKOFF))
+            next_tick += self.period
+            now = time.monotonic()
+            if now > next_tick:
+                missed = int((now - next_tick) / self.period) + 1
+                self.overruns += missed
+                next_tick += missed * self.period
+            if self._wake.wait(next_tick - now):
+                self._wake.clear()
+                next_tick = time.monotonic()
+
+    def _sample(self):
+        """Append one sample; returns True if any axis is moving, None if the stream is filling the ring."""
+        if time.monotonic() - self._fed_at < STREAM_TIMEOUT:
+            return None
+        record = self.controller.latest_data_record(max_age=self.min_period)
+        if record is None:
+            record = self.controller.read_data_record(PRIORITY_POLL)
+        self.ring.append(time.monotonic(), record)
+        return any(axis.moving for axis in record.axes)
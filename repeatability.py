@@ -0,0 +1,163 @@
+"""
+Repeatability and backlash measurement.
+
+Each target position is approached alternately from below and from above,
+over several cycles, following the linear cycle of ISO 230-2: the targets
+are visited in ascending order, each from an overshoot point below it, then
+in descending order, each from an overshoot point above it. The approach
+and measurement points run as one controller-side step program (see
+step_program), which records every settled _TP on the controller and
+uploads them in one transfer per axis.
+
+From the settled deviations (actual - target) of each target and direction:
+    repeatability_up / _down  4 sigma of the unidirectional deviations, worst target
+    repeatability             bidirectional repeatability, max(2 s_up + 2 s_down + |B|)
+    backlash                  mean reversal value B = mean_up - mean_down over all targets
+    hysteresis                largest |B| of any target
+    accuracy                  span of mean +/- 2 sigma over both directions and all targets
+NumPy is used for the statistics when it is installed.
+"""
+import logging
+import math
+from typing import List, NamedTuple
+
+from step_program import run_step_programs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CYCLES = 5
+MIN_CYCLES = 2  # standard deviations need at least two approaches per direction
+
+
+class RepeatabilityResult(NamedTuple):
+    """Repeatability statistics of one axis; all values in encoder counts."""
+    axis: str
+    positions: List[int]    # target positions, ascending
+    cycles: int             # complete bidirectional cycles measured
+    mean_up: List[float]    # mean deviation per target, approached in the positive direction
+    mean_down: List[float]  # the same, approached in the negative direction
+    repeatability_up: float
+    repeatability_down: float
+    repeatability: float
+    backlash: float
+    hysteresis: float
+    accuracy: float
+
+    @property
+    def suggested_backlash(self):
+        """Backlash compensation to apply on reversal, in counts."""
+        return int(round(-self.backlash))
+
+
+def bidirectional_targets(positions, overshoot, cycles=DEFAULT_CYCLES):
+    """
+    Step targets for cycles of bidirectional approaches to positions. Returns
+    (targets, measured) where measured lists the indexes of the targets that
+    are measurement points, in the order analyze() expects.
+    """
+    positions = sorted(set(int(p) for p in positions))
+    if not positions:
+        raise ValueError("At least one target position is needed.")
+    if overshoot <= 0:
+        raise ValueError("Overshoot must be positive.")
+    if cycles < MIN_CYCLES:
+        raise ValueError(f"At least {MIN_CYCLES} cycles are needed.")
+    targets, measured = [], []
+    for _ in range(cycles):
+        for direction, ordered in ((1, positions), (-1, positions[::-1])):
+            for position in ordered:
+                targets.append(position - direction * overshoot)
+                targets.append(position)
+                measured.append(len(targets) - 1)
+    return targets, measured
+
+
+def analyze(axis, positions, targets, settled, measured):
+    """
+    RepeatabilityResult of an axis from the settled positions of a run of
+    bidirectional_targets(positions, ...). settled may be shorter than targets
+    if the run was stopped; only complete cycles are used. Returns None if
+    fewer than MIN_CYCLES cycles completed.
+    """
+    positions = sorted(set(int(p) for p in positions))
+    per_cycle = 2 * len(positions)
+    done = sum(1 for index in measured if index < len(settled))
+    cycles = done // per_cycle
+    if cycles < MIN_CYCLES:
+        return None
+    measured = measured[:cycles * per_cycle]
+    deviations = [settled[i] - targets[i] for i in measured]
+    try:
+        import numpy
+    except ImportError:
+        stats = _statistics_python(deviations, cycles, len(positions))
+    else:
+        stats = _statistics_numpy(numpy, deviations, cycles, len(positions))
+    return RepeatabilityResult(axis, positions, cycles, *stats)
+
+
+def _statistics_numpy(numpy, deviations, cycles, count):
+    dev = numpy.asarray(deviations, dtype=float).reshape(cycles, 2, count)
+    up, down = dev[:, 0, :], dev[:, 1, ::-1]  # descending pass back into ascending order
+    mean_up, mean_down = up.mean(axis=0), down.mean(axis=0)
+    s_up, s_down = up.std(axis=0, ddof=1), down.std(axis=0, ddof=1)
+    reversal = mean_up - mean_down
+    bidirectional = numpy.maximum(2 * s_up + 2 * s_down + numpy.abs(reversal),
+                                  numpy.maximum(4 * s_up, 4 * s_down))
+    accuracy = (max((mean_up + 2 * s_up).max(), (mean_down + 2 * s_down).max())
+                - min((mean_up - 2 * s_up).min(), (mean_down - 2 * s_down).min()))
+    return (mean_up.tolist(), mean_down.tolist(), float(4 * s_up.max()), float(4 * s_down.max()),
+            float(bidirectional.max()), float(reversal.mean()), float(numpy.abs(reversal).max()),
+            float(accuracy))
+
+
+def _statistics_python(deviations, cycles, count):
+    def column(cycle_offset, index):
+        return [deviations[c * 2 * count + cycle_offset + index] for c in range(cycles)]
+
+    def mean_std(values):
+        mean = sum(values) / len(values)
+        return mean, math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1))
+
+    up = [mean_std(column(0, i)) for i in range(count)]
+    down = [mean_std(column(count, count - 1 - i)) for i in range(count)]
+    reversal = [u[0] - d[0] for u, d in zip(up, down)]
+    bidirectional = max(max(2 * u[1] + 2 * d[1] + abs(b), 4 * u[1], 4 * d[1])
+                        for u, d, b in zip(up, down, reversal))
+    accuracy = (max(m + 2 * s for m, s in up + down) - min(m - 2 * s for m, s in up + down))
+    return ([m for m, _ in up], [m for m, _ in down], 4 * max(s for _, s in up),
+            4 * max(s for _, s in down), bidirectional, sum(reversal) / count,
+            max(abs(b) for b in reversal), accuracy)
+
+
+def run_repeatability(controller, axis_positions, overshoot, cycles=DEFAULT_CYCLES, speed=20000,
+                      delay_ms=100, exclusive_groups=(), should_stop=None, progress=None):
+    """
+    Measure every axis in axis_positions ({axis: absolute target positions})
+    and return ({axis: RepeatabilityResult or None}, {axis: StepTestResult}).
+    The remaining arguments are those of step_program.run_step_programs().
+    """
+    plans = {axis: bidirectional_targets(positions, overshoot, cycles)
+             for axis, positions in axis_positions.items()}
+    runs = run_step_programs(controller, {axis: targets for axis, (targets, _) in plans.items()},
+                             speed, delay_ms, exclusive_groups, should_stop, progress)
+    results = {}
+    for axis, run in runs.items():
+        targets, measured = plans[axis]
+        results[axis] = analyze(axis, axis_positions[axis], targets, run.positions, measured)
+        if results[axis] is None:
+            logger.warning(f"[REPEAT] Axis {axis}: fewer than {MIN_CYCLES} complete cycles, no statistics")
+    return results, runs
+
+
+def format_result(result):
+    """Multi-line text summary of a RepeatabilityResult."""
+    lines = [
+        f"Axis {result.axis}: {len(result.positions)} targets x {result.cycles} cycles",
+        f"  Repeatability  {result.repeatability:8.1f}   (up {result.repeatability_up:.1f}, "
+        f"down {result.repeatability_down:.1f})",
+        f"  Backlash       {result.backlash:8.1f}   (hysteresis {result.hysteresis:.1f})",
+        f"  Accuracy       {result.accuracy:8.1f}",
+        f"  Suggested backlash compensation: {result.suggested_backlash} counts",
+    ]
+    return "\n".join(lines)
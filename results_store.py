@@ -0,0 +1,225 @@
+"""
+Local SQLite store for automated test results.
+
+Every run is one row in `runs`; every step of it is one row in `samples`
+holding the commanded and actual position, their difference and the step's
+time. Samples carry the controller serial and timestamp of their run so the
+(serial, axis, timestamp, error) index covers trend queries on its own, which
+keeps questions like "error distribution for axis C on this serial over the
+last 90 days" fast across hundreds of thousands of rows.
+
+Writes go through a queue to a background thread that commits them in
+batched transactions, so recording a run never waits on the disk.
+"""
+import json
+import logging
+import math
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple
+
+from constants import RESULTS_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_WINDOW = 0.2  # seconds the writer waits to gather more runs into one transaction
+WRITE_BATCH_SIZE = 100    # runs per transaction at most
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    serial TEXT NOT NULL,
+    firmware TEXT,
+    address TEXT,
+    kind TEXT NOT NULL,
+    name TEXT,
+    passed INTEGER,
+    duration_s REAL,
+    details TEXT
+);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    serial TEXT NOT NULL,
+    axis TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    step INTEGER NOT NULL,
+    commanded INTEGER,
+    actual INTEGER,
+    error INTEGER,
+    duration_s REAL
+);
+CREATE INDEX IF NOT EXISTS runs_serial_started ON runs (serial, started);
+CREATE INDEX IF NOT EXISTS samples_trend ON samples (serial, axis, timestamp, error);
+CREATE INDEX IF NOT EXISTS samples_run ON samples (run_id);
+"""
+
+
+class ErrorDistribution(NamedTuple):
+    """Position error (actual - commanded, counts) statistics for one axis."""
+    count: int
+    mean: float
+    std: float
+    minimum: int
+    maximum: int
+    p50: int
+    p95: int
+    p99: int
+    histogram: Dict[int, int]  # error -> number of samples
+
+
+def controller_identity(controller):
+    """(serial, firmware) of the connected controller, as far as it will say."""
+    identity = []
+    for query in ("MG _BN", "MG _FW"):
+        try:
+            identity.append(controller.send_command(query).strip())
+        except Exception:
+            identity.append("")
+    serial, firmware = identity
+    try:
+        serial = str(int(float(serial)))
+    except ValueError:
+        pass
+    return serial, firmware
+
+
+class ResultStore:
+    """Test results in a SQLite database, written from a background thread."""
+
+    def __init__(self, path=RESULTS_DB_PATH):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="results-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        # WAL lets queries read while the writer commits
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # Writing -------------------------------------------------------------
+
+    def record_run(self, kind, name, serial, samples, passed=None, duration_s=None,
+                   firmware="", address="", started=None, details=None):
+        """
+        Queue a run for writing and return at once. samples is a sequence of
+        (axis, step, commanded, actual, duration_s) tuples; duration_s may be None.
+        started is a time.time() value (default: now); details is any JSON-able value.
+        """
+        started = time.time() if started is None else started
+        run = (started, str(serial), firmware, address, kind, name,
+               None if passed is None else int(bool(passed)), duration_s,
+               None if details is None else json.dumps(details))
+        self._queue.put((run, list(samples)))
+
+    def flush(self):
+        """Block until every queued run has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Write what is queued and stop the writer."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + WRITE_BATCH_WINDOW
+                while batch[-1] is not None and len(batch) < WRITE_BATCH_SIZE:
+                    try:
+                        batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+                try:
+                    with conn:  # one transaction for the whole batch
+                        for item in batch:
+                            if item is not None:
+                                self._insert(conn, *item)
+                except sqlite3.Error as e:
+                    logger.error(f"Could not store {len(batch)} test run(s): {e}")
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                if batch[-1] is None:
+                    return
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _insert(conn, run, samples):
+        cursor = conn.execute(
+            "INSERT INTO runs (started, serial, firmware, address, kind, name, passed, duration_s, details)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", run)
+        run_id, started, serial = cursor.lastrowid, run[0], run[1]
+        conn.executemany(
+            "INSERT INTO samples (run_id, serial, axis, timestamp, step, commanded, actual, error, duration_s)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((run_id, serial, axis, started, step, commanded, actual,
+              None if commanded is None or actual is None else actual - commanded, duration)
+             for axis, step, commanded, actual, duration in samples))
+
+    # Queries -------------------------------------------------------------
+
+    def _query(self, sql, args):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+
+    def error_distribution(self, axis, serial, days=90):
+        """ErrorDistribution of an axis on a controller over the last days, or None without samples."""
+        rows = self._query(
+            "SELECT error, COUNT(*) FROM samples"
+            " WHERE serial = ? AND axis = ? AND timestamp >= ? AND error IS NOT NULL"
+            " GROUP BY error ORDER BY error",
+            (str(serial), axis, time.time() - days * 86400))
+        count = sum(n for _, n in rows)
+        if not count:
+            return None
+        mean = sum(error * n for error, n in rows) / count
+        variance = sum(n * (error - mean) ** 2 for error, n in rows) / count
+
+        def percentile(p):
+            target, seen = max(1, math.ceil(count * p / 100.0)), 0
+            for error, n in rows:
+                seen += n
+                if seen >= target:
+                    return error
+            return rows[-1][0]
+
+        return ErrorDistribution(count, mean, math.sqrt(variance), rows[0][0], rows[-1][0],
+                                 percentile(50), percentile(95), percentile(99), dict(rows))
+
+    def daily_trend(self, axis, serial, days=90):
+        """[(day start as time.time(), samples, mean error, worst |error|)] for an axis, oldest first."""
+        rows = self._query(
+            "SELECT CAST(timestamp / 86400 AS INTEGER) AS day, COUNT(*), AVG(error), MAX(ABS(error))"
+            " FROM samples WHERE serial = ? AND axis = ? AND timestamp >= ? AND error IS NOT NULL"
+            " GROUP BY day ORDER BY day",
+            (str(serial), axis, time.time() - days * 86400))
+        return [(day * 86400.0, n, mean, worst) for day, n, mean, worst in rows]
+
+    def recent_runs(self, serial=None, limit=50):
+        """The latest runs as dicts, newest first, optionally for one controller."""
+        sql = "SELECT id, started, serial, kind, name, passed, duration_s FROM runs"
+        args = ()
+        if serial is not None:
+            sql += " WHERE serial = ?"
+            args = (str(serial),)
+        rows = self._query(sql + " ORDER BY started DESC LIMIT ?", args + (limit,))
+        keys = ("id", "started", "serial", "kind", "name", "passed", "duration_s")
+        return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,1159 @@
+"""
+In-process simulator for a Galil DMC-4143 controller.
+
+Implements the subset of the gclib ``py`` connection interface that the
+application uses, so GalilController can open an address such as
+``sim://dmc4143`` and the rest of the tool can be exercised and benchmarked
+on a machine without hardware or the gclib shared libraries.
+
+Downloaded DMC programs run in simulated threads (XQ/HX) with labels, JP,
+variables, left-to-right arithmetic, WT and AM; anything a program prints
+with MG arrives as unsolicited output, as on the real controller.
+
+Optional query parameters on the address:
+    time_scale  multiplier applied to wall-clock time (default 1.0)
+    latency     simulated round-trip time per GCommand in ms (default 0)
+    backlash    lost motion between motor and load encoder in counts (default 0)
+    noise       standard deviation of settled positions in counts (default 0)
+
+Every handle opened on the same address shares one simulated controller,
+just as several gclib handles share one physical DMC.
+"""
+import math
+import queue
+import random
+import re
+import threading
+import time
+from array import array
+from urllib.parse import urlparse, parse_qs
+
+from data_record import (
+    AxisRecord, DR_METHOD, pack_data_record, STATUS_MOTOR_OFF, STATUS_MOVING,
+    STATUS_NEGATIVE, STATUS_POSITION_MODE, STATUS_SLEWING, STATUS_STOPPING,
+)
+
+SIM_SCHEME = "sim://"
+
+SIM_FIRMWARE = "DMC4143 Rev 1.3h"
+SIM_SERIAL = 40001
+
+_AXES = ("A", "B", "C", "D")
+
+# Text gclib reports when the controller answers with '?'
+QUESTION_MARK = "question mark returned by controller"
+
+# Subset of the controller's TC error table used by the simulator
+_ERROR_TEXT = {
+    1: "Unrecognized command",
+    6: "Number out of range",
+    18: "Unrecognized operand",
+    20: "Begin not valid with motor off",
+    22: "Begin not valid while running",
+    23: "Cannot modify position while running",
+}
+
+# Axis parameters that take "KPA=10" / "KP 10,20" style arguments
+_PARAMETERS = {
+    "KP": ("kp", float),
+    "KI": ("ki", float),
+    "KD": ("kd", float),
+    "SP": ("sp", int),
+    "AC": ("ac", int),
+    "DC": ("dc", int),
+    "TL": ("tl", float),
+    "PA": ("pa", int),
+    "PR": ("pr", int),
+    "JG": ("jg", int),
+}
+
+# TS status bits
+_TS_MOVING = 0x80
+_TS_MOTOR_OFF = 0x20
+_TS_LIMITS_INACTIVE = 0x0C
+
+# SC stop codes
+_SC_RUNNING = 0
+_SC_AT_POSITION = 1
+_SC_STOPPED = 4
+_SC_ABORTED = 8
+
+
+class SimulatorError(Exception):
+    """Raised when the simulated controller rejects a command, mirroring GclibError."""
+    pass
+
+
+class _CommandError(Exception):
+    """Internal: a single command failed with the given TC error code."""
+
+    def __init__(self, code):
+        super().__init__(_ERROR_TEXT.get(code, "Unknown error"))
+        self.code = code
+
+
+class _Profile:
+    """Piecewise constant-acceleration motion starting at (t0, p0, v0)."""
+
+    __slots__ = ("t0", "p0", "v0", "segments", "final_position")
+
+    def __init__(self, t0, p0, v0, segments, final_position=None):
+        self.t0 = t0
+        self.p0 = p0
+        self.v0 = v0
+        self.segments = segments  # list of (duration, acceleration)
+        self.final_position = final_position
+
+    @property
+    def duration(self):
+        return sum(duration for duration, _ in self.segments)
+
+    def sample(self, t):
+        """Return (position, velocity, acceleration, done) at time t."""
+        remaining = max(0.0, t - self.t0)
+        p, v = self.p0, self.v0
+        for duration, accel in self.segments:
+            if remaining < duration:
+                return (p + v * remaining + 0.5 * accel * remaining * remaining,
+                        v + accel * remaining, accel, False)
+            p += v * duration + 0.5 * accel * duration * duration
+            v += accel * duration
+            remaining -= duration
+        if self.final_position is not None:
+            p = self.final_position
+        return p, v, 0.0, True
+
+
+def _ramp(v_from, v_to, ac, dc):
+    """Segments taking the velocity from v_from to v_to using AC to speed up and DC to slow down."""
+    segments = []
+    if v_from != 0 and v_to != 0 and (v_from > 0) != (v_to > 0):
+        # Reversal: decelerate through zero first
+        segments.append((abs(v_from) / dc, -math.copysign(dc, v_from)))
+        v_from = 0.0
+    delta = v_to - v_from
+    if delta == 0:
+        return segments
+    rate = ac if abs(v_to) > abs(v_from) else dc
+    segments.append((abs(delta) / rate, math.copysign(rate, delta)))
+    return segments
+
+
+def _trapezoid(distance, sp, ac, dc):
+    """Segments for a point-to-point move of the given signed distance from rest."""
+    d = abs(distance)
+    if d == 0:
+        return []
+    sign = 1.0 if distance > 0 else -1.0
+    d_accel = sp * sp / (2.0 * ac)
+    d_decel = sp * sp / (2.0 * dc)
+    if d_accel + d_decel <= d:
+        peak = float(sp)
+        cruise = (d - d_accel - d_decel) / sp
+    else:
+        # Triangular profile: never reaches SP
+        peak = math.sqrt(2.0 * d * ac * dc / (ac + dc))
+        cruise = 0.0
+    return [(peak / ac, sign * ac), (cruise, 0.0), (peak / dc, -sign * dc)]
+
+
+class _SimAxis:
+    """State of one simulated servo axis."""
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        # Power-on defaults of a DMC-4000 axis
+        self.kp = 6.0
+        self.ki = 0.0
+        self.kd = 64.0
+        self.sp = 25000
+        self.ac = 256000
+        self.dc = 256000
+        self.tl = 9.998
+        self.pa = 0
+        self.pr = 0
+        self.jg = 0
+        self.mode = "PA"
+        self.servo = False
+        self.stop_code = _SC_AT_POSITION
+        self.profile = _Profile(0.0, 0.0, 0.0, [])
+        self.load_offset = 0.0  # load position minus reference from backlash and noise
+
+    def sample(self, t):
+        """Return (reference position, velocity, acceleration, moving)."""
+        p, v, a, done = self.profile.sample(t)
+        return p, v, a, not done
+
+    def following_error(self, velocity):
+        # Crude proportional lag: higher KP means a stiffer loop
+        if not self.servo or self.kp <= 0:
+            return 0
+        return int(round(velocity / (self.kp * 100.0)))
+
+    def torque(self, velocity, accel):
+        if not self.servo:
+            return 0.0
+        volts = self.kp * self.following_error(velocity) * 0.01 + accel * 1e-7
+        return max(-self.tl, min(self.tl, volts))
+
+
+class SimulatedMachine:
+    """The shared state of one simulated controller, independent of any connection."""
+
+    def __init__(self, time_scale=1.0, latency=0.0, backlash=0.0, noise=0.0):
+        self.time_scale = time_scale
+        self.latency = latency
+        self.backlash = backlash
+        self.noise = noise
+        self.lock = threading.RLock()
+        self.axes = {axis: _SimAxis(axis) for axis in _AXES}
+        self.error_code = 0
+        self.ip_address = "192.168.0.100"
+        self.dr_period = 0  # ms between pushed data records, 0 = off
+        self._message_queues = []  # one per handle subscribed to messages
+        self.online = True  # False simulates a dropped link: every handle fails
+        self.arrays = {}  # DM arrays by upper-case name
+        self.variables = {}  # program variables by upper-case name
+        self.program = []  # downloaded program, one command per entry
+        self.program_text = ""
+        self.labels = {}  # "#LABEL" -> index into program
+        self.threads = {}  # running _ProgramThreads by thread number
+        self._epoch = time.monotonic()
+
+    def now(self):
+        """Simulated seconds since the machine was created."""
+        return (time.monotonic() - self._epoch) * self.time_scale
+
+    def sleep(self, seconds):
+        """Block for the given number of simulated seconds."""
+        if seconds > 0:
+            time.sleep(seconds / self.time_scale)
+
+    def post_message(self, text):
+        """Send unsolicited text (e.g. a program's MG output) to subscribed handles."""
+        with self.lock:
+            for messages in self._message_queues:
+                messages.put(text)
+
+    def reset(self):
+        with self.lock:
+            self.halt()
+            for axis in self.axes.values():
+                axis.reset()
+            self.error_code = 0
+            self.arrays.clear()
+            self.variables.clear()
+
+    # Programs ------------------------------------------------------------
+
+    def load_program(self, text):
+        """Replace the program buffer with DMC program text."""
+        commands, labels = [], {}
+        for line in text.splitlines():
+            for command in _split_commands(line):
+                command = command.strip()
+                if command.startswith("'") or command[:3].upper() == "REM":
+                    break  # comment to end of line
+                if command.startswith("#"):
+                    labels[command.upper()] = len(commands)
+                commands.append(command)
+        self.program, self.labels, self.program_text = commands, labels, text
+
+    def execute_program(self, label=None, number=0):
+        """Start a program thread at a label (or the first line), replacing one already running."""
+        if label is None:
+            start = 0
+        elif label.upper() in self.labels:
+            start = self.labels[label.upper()]
+        else:
+            raise _CommandError(1)
+        self.halt(number)
+        thread = _ProgramThread(self, number, start)
+        self.threads[number] = thread
+        thread.start()
+
+    def halt(self, number=None):
+        """Halt one program thread, or all of them."""
+        for n in list(self.threads) if number is None else [number]:
+            thread = self.threads.pop(n, None)
+            if thread is not None:
+                thread.halted.set()
+
+    def axis_state(self, axis, t=None):
+        """Return (position, error, velocity, torque, moving) for an axis."""
+        sim_axis = self.axes[axis]
+        t = self.now() if t is None else t
+        ref, velocity, accel, moving = sim_axis.sample(t)
+        error = sim_axis.following_error(velocity)
+        return (int(round(ref + sim_axis.load_offset)) - error, error, velocity,
+                sim_axis.torque(velocity, accel), moving)
+
+    def data_record(self, t=None):
+        """Build a raw QR/DR record of all axes at time t."""
+        t = self.now() if t is None else t
+        axes = []
+        for axis in _AXES:
+            sim_axis = self.axes[axis]
+            ref, _, accel, _ = sim_axis.sample(t)
+            position, error, velocity, torque, moving = self.axis_state(axis, t)
+            status = 0
+            if moving:
+                status |= STATUS_MOVING
+                if sim_axis.mode in ("PA", "PR"):
+                    status |= STATUS_POSITION_MODE
+                if accel == 0:
+                    status |= STATUS_SLEWING
+                if sim_axis.stop_code == _SC_STOPPED:
+                    status |= STATUS_STOPPING
+            if velocity < 0:
+                status |= STATUS_NEGATIVE
+            if not sim_axis.servo:
+                status |= STATUS_MOTOR_OFF
+            axes.append(AxisRecord(position, error, int(round(velocity)), torque,
+                                   int(round(ref)), status, _TS_LIMITS_INACTIVE,
+                                   sim_axis.stop_code))
+        return pack_data_record(int(t * 1000), self.error_code, axes)
+
+    def motion_remaining(self, axis):
+        """Simulated seconds until the axis finishes its current move (inf while jogging)."""
+        sim_axis = self.axes[axis]
+        profile = sim_axis.profile
+        end = profile.t0 + profile.duration
+        return max(0.0, end - self.now())
+
+    # Motion --------------------------------------------------------------
+
+    def _retarget(self, sim_axis, segments, t, final_position=None):
+        p, v, _, _ = sim_axis.sample(t)
+        sim_axis.profile = _Profile(t, p, v, segments, final_position)
+
+    def begin(self, axis):
+        sim_axis = self.axes[axis]
+        t = self.now()
+        p, v, _, moving = sim_axis.sample(t)
+        if not sim_axis.servo:
+            raise _CommandError(20)
+        if moving:
+            raise _CommandError(22)
+        if sim_axis.mode == "JG":
+            self.change_jog_speed(axis)
+        else:
+            if sim_axis.mode == "PR":
+                target = int(round(p)) + sim_axis.pr
+                sim_axis.pa = target
+            else:
+                target = sim_axis.pa
+            segments = _trapezoid(target - p, sim_axis.sp, sim_axis.ac, sim_axis.dc)
+            sim_axis.profile = _Profile(t, p, 0.0, segments, float(target))
+            if target != p:
+                # The load trails the motor by half the backlash in the direction of travel
+                direction = 1 if target > p else -1
+                sim_axis.load_offset = -direction * self.backlash / 2.0 + random.gauss(0.0, self.noise)
+        sim_axis.stop_code = _SC_RUNNING
+
+    def change_jog_speed(self, axis):
+        sim_axis = self.axes[axis]
+        t = self.now()
+        segments = _ramp(sim_axis.sample(t)[1], float(sim_axis.jg), sim_axis.ac, sim_axis.dc)
+        segments.append((math.inf, 0.0))
+        self._retarget(sim_axis, segments, t)
+
+    def stop(self, axis):
+        sim_axis = self.axes[axis]
+        t = self.now()
+        _, v, _, moving = sim_axis.sample(t)
+        if moving:
+            self._retarget(sim_axis, _ramp(v, 0.0, sim_axis.ac, sim_axis.dc), t)
+            sim_axis.stop_code = _SC_STOPPED
+
+    def abort(self, axis, motor_off=False):
+        sim_axis = self.axes[axis]
+        t = self.now()
+        p, _, _, moving = sim_axis.sample(t)
+        sim_axis.profile = _Profile(t, p, 0.0, [])
+        if moving:
+            sim_axis.stop_code = _SC_ABORTED
+        if motor_off:
+            sim_axis.servo = False
+
+    def define_position(self, axis, value):
+        sim_axis = self.axes[axis]
+        t = self.now()
+        if sim_axis.sample(t)[3]:
+            raise _CommandError(23)
+        sim_axis.profile = _Profile(t, float(value), 0.0, [])
+        sim_axis.pa = value
+        sim_axis.load_offset = 0.0
+
+
+class SimulatedController:
+    """
+    Drop-in replacement for gclib.py backed by a SimulatedMachine.
+    Only the calls GalilController relies on are implemented.
+    """
+
+    _machines = {}
+    _machines_lock = threading.Lock()
+
+    def __init__(self):
+        self._machine = None
+        self._address = None
+        self._timeout = 5000
+        self._last_dr = None
+        self._messages = None  # queue of unsolicited text when subscribed
+
+    # Registry ------------------------------------------------------------
+
+    @classmethod
+    def machine_for(cls, address):
+        """Return the shared SimulatedMachine for an address, creating it on first use."""
+        # gclib options such as "--subscribe DR" follow the address
+        parsed = urlparse(address.split()[0])
+        key = (parsed.netloc + parsed.path).lower()
+        options = parse_qs(parsed.query)
+        with cls._machines_lock:
+            machine = cls._machines.get(key)
+            if machine is None:
+                machine = SimulatedMachine(
+                    time_scale=float(options.get("time_scale", ["1"])[0]),
+                    latency=float(options.get("latency", ["0"])[0]) / 1000.0,
+                    backlash=float(options.get("backlash", ["0"])[0]),
+                    noise=float(options.get("noise", ["0"])[0]),
+                )
+                cls._machines[key] = machine
+            return machine
+
+    @classmethod
+    def discard_machines(cls):
+        """Forget every simulated controller so the next GOpen starts from power-on state."""
+        with cls._machines_lock:
+            cls._machines.clear()
+
+    # gclib.py surface ----------------------------------------------------
+
+    def GOpen(self, address):
+        if not address.startswith(SIM_SCHEME):
+            raise SimulatorError(f"Not a simulator address: {address}")
+        machine = self.machine_for(address)
+        if not machine.online:
+            raise SimulatorError("connection refused")
+        self._machine = machine
+        self._address = address
+        # Like gclib, only a handle opened with --subscribe MG/ALL receives messages
+        options = address.split()[1:]
+        if "--subscribe" in options and options[options.index("--subscribe") + 1:][:1] in (["MG"], ["ALL"]):
+            self._messages = queue.Queue()
+            with self._machine.lock:
+                self._machine._message_queues.append(self._messages)
+
+    def GClose(self):
+        if self._machine is not None and self._messages is not None:
+            with self._machine.lock:
+                self._machine._message_queues.remove(self._messages)
+        self._messages = None
+        self._machine = None
+
+    def GInfo(self):
+        self._cc()
+        return f"{self._address}, {SIM_FIRMWARE}, {SIM_SERIAL}"
+
+    def GVersion(self):
+        return "py.simulator"
+
+    def GSleep(self, val):
+        time.sleep(val / 1000.0)
+
+    def GTimeout(self, timeout):
+        self._cc()
+        self._timeout = timeout
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self.GTimeout(timeout)
+
+    def GCommand(self, command):
+        """Performs a command-and-response transaction. Trims the response like gclib."""
+        raw = self._transact(command)
+        if raw.endswith("?"):
+            raise SimulatorError(QUESTION_MARK)
+        return raw[:-3].strip()
+
+    def GCommandRaw(self, command):
+        """Performs a command-and-response transaction and returns the untrimmed reply."""
+        return self._transact(command)
+
+    def GCommandBytes(self, command):
+        """Like gclib.py: the response as bytes without the trailing /r/n:, untrimmed."""
+        raw = self._transact(command)
+        if raw.endswith("?"):
+            raise SimulatorError(QUESTION_MARK)
+        return (raw[:-3] if raw.endswith("\r\n:") else raw[:-1]).encode("ascii")
+
+    def GProgramDownload(self, program, preprocessor=""):
+        """Replaces the program buffer. Refused while a program is running, like the controller."""
+        self._cc()
+        with self._machine.lock:
+            if self._machine.threads:
+                raise SimulatorError(QUESTION_MARK)
+            self._machine.load_program(program)
+
+    def GProgramUpload(self):
+        """Returns the program buffer."""
+        self._cc()
+        with self._machine.lock:
+            return self._machine.program_text
+
+    def GArrayUpload(self, name, first, last):
+        """Uploads array data as a list of floats."""
+        return self.GArrayUploadTyped(name, first, last).tolist()
+
+    def GArrayUploadTyped(self, name, first=-1, last=-1, use_numpy=False, callback=None):
+        """Uploads array data as an array('d') or numpy array, like gclib.py."""
+        if use_numpy:
+            import numpy
+        values = self._array_range(name, first, last)
+        convert = numpy.array if use_numpy else (lambda chunk: array('d', chunk))
+        if callback is None:
+            return convert(values)
+        start = first if first >= 0 else 0
+        for offset in range(0, len(values), _ARRAY_CHUNK):
+            callback(start + offset, convert(values[offset:offset + _ARRAY_CHUNK]))
+        return None
+
+    def GArrayDownload(self, name, first, last, array_data, progress=None):
+        """Downloads array data into a DM array, like gclib.py (last is implied by the data)."""
+        self._cc()
+        machine = self._machine
+        first = 0 if first < 0 else first
+        total = len(array_data)
+        for offset in range(0, total, _ARRAY_DOWNLOAD_CHUNK):
+            chunk = [float(v) for v in array_data[offset:offset + _ARRAY_DOWNLOAD_CHUNK]]
+            if machine.latency:
+                time.sleep(machine.latency)
+            with machine.lock:
+                data = machine.arrays.get(name.upper())
+                if data is None or first + offset + len(chunk) > len(data):
+                    raise SimulatorError(QUESTION_MARK)
+                data[first + offset:first + offset + len(chunk)] = chunk
+            if progress is not None:
+                progress(offset + len(chunk), total)
+
+    def _array_range(self, name, first, last):
+        self._cc()
+        machine = self._machine
+        if machine.latency:
+            time.sleep(machine.latency)
+        with machine.lock:
+            data = machine.arrays.get(name.upper())
+            if data is None:
+                raise SimulatorError(QUESTION_MARK)
+            first = 0 if first < 0 else first
+            last = len(data) - 1 if last < 0 else last
+            if first > last or last >= len(data):
+                raise SimulatorError(QUESTION_MARK)
+            return data[first:last + 1]
+
+    def GMessage(self):
+        """Wait up to the timeout for unsolicited messages and return all that are queued."""
+        self._cc()
+        if self._messages is None:
+            time.sleep(self._timeout / 1000.0)
+            raise SimulatorError("operation timed out")
+        try:
+            texts = [self._messages.get(timeout=self._timeout / 1000.0)]
+        except queue.Empty:
+            raise SimulatorError("operation timed out")
+        while True:
+            try:
+                texts.append(self._messages.get_nowait())
+            except queue.Empty:
+                return "".join(texts)
+
+    def GMotionComplete(self, axes):
+        """Blocks until the given axes have finished moving."""
+        while True:
+            self._cc()
+            machine = self._machine
+            with machine.lock:
+                remaining = max(machine.motion_remaining(axis) for axis in axes.upper())
+            if remaining <= 0:
+                return
+            # Re-check regularly: ST/AB or a new move changes the remaining time
+            machine.sleep(min(remaining, 0.05))
+
+    def GRecord(self, method=0):
+        """Return a raw data record, now (QR) or at the next DR period."""
+        self._cc()
+        machine = self._machine
+        if method != DR_METHOD:
+            if machine.latency:
+                time.sleep(machine.latency)
+            with machine.lock:
+                return machine.data_record()
+        deadline = time.monotonic() + self._timeout / 1000.0
+        while True:
+            period = machine.dr_period / 1000.0
+            if not period:
+                # Nothing is being pushed: behave like a gclib read timeout
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                raise SimulatorError("operation timed out")
+            t = machine.now()
+            tick = math.floor(t / period) + 1
+            if self._last_dr is not None and tick <= self._last_dr:
+                tick = self._last_dr + 1
+            machine.sleep(tick * period - t)
+            self._last_dr = tick
+            with machine.lock:
+                return machine.data_record(tick * period)
+
+    # Implementation ------------------------------------------------------
+
+    def _cc(self):
+        if self._machine is None:
+            raise SimulatorError("connection not established")
+        if not self._machine.online:
+            raise SimulatorError("operation timed out")
+
+    def _transact(self, line):
+        """Execute a semicolon-separated command line and return the raw reply."""
+        self._cc()
+        machine = self._machine
+        if machine.latency:
+            time.sleep(machine.latency)
+        raw = []
+        with machine.lock:
+            for command in _split_commands(line):
+                try:
+                    data = _Interpreter(self, machine).execute(command)
+                except _CommandError as e:
+                    machine.error_code = e.code
+                    raw.append("?")
+                    break
+                if data is not None:
+                    raw.append(f" {data}\r\n")
+                raw.append(":")
+        return "".join(raw)
+
+
+def _split_commands(line):
+    """Split a command line on semicolons that are not inside quotes."""
+    commands, current, quoted = [], [], False
+    for ch in line:
+        if ch == '"':
+            quoted = not quoted
+        if ch == ";" and not quoted:
+            commands.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    commands.append("".join(current))
+    return [c for c in commands if c.strip()]
+
+
+def _strip_spaces(command):
+    """The controller ignores whitespace outside of string literals."""
+    out, quoted = [], False
+    for ch in command:
+        if ch == '"':
+            quoted = not quoted
+        if quoted or not ch.isspace():
+            out.append(ch)
+    return "".join(out)
+
+
+def _format_number(value):
+    return f"{value:.4f}"
+
+
+_ASSIGN_RE = re.compile(r"^([A-H])=(.*)$")
+_ARRAY_RE = re.compile(r"^([A-Z][A-Z0-9]{0,7})\[([^\]]+)\]$", re.IGNORECASE)
+_ARRAY_ASSIGN_RE = re.compile(r"^([A-Z][A-Z0-9]{0,7})\[([^\]]+)\]=(.+)$", re.IGNORECASE)
+_VARIABLE_ASSIGN_RE = re.compile(r"^([A-Z][A-Z0-9]{0,7})=(.+)$", re.IGNORECASE)
+
+# JP comparisons, two-character operators first
+_COMPARISONS = {
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+    "<>": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "=": lambda a, b: a == b,
+}
+
+_PROGRAM_THREADS = 8
+
+# Elements per chunk passed to GArrayUploadTyped callbacks / per download, as in gclib.py
+_ARRAY_CHUNK = 20000
+_ARRAY_DOWNLOAD_CHUNK = 2000
+
+
+class _Interpreter:
+    """
+    Executes a single command against a SimulatedMachine. Caller holds the machine
+    lock. program is the _ProgramThread when the command comes from a program.
+    """
+
+    def __init__(self, connection, machine, program=None):
+        self.connection = connection
+        self.machine = machine
+        self.program = program
+
+    def execute(self, command):
+        command = _strip_spaces(command)
+        if command.startswith("#"):
+            return None  # program label
+        match = _ARRAY_ASSIGN_RE.match(command)
+        if match:
+            return self._assign_element(*match.groups())
+        match = _VARIABLE_ASSIGN_RE.match(command)
+        if match and not self._is_command(match.group(1)):
+            return self._assign_variable(*match.groups())
+        opcode, args = command[:2].upper(), command[2:]
+        if opcode in _PARAMETERS:
+            return self._parameter(opcode, args)
+        handler = getattr(self, f"_cmd_{opcode}", None)
+        if handler is None:
+            raise _CommandError(1)
+        return handler(args)
+
+    def _is_command(self, name):
+        """Whether NAME= is a command assignment (e.g. KPA=, IP=) rather than a variable."""
+        name = name.upper()
+        opcode = name[:2]
+        if opcode not in _PARAMETERS and not hasattr(self, f"_cmd_{opcode}"):
+            return False
+        return len(name) == 2 or (len(name) == 3 and name[2] in _AXES)
+
+    # Argument helpers ----------------------------------------------------
+
+    def _axis_list(self, args):
+        if args == "":
+            return list(_AXES)
+        if not all(ch in _AXES for ch in args.upper()):
+            raise _CommandError(1)
+        return list(args.upper())
+
+    def _assignments(self, args):
+        """Parse 'A=1' or '1,2,,4' into {axis: text}."""
+        match = _ASSIGN_RE.match(args.upper())
+        if match:
+            return {match.group(1): match.group(2)}
+        values = args.split(",")
+        if len(values) > len(_AXES):
+            raise _CommandError(6)
+        return {axis: value for axis, value in zip(_AXES, values) if value != ""}
+
+    # Parameters ----------------------------------------------------------
+
+    def _parameter(self, opcode, args):
+        attr, kind = _PARAMETERS[opcode]
+        assignments = self._assignments(args)
+        if not assignments:
+            raise _CommandError(1)
+        queries = []
+        for axis, text in assignments.items():
+            sim_axis = self.machine.axes[axis]
+            if text == "?":
+                value = getattr(sim_axis, attr)
+                queries.append(_format_number(value) if kind is float else str(value))
+                continue
+            value = kind(self._number(text))
+            if opcode == "JG" and sim_axis.mode == "JG" and sim_axis.sample(self.machine.now())[3]:
+                # Changing JG while jogging updates the speed on the fly
+                setattr(sim_axis, attr, value)
+                self.machine.change_jog_speed(axis)
+                continue
+            setattr(sim_axis, attr, value)
+            if opcode in ("PA", "PR", "JG"):
+                sim_axis.mode = opcode
+        return ", ".join(queries) if queries else None
+
+    # Motion commands -----------------------------------------------------
+
+    def _cmd_SH(self, args):
+        for axis in self._axis_list(args):
+            self.machine.axes[axis].servo = True
+
+    def _cmd_MO(self, args):
+        for axis in self._axis_list(args):
+            self.machine.abort(axis, motor_off=True)
+
+    def _cmd_BG(self, args):
+        for axis in self._axis_list(args):
+            self.machine.begin(axis)
+
+    def _cmd_ST(self, args):
+        for axis in self._axis_list(args):
+            self.machine.stop(axis)
+
+    def _cmd_AB(self, args):
+        # Abort also ends running programs
+        self.machine.halt()
+        for axis in _AXES:
+            self.machine.abort(axis)
+
+    def _cmd_AM(self, args):
+        axes = self._axis_list(args)
+        while not self._halted():
+            wait = max(self.machine.motion_remaining(axis) for axis in axes)
+            if wait == math.inf:
+                raise _CommandError(22)
+            if wait <= 0:
+                return
+            # Re-check regularly: ST/AB or a new move changes the remaining time
+            self._wait(min(wait, 0.05))
+
+    def _cmd_WT(self, args):
+        self._wait(self._number(args) / 1000.0)
+
+    def _wait(self, seconds):
+        """Wait simulated seconds without holding the lock, so other handles keep working."""
+        self.machine.lock.release()
+        try:
+            if self.program is not None:
+                self.program.halted.wait(seconds / self.machine.time_scale)
+            else:
+                self.machine.sleep(seconds)
+        finally:
+            self.machine.lock.acquire()
+
+    def _halted(self):
+        return self.program is not None and self.program.halted.is_set()
+
+    def _cmd_DP(self, args):
+        for axis, text in self._assignments(args).items():
+            try:
+                value = int(float(text))
+            except ValueError:
+                raise _CommandError(6)
+            self.machine.define_position(axis, value)
+
+    # Arrays --------------------------------------------------------------
+
+    def _cmd_DM(self, args):
+        for spec in args.split(","):
+            match = _ARRAY_RE.match(spec)
+            if not match:
+                raise _CommandError(6)
+            size = int(self._number(match.group(2)))
+            if size <= 0:
+                raise _CommandError(6)
+            self.machine.arrays[match.group(1).upper()] = [0.0] * size
+
+    def _cmd_DA(self, args):
+        for spec in args.split(","):
+            name = spec[:-2] if spec.endswith("[]") else spec
+            if name == "*":
+                self.machine.arrays.clear()
+            else:
+                self.machine.arrays.pop(name.upper(), None)
+
+    def _array(self, name):
+        data = self.machine.arrays.get(name.upper())
+        if data is None:
+            raise _CommandError(18)
+        return data
+
+    def _assign_element(self, name, index, expression):
+        data = self._array(name)
+        index = int(self._number(index))
+        if not 0 <= index < len(data):
+            raise _CommandError(6)
+        data[index] = self._number(expression)
+
+    def _assign_variable(self, name, expression):
+        self.machine.variables[name.upper()] = self._number(expression)
+
+    # Programs ------------------------------------------------------------
+
+    def _cmd_XQ(self, args):
+        label, _, number = args.partition(",")
+        number = int(self._number(number)) if number else 0
+        if not 0 <= number < _PROGRAM_THREADS:
+            raise _CommandError(6)
+        self.machine.execute_program(label or None, number)
+
+    def _cmd_HX(self, args):
+        self.machine.halt(int(self._number(args)) if args else None)
+
+    def _cmd_JP(self, args):
+        if self.program is None:
+            raise _CommandError(1)
+        label, _, condition = args.partition(",")
+        if label.upper() not in self.machine.labels:
+            raise _CommandError(1)
+        if not condition or self._condition(condition):
+            self.program.line = self.machine.labels[label.upper()]
+
+    def _cmd_EN(self, args):
+        if self.program is not None:
+            self.program.line = len(self.machine.program)
+
+    def _cmd_NO(self, args):
+        pass
+
+    def _cmd_RS(self, args):
+        if args:
+            raise _CommandError(1)
+        self.machine.reset()
+
+    # Reports -------------------------------------------------------------
+
+    def _report(self, args, index, fmt=str):
+        t = self.machine.now()
+        values = [fmt(self.machine.axis_state(axis, t)[index]) for axis in self._axis_list(args)]
+        return ", ".join(values)
+
+    def _cmd_TP(self, args):
+        return self._report(args, 0)
+
+    def _cmd_TE(self, args):
+        return self._report(args, 1)
+
+    def _cmd_TV(self, args):
+        return self._report(args, 2, lambda v: str(int(round(v))))
+
+    def _cmd_TT(self, args):
+        return self._report(args, 3, _format_number)
+
+    def _cmd_TS(self, args):
+        return ", ".join(str(self._status(axis)) for axis in self._axis_list(args))
+
+    def _cmd_SC(self, args):
+        return ", ".join(str(self.machine.axes[axis].stop_code) for axis in self._axis_list(args))
+
+    def _cmd_TC(self, args):
+        code = self.machine.error_code
+        if args == "1":
+            return f"{code} {_ERROR_TEXT.get(code, '')}".strip()
+        return str(code)
+
+    def _cmd_DR(self, args):
+        period = args.split(",")[0]
+        try:
+            self.machine.dr_period = int(period) if period else 0
+        except ValueError:
+            raise _CommandError(6)
+
+    def _cmd_IP(self, args):
+        if not re.match(r"^\d{1,3}([.,]\d{1,3}){3}$", args):
+            raise _CommandError(6)
+        self.machine.ip_address = args.replace(",", ".")
+
+    def _status(self, axis):
+        sim_axis = self.machine.axes[axis]
+        status = _TS_LIMITS_INACTIVE
+        if self.machine.axis_state(axis)[4]:
+            status |= _TS_MOVING
+        if not sim_axis.servo:
+            status |= _TS_MOTOR_OFF
+        return status
+
+    # MG and operands -----------------------------------------------------
+
+    def _cmd_MG(self, args):
+        parts = []
+        for item in _split_arguments(args):
+            if item.startswith('"') and item.endswith('"') and len(item) >= 2:
+                parts.append(item[1:-1])
+            else:
+                try:
+                    value = _format_number(self._number(item))
+                except _CommandError:
+                    value = self._operand(item)  # text operands such as _FW
+                    if not isinstance(value, str):
+                        raise
+                parts.append(value)
+        return " ".join(parts)
+
+    def _number(self, text):
+        """
+        Value of a number, operand or expression. Like the controller, arithmetic
+        is evaluated left to right without operator precedence; use parentheses.
+        """
+        try:
+            return float(text)
+        except ValueError:
+            pass
+        value = 0.0
+        for operator, term in _split_terms(text):
+            operand = self._term(term)
+            if operator == "+":
+                value += operand
+            elif operator == "-":
+                value -= operand
+            elif operator == "*":
+                value *= operand
+            elif operand == 0:
+                raise _CommandError(6)
+            else:
+                value /= operand
+        return value
+
+    def _term(self, term):
+        if term.startswith("-"):
+            return -self._term(term[1:])
+        if term.startswith("(") and term.endswith(")"):
+            return self._number(term[1:-1])
+        value = self._operand(term)
+        if isinstance(value, str):
+            raise _CommandError(6)
+        return value
+
+    def _condition(self, text):
+        """Truth of a JP condition such as "n<count" (a bare expression is true when non-zero)."""
+        for comparison in _COMPARISONS:
+            left, found, right = _partition_top_level(text, comparison)
+            if found:
+                return _COMPARISONS[comparison](self._number(left), self._number(right))
+        return self._number(text) != 0
+
+    def _operand(self, token):
+        match = _ARRAY_RE.match(token)
+        if match:
+            data = self._array(match.group(1))
+            index = int(self._number(match.group(2)))
+            if index == -1:
+                return float(len(data))
+            if not 0 <= index < len(data):
+                raise _CommandError(6)
+            return data[index]
+        token = token.upper()
+        try:
+            return float(token)
+        except ValueError:
+            pass
+        if token == "TIME":
+            # Servo samples at the default 1 kHz rate
+            return float(int(self.machine.now() * 1000))
+        if not token.startswith("_"):
+            if token not in self.machine.variables:
+                raise _CommandError(18)
+            return self.machine.variables[token]
+        name = token[1:]
+        if name[:2] == "XQ":
+            # Line a program thread is executing, -1 when it is not running
+            thread = self.machine.threads.get(int(name[2:] or 0))
+            return float(thread.line) if thread is not None else -1.0
+        if name == "FW":
+            return SIM_FIRMWARE
+        if name == "BN":
+            return float(SIM_SERIAL)
+        if name == "TC":
+            return float(self.machine.error_code)
+        if name == "IP":
+            return self.machine.ip_address.replace(".", ", ")
+        if len(name) == 3 and name[2] in _AXES:
+            return self._axis_operand(name[:2], name[2])
+        raise _CommandError(18)
+
+    def _axis_operand(self, opcode, axis):
+        sim_axis = self.machine.axes[axis]
+        position, error, velocity, torque, moving = self.machine.axis_state(axis)
+        if opcode == "BG":
+            return 1.0 if moving else 0.0
+        if opcode == "TP":
+            return float(position)
+        if opcode == "TE":
+            return float(error)
+        if opcode == "TV":
+            return float(int(round(velocity)))
+        if opcode == "TT":
+            return torque
+        if opcode == "TS":
+            return float(self._status(axis))
+        if opcode == "SC":
+            return float(sim_axis.stop_code)
+        if opcode == "MO":
+            return 0.0 if sim_axis.servo else 1.0
+        if opcode == "RP":
+            return float(sim_axis.sample(self.machine.now())[0])
+        if opcode in _PARAMETERS:
+            return float(getattr(sim_axis, _PARAMETERS[opcode][0]))
+        raise _CommandError(18)
+
+
+def _split_terms(text):
+    """Split an expression into (operator, term) pairs at top-level + - * /."""
+    terms, current, operator, depth = [], [], "+", 0
+    for ch in text:
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        if depth == 0 and ch in "+-*/" and current:
+            terms.append((operator, "".join(current)))
+            operator, current = ch, []
+        else:
+            current.append(ch)
+    if not current or depth:
+        raise _CommandError(6)
+    terms.append((operator, "".join(current)))
+    return terms
+
+
+def _partition_top_level(text, separator):
+    """str.partition() that ignores separators inside brackets or parentheses."""
+    depth = 0
+    for i, ch in enumerate(text):
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif depth == 0 and text.startswith(separator, i):
+            return text[:i], separator, text[i + len(separator):]
+    return text, "", ""
+
+
+class _ProgramThread(threading.Thread):
+    """One running program thread (XQ). Commands run one at a time under the machine lock."""
+
+    def __init__(self, machine, number, start):
+        super().__init__(name=f"sim-xq{number}", daemon=True)
+        self.machine = machine
+        self.number = number
+        self.line = start
+        self.halted = threading.Event()
+
+    def run(self):
+        machine = self.machine
+        interpreter = _Interpreter(None, machine, self)
+        while not self.halted.is_set():
+            with machine.lock:
+                if self.halted.is_set() or self.line >= len(machine.program):
+                    break
+                command = machine.program[self.line]
+                self.line += 1
+                try:
+                    data = interpreter.execute(command)
+                except _CommandError as e:
+                    # An error stops the thread, as on the controller
+                    machine.error_code = e.code
+                    break
+                if data is not None:
+                    machine.post_message(f"{data}\r\n")
+        with machine.lock:
+            if machine.threads.get(self.number) is self:
+                del machine.threads[self.number]
+
+
+def _split_arguments(args):
+    """Split MG arguments on commas that are not inside quotes."""
+    parts, current, quoted = [], [], False
+    for ch in args:
+        if ch == '"':
+            quoted = not quoted
+        if ch == "," and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append("".join(current))
+    return [p for p in parts if p]
@@ -0,0 +1,356 @@
+"""
+Long-running soak (burn-in) test with bounded memory.
+
+Axes are driven back and forth between start - distance/2 and start +
+distance/2 for hours or days. Nothing grows with runtime:
+
+  - Per-cycle metrics (cycle time, settled error per axis, failed 0 or 1)
+    go into rolling windows. A window keeps count/min/max/sum and a
+    fixed-size reservoir for percentiles; when it closes it becomes a
+    WindowSummary in a bounded history, which also gives the degradation
+    trend of each metric.
+  - Raw samples are spilled to CSV files in rotating chunks; the oldest
+    chunk is deleted once SPILL_CHUNKS exist.
+
+A SoakStatus with cycles per hour, the latest window of every metric and the
+trends is passed to report() periodically while the test runs.
+
+A failed cycle (command error, timeout, dropped link) does not end the test.
+It is counted in the "failed" metric and written to the spill file, and the
+cycle is retried once the controller has reconnected. Only max_failures
+consecutive failures abort the test; the final status says why it ended.
+"""
+import csv
+import logging
+import os
+import random
+import time
+from array import array
+from collections import deque
+from typing import Dict, NamedTuple
+
+from constants import SOAK_DIR
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 600.0   # length of one aggregation window
+WINDOW_SAMPLES = 4096    # values per metric and window kept for percentiles
+WINDOW_HISTORY = 512     # closed windows kept per metric (about 3.5 days of 10 minute windows)
+SPILL_CHUNK_ROWS = 100000  # raw samples per spill file
+SPILL_CHUNKS = 20          # spill files kept on disk
+REPORT_INTERVAL = 30.0     # seconds between status reports
+MOVE_TIMEOUT = 10.0        # seconds allowed for one move
+MAX_FAILURES = 5           # consecutive failed cycles before the test is aborted
+RETRY_DELAY = 2.0          # seconds after a failed cycle before it is retried
+RECONNECT_WAIT = 60.0      # seconds a retry waits for a dropped link to come back
+
+
+class WindowSummary(NamedTuple):
+    """Aggregates of one metric over one window."""
+    start: float  # time.time() of the first value
+    end: float    # time.time() of the last value
+    count: int
+    minimum: float
+    maximum: float
+    mean: float
+    p50: float
+    p95: float
+    p99: float
+
+
+class SoakStatus(NamedTuple):
+    """Live state of a soak test."""
+    elapsed_s: float
+    cycles: int
+    cycles_per_hour: float
+    windows: Dict[str, WindowSummary]  # metric -> latest window, open or closed
+    trends: Dict[str, float]           # metric -> change of the window mean per hour
+    failures: int = 0                  # failed cycles so far
+    reason: str = ""                   # why the test ended; empty while it runs
+
+
+class _Window:
+    """Running aggregates of one metric; percentiles from a uniform reservoir sample."""
+
+    def __init__(self, start):
+        self.start = self.end = start
+        self.count = 0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+        self.total = 0.0
+        self.reservoir = array("d")
+
+    def add(self, value, now):
+        self.end = now
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        if len(self.reservoir) < WINDOW_SAMPLES:
+            self.reservoir.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < WINDOW_SAMPLES:
+                self.reservoir[slot] = value
+
+    def summary(self):
+        ordered = sorted(self.reservoir)
+
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+        return WindowSummary(self.start, self.end, self.count, self.minimum, self.maximum,
+                             self.total / self.count, percentile(50), percentile(95), percentile(99))
+
+
+class RollingAggregates:
+    """Windowed statistics of named metrics with a bounded history of closed windows."""
+
+    def __init__(self, window_seconds=WINDOW_SECONDS, history=WINDOW_HISTORY):
+        self.window_seconds = window_seconds
+        self.history = {}  # metric -> deque of WindowSummary
+        self._history_size = history
+        self._open = {}    # metric -> _Window
+        self._window_start = None
+        self.closed = 0    # windows closed so far
+
+    def add(self, metric, value, now=None):
+        now = time.time() if now is None else now
+        if self._window_start is None:
+            self._window_start = now
+        elif now - self._window_start >= self.window_seconds:
+            self.roll(now)
+        window = self._open.get(metric)
+        if window is None:
+            window = self._open[metric] = _Window(now)
+        window.add(value, now)
+
+    def roll(self, now=None):
+        """Close the open windows into the history."""
+        for metric, window in self._open.items():
+            self.history.setdefault(metric, deque(maxlen=self._history_size)).append(window.summary())
+        self._open.clear()
+        self.closed += 1
+        self._window_start = time.time() if now is None else now
+
+    def latest(self):
+        """{metric: WindowSummary} of the open window, or the last closed one."""
+        latest = {metric: history[-1] for metric, history in self.history.items() if history}
+        latest.update((metric, window.summary()) for metric, window in self._open.items() if window.count)
+        return latest
+
+    def trend(self, metric):
+        """Least-squares slope of the window means of a metric, per hour; 0.0 with fewer than two windows."""
+        history = self.history.get(metric, ())
+        if len(history) < 2:
+            return 0.0
+        xs = [(summary.start + summary.end) / 7200.0 for summary in history]  # hours
+        ys = [summary.mean for summary in history]
+        x_mean, y_mean = sum(xs) / len(xs), sum(ys) / len(ys)
+        spread = sum((x - x_mean) ** 2 for x in xs)
+        if not spread:
+            return 0.0
+        return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / spread
+
+
+class SpillWriter:
+    """Raw samples appended to CSV files of chunk_rows rows, keeping the newest max_chunks files."""
+
+    HEADER = ("timestamp", "cycle", "axis", "target", "actual", "error", "move_s", "fault")
+
+    def __init__(self, directory=SOAK_DIR, prefix="soak", chunk_rows=SPILL_CHUNK_ROWS, max_chunks=SPILL_CHUNKS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}"
+        self.chunk_rows = chunk_rows
+        self.files = deque()  # paths of the chunks on disk, oldest first
+        self._max_chunks = max_chunks
+        self._chunk = 0
+        self._rows = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, row):
+        if self._file is None or self._rows >= self.chunk_rows:
+            self._rotate()
+        self._writer.writerow(row)
+        self._rows += 1
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = self._writer = None
+
+    def _rotate(self):
+        self.close()
+        path = os.path.join(self.directory, f"{self.prefix}_{self._chunk:04d}.csv")
+        self._chunk += 1
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.HEADER)
+        self._rows = 0
+        self.files.append(path)
+        while len(self.files) > self._max_chunks:
+            oldest = self.files.popleft()
+            try:
+                os.remove(oldest)
+            except OSError as e:
+                logger.warning(f"[SOAK] Could not remove spill file {oldest}: {e}")
+
+
+class SoakTest:
+    """
+    Cycle axes between start -/+ distance/2 until duration_s has passed,
+    should_stop() returns True or max_failures cycles in a row have failed.
+    report(SoakStatus) is called every report_interval seconds and whenever a
+    window closes. A failed cycle is retried after retry_delay seconds, once
+    the controller is connected again (waiting up to reconnect_wait seconds).
+    """
+
+    def __init__(self, controller, axes, distance, speed=None, dwell_ms=0, duration_s=24 * 3600,
+                 should_stop=None, report=None, report_interval=REPORT_INTERVAL, spill=None,
+                 max_failures=MAX_FAILURES, retry_delay=RETRY_DELAY, reconnect_wait=RECONNECT_WAIT):
+        if not axes or distance <= 0:
+            raise ValueError("A soak test needs at least one axis and a positive distance.")
+        self.controller = controller
+        self.axes = "".join(axes)
+        self.distance = int(distance)
+        self.speed = speed
+        self.dwell_ms = dwell_ms
+        self.duration_s = duration_s
+        self.should_stop = should_stop
+        self.report = report
+        self.report_interval = report_interval
+        self.spill = SpillWriter() if spill is None else spill
+        self.aggregates = RollingAggregates()
+        self.max_failures = max_failures
+        self.retry_delay = retry_delay
+        self.reconnect_wait = reconnect_wait
+        self.cycles = 0
+        self.failures = 0
+        self.reason = ""
+        self._started = None
+
+    def status(self):
+        elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+        rate = self.cycles * 3600.0 / elapsed if elapsed > 0 else 0.0
+        latest = self.aggregates.latest()
+        return SoakStatus(elapsed, self.cycles, rate, latest,
+                          {metric: self.aggregates.trend(metric) for metric in latest},
+                          self.failures, self.reason)
+
+    def run(self):
+        """Run the soak test and return its final SoakStatus."""
+        record = self.controller.read_data_record()
+        starts = {axis: record.axis(axis).position for axis in self.axes}
+        half = self.distance // 2
+        self._setup()
+
+        self._started = time.monotonic()
+        next_report = self._started + self.report_interval
+        windows_closed = 0
+        consecutive = 0
+        self.reason = "completed"
+        try:
+            while time.monotonic() - self._started < self.duration_s:
+                if self._stopping():
+                    self.reason = "stopped"
+                    break
+                cycle_start = time.monotonic()
+                try:
+                    if consecutive:
+                        self._setup()  # the controller may have been reset while the link was down
+                    for offset in (half, -half):
+                        self._move({axis: starts[axis] + offset for axis in self.axes})
+                except Exception as e:
+                    consecutive += 1
+                    self._record_failure(e)
+                    if consecutive >= self.max_failures:
+                        self.reason = f"aborted after {consecutive} consecutive failed cycles: {e}"
+                        logger.error(f"[SOAK] {self.reason}")
+                        break
+                    self._wait_for_controller()
+                else:
+                    consecutive = 0
+                    self.cycles += 1
+                    self.aggregates.add("cycle_s", time.monotonic() - cycle_start)
+                    self.aggregates.add("failed", 0.0)
+
+                now = time.monotonic()
+                if now >= next_report or self.aggregates.closed != windows_closed:
+                    windows_closed = self.aggregates.closed
+                    next_report = now + self.report_interval
+                    self.spill.flush()
+                    if self.report is not None:
+                        self.report(self.status())
+        finally:
+            try:
+                self.controller.send_command(f"ST{self.axes}")
+            except Exception:
+                pass
+            self.spill.close()
+        self.aggregates.roll()
+        return self.status()
+
+    def _stopping(self):
+        return self.should_stop is not None and self.should_stop()
+
+    def _setup(self):
+        setup = [f"SH{self.axes}"]
+        if self.speed:
+            setup += [f"SP{axis}={int(self.speed)}" for axis in self.axes]
+        self.controller.send_batch(setup)
+
+    def _record_failure(self, error):
+        """Count a failed cycle in the aggregates and the spill file."""
+        self.failures += 1
+        now = time.time()
+        self.aggregates.add("failed", 1.0, now)
+        fault = str(error) or type(error).__name__
+        self.spill.write((f"{now:.3f}", self.cycles, self.axes, "", "", "", "", fault))
+        logger.warning(f"[SOAK] Cycle {self.cycles + 1} failed ({fault}); failure {self.failures}")
+
+    def _wait_for_controller(self):
+        """Pause before a retry, and until a dropped link is back or reconnect_wait has passed."""
+        deadline = time.monotonic() + self.reconnect_wait
+        time.sleep(self.retry_delay)
+        while not getattr(self.controller, "g", None) and time.monotonic() < deadline and not self._stopping():
+            time.sleep(0.5)
+        try:
+            self.controller.send_command(f"ST{self.axes}")
+        except Exception:
+            pass
+
+    def _move(self, targets):
+        commands = [f"PA{axis}={target}" for axis, target in targets.items()]
+        start = time.monotonic()
+        self.controller.send_batch(commands + [f"BG{self.axes}"])
+        record = self.controller.wait_motion_complete(self.axes, MOVE_TIMEOUT)
+        move_s = time.monotonic() - start
+        if self.dwell_ms > 0:
+            time.sleep(self.dwell_ms / 1000.0)
+            record = self.controller.read_data_record()
+        now = time.time()
+        for axis, target in targets.items():
+            actual = record.axis(axis).position
+            self.aggregates.add(f"error {axis}", actual - target, now)
+            self.spill.write((f"{now:.3f}", self.cycles, axis, target, actual, actual - target, f"{move_s:.4f}", ""))
+
+
+def format_status(status):
+    """Lines describing a SoakStatus: totals, then one per metric."""
+    hours = status.elapsed_s / 3600.0
+    lines = [f"Soak: {status.cycles} cycles in {hours:.2f} h, {status.cycles_per_hour:.0f} cycles/h, "
+             f"{status.failures} failed"]
+    if status.reason:
+        lines.append(f"  Ended: {status.reason}")
+    for metric in sorted(status.windows):
+        window = status.windows[metric]
+        lines.append(f"  {metric:<10} mean {window.mean:+.4g}  p95 {window.p95:+.4g}  "
+                     f"range [{window.minimum:+.4g}, {window.maximum:+.4g}]  "
+                     f"trend {status.trends.get(metric, 0.0):+.3g}/h")
+    return lines
@@ -0,0 +1,201 @@
+"""
+The automated step test as a controller-side DMC program.
+
+Driving the 0 -> +d/2 -> -d/2 -> 0 pattern from the host costs several round
+trips and host-side sleeps per step. Here the step targets are downloaded
+into a controller array, a generated routine walks them with PA/BG/AM/WT and
+records the settled _TP of every step in a second array, and the host only
+polls the step counters until the routines end and then uploads the results
+in one transfer per axis. Step timing is set by the controller, not the network.
+
+Each axis has its own routine, arrays and variables and runs in its own
+program thread, so axes are tested concurrently. Axes listed together in an
+exclusive group are never moved at the same time; see schedule_axes().
+"""
+import logging
+import time
+from typing import List, NamedTuple
+
+from data_record import RECORD_AXES
+
+logger = logging.getLogger(__name__)
+
+# Per-axis names, formatted with the axis letter. Labels are limited to 7
+# characters and variable/array names to 8.
+PROGRAM_LABEL = "#STEP{axis}"
+LOOP_LABEL = "#SLOOP{axis}"
+TARGET_ARRAY = "stptgt{axis}"
+ACTUAL_ARRAY = "stpact{axis}"
+INDEX_VARIABLE = "stpn{axis}"
+COUNT_VARIABLE = "stpcnt{axis}"
+
+# Two arrays per axis must fit the controller's array table (16000 elements on a DMC-4143)
+MAX_STEPS = 8000  # over all axes of one test
+
+POLL_INTERVAL = 0.25  # seconds between progress polls
+STEP_TIMEOUT = 5.0    # seconds allowed per step, as in the host-driven test
+
+
+class StepTestResult(NamedTuple):
+    """Targets of a step test and the positions the axis settled at."""
+    axis: str
+    targets: List[int]
+    positions: List[int]  # one per completed step
+    completed: bool       # False if stopped or the routine ended early
+
+    @property
+    def errors(self):
+        """Settled position minus target for every completed step."""
+        return [actual - target for target, actual in zip(self.targets, self.positions)]
+
+
+def step_targets(start, total_distance, step_size):
+    """
+    Absolute targets for start -> +total/2 -> -total/2 -> start in step_size
+    increments, the last step of each leg landing exactly on its end point.
+    """
+    if step_size <= 0:
+        raise ValueError("Step size must be positive.")
+    half = total_distance // 2
+    targets = []
+    for leg_start, leg_end in ((start, start + half), (start + half, start - half), (start - half, start)):
+        direction = 1 if leg_end > leg_start else -1
+        position = leg_start
+        while (leg_end - position) * direction > 0:
+            position += direction * step_size
+            if (position - leg_end) * direction > 0:
+                position = leg_end
+            targets.append(position)
+    return targets
+
+
+def schedule_axes(axes, exclusive_groups=()):
+    """
+    Split axes into rounds that may move at the same time. Two axes that share
+    an exclusive group (e.g. "AB") never land in the same round. Rounds are
+    filled greedily in axis order, so without groups every axis is in the first.
+    """
+    rounds = []
+    for axis in axes:
+        conflicts = {other for group in exclusive_groups if axis in group
+                     for other in group if other != axis}
+        for round_axes in rounds:
+            if not conflicts.intersection(round_axes):
+                round_axes.append(axis)
+                break
+        else:
+            rounds.append([axis])
+    return rounds
+
+
+def _thread(axis):
+    """Program thread that runs an axis's routine."""
+    return RECORD_AXES.index(axis)
+
+
+def halt_commands(axes):
+    """Commands that halt the step routines of the given axes and stop their motion."""
+    return [f"HX{_thread(axis)}" for axis in axes] + [f"ST{''.join(axes)}"]
+
+
+def generate_step_program(axes, delay_ms):
+    """
+    DMC program with one routine per axis that walks its target array and
+    records each settled position. Speed is not set here: run_step_programs()
+    writes SP from the host so the controller's parameter shadow stays correct.
+    """
+    lines = []
+    for axis in axes:
+        index, targets = INDEX_VARIABLE.format(axis=axis), TARGET_ARRAY.format(axis=axis)
+        lines += [
+            PROGRAM_LABEL.format(axis=axis),
+            f"SH{axis}",
+            f"{index}=0",
+            LOOP_LABEL.format(axis=axis),
+            f"PA{axis}={targets}[{index}]",
+            f"BG{axis}",
+            f"AM{axis}",
+        ]
+        if delay_ms > 0:
+            lines.append(f"WT{int(delay_ms)}")
+        lines += [
+            f"{ACTUAL_ARRAY.format(axis=axis)}[{index}]=_TP{axis}",
+            f"{index}={index}+1",
+            f"JP{LOOP_LABEL.format(axis=axis)},{index}<{COUNT_VARIABLE.format(axis=axis)}",
+            "EN",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def run_step_programs(controller, axis_targets, speed, delay_ms, exclusive_groups=(),
+                      should_stop=None, progress=None):
+    """
+    Run the step test on the controller for every axis in axis_targets ({axis:
+    targets}) and return {axis: StepTestResult}. Axes run concurrently except
+    where exclusive_groups forbid it; pass [axes] to test one axis at a time.
+    should_stop() is checked between polls; when it returns True the routines
+    are halted and motion stopped. progress(axis, steps_done, total) is called
+    after each poll.
+    """
+    axes = [axis for axis in RECORD_AXES if axis in axis_targets]
+    total_steps = sum(len(targets) for targets in axis_targets.values())
+    if not axes or not 0 < total_steps <= MAX_STEPS or not all(axis_targets.values()):
+        raise ValueError(f"A step test needs 1 to {MAX_STEPS} steps per test and at least one per axis.")
+
+    # Halt leftovers from an earlier run; the program buffer can't be replaced while one runs
+    controller.send_batch(halt_commands(axes))
+    for axis in axes:
+        try:
+            controller.send_command(f"DA {TARGET_ARRAY.format(axis=axis)}[],{ACTUAL_ARRAY.format(axis=axis)}[]")
+        except Exception:
+            pass  # nothing dimensioned yet
+    for axis in axes:
+        count = len(axis_targets[axis])
+        controller.send_batch([
+            f"DM {TARGET_ARRAY.format(axis=axis)}[{count}],{ACTUAL_ARRAY.format(axis=axis)}[{count}]",
+            f"{COUNT_VARIABLE.format(axis=axis)}={count}",
+            f"{INDEX_VARIABLE.format(axis=axis)}=0",
+        ])
+        controller.download_array(TARGET_ARRAY.format(axis=axis), axis_targets[axis])
+    controller.apply_parameters({axis: {"SP": int(speed)} for axis in axes})
+    controller.download_program(generate_step_program(axes, delay_ms))
+
+    stopped = False
+    for round_axes in schedule_axes(axes, exclusive_groups):
+        if stopped:
+            break
+        for axis in round_axes:
+            controller.send_command(f"XQ {PROGRAM_LABEL.format(axis=axis)},{_thread(axis)}")
+        logger.info(f"[STEP] Axes {''.join(round_axes)} running on the controller")
+        longest = max(len(axis_targets[axis]) for axis in round_axes)
+        deadline = time.monotonic() + longest * (STEP_TIMEOUT + delay_ms / 1000.0)
+        while True:
+            time.sleep(POLL_INTERVAL)
+            # Step counter and thread state of every axis in one transaction
+            replies = controller.send_batch(
+                [f"MG {INDEX_VARIABLE.format(axis=axis)}" for axis in round_axes]
+                + [f"MG _XQ{_thread(axis)}" for axis in round_axes])
+            if progress is not None:
+                for axis, reply in zip(round_axes, replies):
+                    progress(axis, int(float(reply)), len(axis_targets[axis]))
+            if all(float(reply) < 0 for reply in replies[len(round_axes):]):
+                break
+            if (should_stop is not None and should_stop()) or time.monotonic() > deadline:
+                controller.send_batch(halt_commands(round_axes))
+                stopped = True
+                break
+
+    # Final counts: a halted routine may have recorded a step since the last poll
+    replies = controller.send_batch([f"MG {INDEX_VARIABLE.format(axis=axis)}" for axis in axes])
+    results = {}
+    for axis, reply in zip(axes, replies):
+        count, steps = len(axis_targets[axis]), int(float(reply))
+        positions = []
+        if steps:
+            positions = [int(value) for value in
+                         controller.upload_array(ACTUAL_ARRAY.format(axis=axis), 0, steps - 1)]
+        completed = steps == count
+        if not completed:
+            logger.warning(f"[STEP] Axis {axis}: routine ended after {steps} of {count} steps")
+        results[axis] = StepTestResult(axis, list(axis_targets[axis]), positions, completed)
+    return results
@@ -0,0 +1,208 @@
+"""
+Strip chart of recent per-axis history.
+
+Plots one field (position, following error or velocity) of every axis over
+the last span seconds, straight from the PositionSampler's ring; the chart
+never talks to the controller, so pausing and zooming are free.
+
+The history is decimated with largest-triangle-three-buckets (LTTB) to
+about one point per pixel. Buckets are aligned to absolute time, so a
+bucket's chosen point stays valid as the chart scrolls. Only buckets that
+received new samples since the last frame are evaluated, and each redraw
+costs the same whether the ring is filled at 50 Hz or by a 1 kHz record
+stream. Changing the span, the field or resuming from pause rebuilds the
+traces from the ring once.
+"""
+import logging
+import math
+from collections import deque
+
+from position_sampler import RING_FIELDS
+
+logger = logging.getLogger(__name__)
+
+REDRAW_MS = 50  # chart frame interval
+SPANS = (1.0, 2.0, 5.0, 10.0, 15.0)  # selectable seconds of history
+DEFAULT_SPAN = 5.0
+AXIS_COLORS = {"A": "#3399ff", "B": "#33ff99", "C": "#ff9933", "D": "#ff33ff"}
+MARGIN = 6  # pixels kept free above and below the traces
+
+
+def _largest_triangle(bucket, a, c):
+    """Point of bucket forming the largest triangle with point a and point c."""
+    ax, ay = a
+    cx, cy = c
+    best, best_area = bucket[0], -1.0
+    for point in bucket:
+        area = abs((ax - cx) * (point[1] - ay) - (ax - point[0]) * (cy - ay))
+        if area > best_area:
+            best, best_area = point, area
+    return best
+
+
+def _average(bucket):
+    return (sum(p[0] for p in bucket) / len(bucket), sum(p[1] for p in bucket) / len(bucket))
+
+
+class _Trace:
+    """Incremental LTTB of one series over time-aligned buckets of bucket_width seconds."""
+
+    def __init__(self, bucket_width):
+        self.bucket_width = bucket_width
+        self.final = deque()  # chosen (t, y) of buckets whose neighbours are complete
+        self.pending = []     # [bucket index, [(t, y), ...]] not final yet, oldest first
+
+    def extend(self, times, values):
+        pending = self.pending
+        for t, y in zip(times, values):
+            index = math.floor(t / self.bucket_width)
+            if pending and pending[-1][0] == index:
+                pending[-1][1].append((t, y))
+            else:
+                pending.append([index, [(t, y)]])
+        # A bucket is final once the one after it is complete, i.e. yet another has started
+        while len(pending) >= 3:
+            bucket = pending.pop(0)[1]
+            if self.final:
+                self.final.append(_largest_triangle(bucket, self.final[-1], _average(pending[0][1])))
+            else:
+                self.final.append(bucket[0])  # LTTB keeps the first point as is
+
+    def points(self, start):
+        """Decimated points from time start on, including provisional ones for the newest buckets."""
+        final = self.final
+        while final and final[0][0] < start:
+            final.popleft()
+        points = list(final)
+        pending = self.pending
+        if len(pending) == 2:
+            bucket = pending[0][1]
+            points.append(_largest_triangle(bucket, points[-1], _average(pending[1][1]))
+                          if points else bucket[0])
+        if pending:
+            points.append(pending[-1][1][-1])  # LTTB keeps the last point as is
+        return [point for point in points if point[0] >= start]
+
+
+class StripChart:
+    """Scrolling chart of a PositionRing field for every axis on a Tk canvas."""
+
+    def __init__(self, canvas, ring, field="position", span=DEFAULT_SPAN):
+        self.canvas = canvas
+        self.ring = ring
+        self.field = field
+        self.span = span
+        self.paused = False
+        self._end = None     # newest timestamp shown
+        self._next = 0       # ring sample number to read next
+        self._traces = {}
+        self._after = None
+        self._lines = {axis: canvas.create_line(0, 0, 0, 0, fill=AXIS_COLORS.get(axis, "#ffffff"), width=1)
+                       for axis in ring.axes}
+        self._caption = canvas.create_text(MARGIN, MARGIN, anchor="nw", fill="#ffffff", font=("Consolas", 8))
+        self._shown_caption = None
+        canvas.bind("<MouseWheel>", lambda event: self.zoom(-1 if event.delta > 0 else 1))
+        canvas.bind("<Button-4>", lambda event: self.zoom(-1))  # X11 wheel
+        canvas.bind("<Button-5>", lambda event: self.zoom(1))
+
+    def start(self):
+        if self._after is None:
+            self._tick()
+
+    def stop(self):
+        if self._after is not None:
+            self.canvas.after_cancel(self._after)
+            self._after = None
+
+    def set_field(self, field):
+        if field not in RING_FIELDS:
+            raise ValueError(f"Unknown strip chart field {field}.")
+        self.field = field
+        self._rebuild()
+
+    def toggle_pause(self):
+        """Freeze or resume scrolling; returns True when paused."""
+        self.paused = not self.paused
+        if not self.paused:
+            self._rebuild()
+        return self.paused
+
+    def zoom(self, steps):
+        """Step through SPANS: negative steps show less time, positive more."""
+        index = min(range(len(SPANS)), key=lambda i: abs(SPANS[i] - self.span))
+        span = SPANS[max(0, min(len(SPANS) - 1, index + steps))]
+        if span != self.span:
+            self.span = span
+            self._rebuild()
+
+    def _width(self):
+        width = self.canvas.winfo_width()
+        return width if width > 1 else int(self.canvas.cget("width"))
+
+    def _height(self):
+        height = self.canvas.winfo_height()
+        return height if height > 1 else int(self.canvas.cget("height"))
+
+    def _rebuild(self):
+        """Decimate the whole visible window again from the ring."""
+        self._traces = {}
+        self._next = self.ring.count - self.ring.capacity
+        if self.paused and self._end is not None:
+            _, times, values = self.ring.since(self._next, self.field)
+            keep = [i for i, t in enumerate(times) if self._end - self.span <= t <= self._end]
+            self._feed([times[i] for i in keep], {axis: [v[i] for i in keep] for axis, v in values.items()})
+        self._draw()
+
+    def _feed(self, times, values):
+        bucket_width = self.span / max(1, self._width())
+        for axis, series in values.items():
+            trace = self._traces.get(axis)
+            if trace is None:
+                trace = self._traces[axis] = _Trace(bucket_width)
+            trace.extend(times, series)
+
+    def _tick(self):
+        try:
+            if self.canvas.winfo_viewable():
+                self._draw()
+        except Exception as e:
+            logger.debug(f"Strip chart redraw error: {e}")
+        self._after = self.canvas.after(REDRAW_MS, self._tick)
+
+    def _draw(self):
+        if not self.paused:
+            first, times, values = self.ring.since(self._next, self.field)
+            self._next = first + len(times)
+            if times:
+                if self._end is None or not self._traces:
+                    # First frame after a rebuild: only the visible window is worth decimating
+                    keep = next((i for i, t in enumerate(times) if t >= times[-1] - self.span), 0)
+                    times, values = times[keep:], {axis: v[keep:] for axis, v in values.items()}
+                self._end = times[-1]
+                self._feed(times, values)
+        if self._end is None:
+            return
+
+        start = self._end - self.span
+        traces = {axis: trace.points(start) for axis, trace in self._traces.items()}
+        values = [y for points in traces.values() for _, y in points]
+        low, high = (min(values), max(values)) if values else (0, 0)
+        if high == low:
+            low, high = low - 1, high + 1
+        width, height = self._width(), self._height()
+        x_scale = width / self.span
+        y_scale = (height - 2 * MARGIN) / (high - low)
+        for axis, line in self._lines.items():
+            coords = []
+            for t, y in traces.get(axis, ()):
+                coords.append((t - start) * x_scale)
+                coords.append(height - MARGIN - (y - low) * y_scale)
+            if len(coords) < 4:
+                coords = [-1, -1, -1, -1]  # nothing to show; keep the item off screen
+            self.canvas.coords(line, *coords)
+
+        caption = (f"{self.field} {self.span:g} s  [{low:.6g}, {high:.6g}]"
+                   + ("  PAUSED" if self.paused else ""))
+        if caption != self._shown_caption:
+            self.canvas.itemconfig(self._caption, text=caption)
+            self._shown_caption = caption
@@ -0,0 +1,20 @@
+import os
+import re
+import sys
+
+import pytest
+
+# The application modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from galil_interface import GalilController  # noqa: E402
+
+
+@pytest.fixture
+def controller(request):
+    """A GalilController on a simulator of its own, running 1000 times faster than real time."""
+    name = re.sub(r"\W", "_", f"{request.module.__name__}_{request.node.name}")
+    controller = GalilController()
+    controller.connect(f"sim://{name}?time_scale=1000", keepalive=False)
+    yield controller
+    controller.disconnect()
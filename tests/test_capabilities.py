@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from capabilities import COMMAND_VARIANTS, CommandCapabilities
+from galil_interface import BatchCommandError
+
+
+@pytest.fixture
+def capabilities(controller, tmp_path):
+    return CommandCapabilities(controller, path=str(tmp_path / "capabilities.json"))
+
+
+def test_set_ip_uses_the_comma_form_first(capabilities, controller):
+    sent = capabilities.run("set_ip", ip="10.0.0.7", ip_commas="10,0,0,7")
+    assert sent == ["IP 10,0,0,7"]
+    assert capabilities.templates("set_ip") == COMMAND_VARIANTS["set_ip"][0]
+    assert controller.send_command("MG _IP").strip() == "10, 0, 0, 7"
+
+
+def test_resolved_templates_are_saved_per_firmware(capabilities, controller, tmp_path):
+    controller.send_command("SHA")
+    capabilities.run("move_absolute", axis="A", position=1000)
+    with open(str(tmp_path / "capabilities.json")) as f:
+        saved = json.load(f)
+    assert saved[capabilities.firmware]["move_absolute"] == list(COMMAND_VARIANTS["move_absolute"][0])
+
+
+def test_out_of_range_is_not_treated_as_a_syntax_error(capabilities, controller, monkeypatch):
+    sent = []
+    send_batch = controller.send_batch
+
+    def recording_send_batch(commands, *args, **kwargs):
+        sent.append(list(commands))
+        return send_batch(commands, *args, **kwargs)
+
+    monkeypatch.setattr(controller, "send_batch", recording_send_batch)
+    with pytest.raises(BatchCommandError) as excinfo:
+        capabilities.run("set_ip", ip="10.0.0.1000", ip_commas="10,0,0,1000")
+    assert excinfo.value.reason.startswith("6 ")
+    # Code 6 is about the value, so no other spelling is tried
+    assert sent == [["IP 10,0,0,1000"]]
+    assert capabilities.templates("set_ip") is None
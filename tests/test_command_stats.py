@@ -0,0 +1,54 @@
+import pytest
+
+from command_stats import (_BUCKETS, _MAX_MICROSECONDS, QUEUE_WAIT, CommandStats, LatencyHistogram,
+                           _bucket_index, _bucket_upper)
+
+
+def test_buckets_are_contiguous_and_within_six_percent():
+    us = 0
+    for index in range(_BUCKETS):
+        upper = _bucket_upper(index)
+        assert _bucket_index(us) == index
+        assert _bucket_index(upper) == index
+        assert upper - us <= max(1, upper * 0.0625)
+        us = upper + 1
+    assert _bucket_upper(_BUCKETS - 1) == _MAX_MICROSECONDS
+
+
+def test_small_latencies_are_exact():
+    histogram = LatencyHistogram()
+    for us in (1, 2, 3, 30):
+        histogram.record(us / 1e6)
+    assert histogram.percentile(50) == pytest.approx(2e-6)
+    assert histogram.percentile(100) == pytest.approx(30e-6)
+
+
+def test_percentiles_are_within_bucket_error():
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1e3)
+    for p in (50, 90, 99):
+        assert histogram.percentile(p) == pytest.approx(p / 1e3, rel=0.0625)
+    assert histogram.percentile(100) == pytest.approx(0.1)
+    assert histogram.mean == pytest.approx(0.0505)
+
+
+def test_slow_transactions_are_clamped_but_max_is_kept():
+    histogram = LatencyHistogram()
+    histogram.record(500.0)
+    assert histogram.counts[_BUCKETS - 1] == 1
+    assert histogram.percentile(99) == pytest.approx(_MAX_MICROSECONDS / 1e6)
+    assert histogram.max == 500.0
+
+
+def test_snapshot_counts_errors_per_opcode():
+    stats = CommandStats()
+    stats.record("TP", 0.002)
+    stats.record("TP", 0.004, error=True)
+    stats.record(QUEUE_WAIT, 0.001)
+    snapshot = stats.snapshot()
+    assert set(snapshot) == {QUEUE_WAIT, "TP"}
+    assert snapshot["TP"]["count"] == 2
+    assert snapshot["TP"]["errors"] == 1
+    assert snapshot[QUEUE_WAIT]["errors"] == 0
+    assert snapshot["TP"]["max_ms"] == pytest.approx(4.0)
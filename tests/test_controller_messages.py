@@ -0,0 +1,49 @@
+import queue
+
+import pytest
+
+from controller_messages import (ControllerError, MessageParser, MessageSubscription, PositionReport,
+                                 UserMessage, parse_message)
+
+
+def test_lines_split_across_chunks_are_reassembled():
+    parser = MessageParser()
+    assert parser.feed("POS 10") == []
+    events = parser.feed("0, 200\r\nhel")
+    assert [type(e) for e in events] == [PositionReport]
+    assert events[0].positions == {"A": 100, "B": 200}
+    assert events[0].text == "POS 100, 200"
+    events = parser.feed("lo\n\n")
+    assert [(type(e), e.text) for e in events] == [(UserMessage, "hello")]
+
+
+def test_one_chunk_can_hold_several_lines():
+    events = MessageParser().feed("ERR 20 Begin not valid\n?\nPOS A=5 C=-7\n")
+    assert [type(e) for e in events] == [ControllerError, ControllerError, PositionReport]
+    assert events[0].code == 20
+    assert events[1].code is None
+    assert events[2].positions == {"A": 5, "C": -7}
+    assert len({e.timestamp for e in events}) == 1
+
+
+@pytest.mark.parametrize("line", [
+    "POS",                  # no positions
+    "POS 1, 2, 3, 4, 5",    # more values than axes
+    "POS A=1 Z=2",          # not an axis
+    "POS 1, two",
+])
+def test_malformed_position_reports_are_user_messages(line):
+    event = parse_message(line, timestamp=1.0)
+    assert event == UserMessage(line, 1.0)
+
+
+def test_full_subscription_drops_the_oldest_event():
+    subscription = MessageSubscription(maxsize=2, kinds=(PositionReport,))
+    assert not subscription.wants(UserMessage("x", 0.0))
+    for n in range(3):
+        subscription.put(UserMessage(str(n), 0.0))
+    assert subscription.dropped == 1
+    assert subscription.get(timeout=0).text == "1"
+    assert [e.text for e in subscription.drain()] == ["2"]
+    with pytest.raises(queue.Empty):
+        subscription.get(timeout=0)
@@ -0,0 +1,60 @@
+import itertools
+
+from constants import DEFAULT_CLICKS_PER_TURN
+from encoder_overlay import EncoderOverlay
+
+
+class RecordingCanvas:
+    """Just enough of a Tk canvas: remembers coords and text per item."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.coordinates = {}
+        self.text = {}
+
+    def create_oval(self, *coords, **options):
+        return next(self._ids)
+
+    def create_text(self, *coords, **options):
+        return next(self._ids)
+
+    def coords(self, item, *coords):
+        self.coordinates[item] = coords
+
+    def itemconfig(self, item, **options):
+        if "text" in options:
+            self.text[item] = options["text"]
+
+
+class Source:
+    def __init__(self, positions):
+        self.positions = positions
+
+    def latest(self):
+        return 1.0, self.positions
+
+
+def dot_center(canvas, overlay, axis):
+    x1, y1, x2, y2 = canvas.coordinates[overlay._items[axis]["dot"]]
+    return (x1 + x2) / 2, (y1 + y2) / 2
+
+
+def test_each_axis_uses_its_own_counts_per_turn():
+    canvas = RecordingCanvas()
+    overlay = EncoderOverlay(canvas, Source({"A": 16000, "B": 16000}), center=(0, 0), radius=100, axes="AB",
+                             clicks_per_turn={"A": 64000, "B": 8000})
+    overlay.update()
+    # A is a quarter turn round; B has made two whole turns and is back at zero
+    a_x, a_y = dot_center(canvas, overlay, "A")
+    b_x, b_y = dot_center(canvas, overlay, "B")
+    assert (round(a_x), round(a_y)) == (0, 100)
+    assert (round(b_x), round(b_y)) == (100 - 18, 0)
+    assert canvas.text[overlay._items["A"]["label"]] == "A +0 turns"
+    assert canvas.text[overlay._items["B"]["label"]] == "B +2 turns"
+
+
+def test_missing_counts_fall_back_to_the_default():
+    overlay = EncoderOverlay(RecordingCanvas(), Source({}), axes="AB", clicks_per_turn={"A": 4000, "B": None})
+    assert overlay.clicks_per_turn == {"A": 4000, "B": DEFAULT_CLICKS_PER_TURN}
+    assert EncoderOverlay(RecordingCanvas(), Source({}), axes="AB", clicks_per_turn=1000).clicks_per_turn == \
+        {"A": 1000, "B": 1000}
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+from galil_interface import (BATCH_LINE_LIMIT, PRIORITY_NORMAL, PRIORITY_POLL, BatchCommandError, GalilController,
+                              _pack_commands)
+from motor_setup import configure_axes
+
+
+def test_submit_without_connection_raises_connection_error():
+    with pytest.raises(ConnectionError):
+        GalilController().submit(lambda g: None)
+
+
+def test_submit_after_disconnect_raises_connection_error(controller):
+    controller.disconnect()
+    with pytest.raises(ConnectionError):
+        controller.submit_command("NO")
+
+
+def test_stop_jumps_ahead_of_queued_work(controller):
+    release = threading.Event()
+    order = []
+    blocker = controller.submit(lambda g: release.wait(1.0))
+    futures = [controller.submit(lambda g: order.append("poll"), PRIORITY_POLL),
+               controller.submit(lambda g: order.append("normal"), PRIORITY_NORMAL),
+               controller.submit_command("STA")]
+    futures[2].add_done_callback(lambda f: order.append("stop"))
+    release.set()
+    for future in [blocker] + futures:
+        future.result(1.0)
+    assert order == ["stop", "normal", "poll"]
+
+
+def test_pack_commands_fills_lines_up_to_the_limit():
+    commands = ["KPA=10", "KPB=10", "KPC=10", "KPD=10"]  # 6 characters each
+    assert _pack_commands(commands, 13) == [["KPA=10", "KPB=10"], ["KPC=10", "KPD=10"]]
+    assert _pack_commands(commands, 12) == [[c] for c in commands]
+    assert _pack_commands(["X" * 100, "NO"], BATCH_LINE_LIMIT) == [["X" * 100], ["NO"]]
+    packets = _pack_commands([f"SP{a}={n}" for n in range(10) for a in "ABCD"], BATCH_LINE_LIMIT)
+    assert all(len(";".join(packet)) <= BATCH_LINE_LIMIT for packet in packets)
+    assert sum(len(packet) for packet in packets) == 40
+
+
+def test_batch_returns_one_response_per_command(controller):
+    commands = ["DPA=5", "MG _TPA"] + [f"SP{a}={1000 + i}" for i in range(20) for a in "AB"] + ["MG _SPB"]
+    responses = controller.send_batch(commands, line_limit=30)
+    assert len(responses) == len(commands)
+    assert responses[:2] == ["", "5.0000"]
+    assert responses[-1] == "1019.0000"
+
+
+def test_batch_error_names_the_rejected_command(controller):
+    commands = ["SPA=100", "SPB=200", "SPC=300", "XYZZY", "SPD=400"]
+    with pytest.raises(BatchCommandError) as raised:
+        controller.send_batch(commands, line_limit=16)  # two commands per line
+    error = raised.value
+    assert error.index == 3 and error.command == "XYZZY"
+    assert error.responses == ["", "", ""]
+    assert "Unrecognized command" in str(error)
+    assert controller.send_command("MG _SPC") == "300.0000"
+    assert controller.send_command("MG _SPD") != "400.0000"  # nothing after the error ran
+
+
+def test_configure_axes_writes_every_axis(controller):
+    presets = {axis: {"kp": 7, "sp": 4000 + i} for i, axis in enumerate("ABCD")}
+    sent = configure_axes(controller, presets)
+    assert sorted(sent) == sorted([f"KP{a}=7.0" for a in "ABCD"] + [f"SP{a}={4000 + i}" for i, a in enumerate("ABCD")])
+    assert controller.send_command("MG _SPD") == "4003.0000"
+    with pytest.raises(ValueError):
+        configure_axes(controller, {"E": {"kp": 1}})
+
+
+def test_apply_parameters_skips_values_already_written(controller):
+    assert controller.apply_parameters({"A": {"KP": 8.0, "SP": 3000}}) == ["KPA=8.0", "SPA=3000"]
+    assert controller.apply_parameters({"A": {"KP": 8, "SP": 3000.0}}) == []
+    assert controller.apply_parameters({"A": {"KP": 8.0, "SP": 3500}}) == ["SPA=3500"]
+
+
+def test_commands_sent_directly_update_the_shadow(controller):
+    controller.send_command("SPB=1234")
+    controller.send_batch(["KP B=9"])
+    assert controller.apply_parameters({"B": {"SP": 1234, "KP": 9}}) == []
+
+
+def test_rejected_commands_do_not_update_the_shadow(controller):
+    with pytest.raises(BatchCommandError):
+        controller.send_batch(["XYZZY", "SPC=777"])
+    assert controller.apply_parameters({"C": {"SP": 777}}) == ["SPC=777"]
+
+
+def test_reset_and_invalidation_forget_the_shadow(controller):
+    parameters = {"A": {"SP": 2000}, "B": {"SP": 2000}}
+    controller.apply_parameters(parameters)
+    controller.invalidate_shadow("A")
+    assert controller.apply_parameters(parameters) == ["SPA=2000"]
+    controller.send_command("RS")
+    assert controller.send_command("MG _SPB") == "25000.0000"
+    assert controller.apply_parameters(parameters) == ["SPA=2000", "SPB=2000"]
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from plan_runner import PlanRunner, default_plans, format_result, load_test_plans, validate_plan
+
+
+def plan(steps, axes=("A",)):
+    return {"name": "test", "axes": list(axes), "steps": steps}
+
+
+def test_missing_file_is_created_with_default_plans(tmp_path):
+    path = tmp_path / "test_plans.json"
+    plans = load_test_plans(str(path))
+    assert set(plans) == {p["name"] for p in default_plans["plans"]}
+    assert json.loads(path.read_text()) == default_plans
+
+
+def test_malformed_plan_file_raises(tmp_path):
+    path = tmp_path / "test_plans.json"
+    path.write_text(json.dumps({"plans": [plan([{"type": "jump"}])]}))
+    with pytest.raises(ValueError, match="type must be one of"):
+        load_test_plans(str(path))
+
+
+@pytest.mark.parametrize("step, message", [
+    ({"type": "move", "axes": {"B": 100}}, "not in the plan's axes"),
+    ({"type": "settings", "axes": {"A": {"SP": 1}, "C": {"SP": 1}}}, "not in the plan's axes"),
+    ({"type": "capture", "limits": {"error": [-5]}}, r"numeric \[low, high\] pair"),
+    ({"type": "capture", "limits": {"error": ["-5", 5]}}, r"numeric \[low, high\] pair"),
+    ({"type": "capture", "limits": {"error": [5, -5]}}, r"numeric \[low, high\] pair"),
+    ({"type": "capture", "limits": {"torque": 3}}, r"numeric \[low, high\] pair"),
+    ({"type": "repeat", "count": 2, "steps": [{"type": "move", "axes": {"D": 1}}]}, "not in the plan's axes"),
+    ({"type": "dwell", "ms": -1}, "non-negative"),
+])
+def test_invalid_steps_are_rejected(step, message):
+    with pytest.raises(ValueError, match=message):
+        validate_plan(plan([step]))
+
+
+def test_quick_check_passes_on_simulator(controller):
+    quick = next(p for p in default_plans["plans"] if p["name"] == "quick_check")
+    result = PlanRunner(controller).run(quick)
+    assert result["passed"], format_result(result)
+    assert result["error"] is None
+    assert [step["type"] for step in result["steps"]] == [step["type"] for step in quick["steps"]]
+    json.dumps(result)
+
+
+def test_command_error_fails_step_and_ends_plan(controller):
+    steps = [
+        {"type": "command", "name": "servo on", "commands": ["SHA"]},
+        {"type": "command", "name": "bad", "commands": ["SPA=100", "XYZZY"]},
+        {"type": "move", "axes": {"A": 100}, "relative": True},
+    ]
+    result = PlanRunner(controller).run(plan(steps))
+    assert not result["passed"] and not result["stopped"]
+    assert "XYZZY" in result["error"]
+    assert [step["name"] for step in result["steps"]] == ["servo on", "bad"]
+    assert result["steps"][0]["passed"]
+    assert not result["steps"][1]["passed"]
+    assert result["steps"][1]["failures"] == [result["error"]]
+    assert "ended early" in format_result(result)
+
+
+def test_move_timeout_stops_axes_and_ends_plan(controller):
+    steps = [
+        {"type": "command", "name": "servo on", "commands": ["SHA", "SPA=1000"]},
+        {"type": "move", "name": "slow", "axes": {"A": 1000000}, "timeout": 0.05},
+        {"type": "capture", "name": "after"},
+    ]
+    result = PlanRunner(controller).run(plan(steps))
+    assert not result["passed"] and not result["stopped"]
+    assert "still moving" in result["error"]
+    assert [step["name"] for step in result["steps"]] == ["servo on", "slow"]
+    assert result["steps"][1]["failures"] == [result["error"]]
+    controller.wait_motion_complete("A", 1.0)
+    assert controller.send_command("MG _TPA") != "1000000.0000"
+
+
+def test_lost_connection_is_reported_in_result(controller):
+    class Dropping:
+        address = controller.address
+
+        def read_data_record(self):
+            return controller.read_data_record()
+
+        def send_batch(self, commands):
+            raise ConnectionError("Controller not connected.")
+
+    result = PlanRunner(Dropping()).run(plan([{"type": "command", "commands": ["SHA"]},
+                                              {"type": "dwell", "ms": 0}]))
+    assert not result["passed"]
+    assert result["error"] == "Controller not connected."
+    assert len(result["steps"]) == 1
+
+
+def test_capture_limits_fail_the_step(controller):
+    steps = [{"type": "capture", "fields": ["position"], "limits": {"position": [1, 2]}}]
+    controller.send_command("DPA=0")
+    result = PlanRunner(controller).run(plan(steps))
+    assert not result["passed"] and result["error"] is None
+    assert result["steps"][0]["failures"] == ["axis A position 0 outside [1, 2]"]
+
+
+def test_should_stop_ends_plan_as_stopped(controller):
+    result = PlanRunner(controller, should_stop=lambda: True).run(plan([{"type": "dwell", "ms": 0}]))
+    assert result["stopped"] and not result["passed"]
+    assert result["steps"] == []
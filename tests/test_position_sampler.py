@@ -0,0 +1,56 @@
+from data_record import RECORD_AXES, AxisRecord, DataRecord
+from position_sampler import PositionRing
+
+
+def record(value):
+    """A DataRecord whose axes hold position value + index, error -value and velocity 2 * value."""
+    axes = tuple(AxisRecord(status=0, switches=0, stop_code=0, reference=value, position=value + i,
+                            error=-value, velocity=2 * value, torque=0)
+                 for i in range(len(RECORD_AXES)))
+    return DataRecord(value, 0, axes)
+
+
+def filled(count, capacity=8):
+    ring = PositionRing(capacity)
+    for n in range(count):
+        ring.append(float(n), record(n))
+    return ring
+
+
+def test_since_before_wraparound():
+    ring = filled(5)
+    first, times, values = ring.since(2)
+    assert first == 2
+    assert times == [2.0, 3.0, 4.0]
+    assert values["A"] == [2, 3, 4] and values["D"] == [5, 6, 7]
+
+
+def test_since_across_wraparound():
+    ring = filled(13)  # slots hold samples 8..12, then 5..7
+    first, times, values = ring.since(6)
+    assert first == 6
+    assert times == [float(n) for n in range(6, 13)]
+    assert values["B"] == [n + 1 for n in range(6, 13)]
+
+
+def test_since_overwritten_samples_are_skipped():
+    ring = filled(20)
+    first, times, values = ring.since(3)
+    assert first == 12  # the oldest sample still in the ring
+    assert times == [float(n) for n in range(12, 20)]
+    assert ring.since(20) == (20, [], {axis: [] for axis in RECORD_AXES})
+
+
+def test_since_other_fields():
+    ring = filled(10)
+    _, _, errors = ring.since(8, "error")
+    _, _, velocities = ring.since(8, "velocity")
+    assert errors["C"] == [-8, -9]
+    assert velocities["C"] == [16, 18]
+
+
+def test_latest_and_history_after_wraparound():
+    ring = filled(11)
+    assert ring.latest() == (10.0, {"A": 10, "B": 11, "C": 12, "D": 13})
+    assert ring.history("A", 3) == ([8.0, 9.0, 10.0], [8, 9, 10])
+    assert PositionRing(4).latest() is None
@@ -0,0 +1,73 @@
+import math
+
+import pytest
+
+from repeatability import (RepeatabilityResult, _statistics_python, analyze, bidirectional_targets,
+                           format_result)
+
+ROOT2 = math.sqrt(2)
+
+# Two targets, two cycles. Deviations per cycle: up at 0 and 100, then down at 100 and 0
+DEVIATIONS = [1, 2, -3, -1,
+              3, 2, -1, -3]
+
+
+def settled_run(deviations, positions=(0, 100), overshoot=10, cycles=2):
+    targets, measured = bidirectional_targets(positions, overshoot, cycles)
+    settled = list(targets)
+    for index, deviation in zip(measured, deviations):
+        settled[index] += deviation
+    return targets, measured, settled
+
+
+def test_targets_follow_the_linear_cycle():
+    targets, measured = bidirectional_targets([100, 0], overshoot=10, cycles=2)
+    assert targets[:8] == [-10, 0, 90, 100, 110, 100, 10, 0]
+    assert targets[8:] == targets[:8]
+    assert measured == [1, 3, 5, 7, 9, 11, 13, 15]
+
+
+@pytest.mark.parametrize("kwargs", [dict(positions=[]), dict(overshoot=0), dict(cycles=1)])
+def test_targets_reject_bad_arguments(kwargs):
+    arguments = dict(positions=[0, 100], overshoot=10, cycles=2)
+    arguments.update(kwargs)
+    with pytest.raises(ValueError):
+        bidirectional_targets(**arguments)
+
+
+def check_hand_computed(result):
+    # up:   0 -> [1, 3] mean 2 s sqrt2;  100 -> [2, 2] mean 2 s 0
+    # down: 0 -> [-1, -3] mean -2 s sqrt2;  100 -> [-3, -1] mean -2 s sqrt2
+    assert result.cycles == 2
+    assert result.mean_up == pytest.approx([2, 2])
+    assert result.mean_down == pytest.approx([-2, -2])
+    assert result.repeatability_up == pytest.approx(4 * ROOT2)
+    assert result.repeatability_down == pytest.approx(4 * ROOT2)
+    assert result.repeatability == pytest.approx(2 * ROOT2 + 2 * ROOT2 + 4)  # at target 0
+    assert result.backlash == pytest.approx(4)
+    assert result.hysteresis == pytest.approx(4)
+    assert result.accuracy == pytest.approx((2 + 2 * ROOT2) - (-2 - 2 * ROOT2))
+    assert result.suggested_backlash == -4
+
+
+def test_hand_computed_case():
+    targets, measured, settled = settled_run(DEVIATIONS)
+    check_hand_computed(analyze("A", [0, 100], targets, settled, measured))
+
+
+def test_python_statistics():
+    check_hand_computed(RepeatabilityResult("A", [0, 100], 2, *_statistics_python(DEVIATIONS, 2, 2)))
+
+
+def test_numpy_statistics():
+    numpy = pytest.importorskip("numpy")
+    from repeatability import _statistics_numpy
+    check_hand_computed(RepeatabilityResult("A", [0, 100], 2, *_statistics_numpy(numpy, DEVIATIONS, 2, 2)))
+
+
+def test_incomplete_cycles_are_ignored():
+    targets, measured, settled = settled_run(DEVIATIONS + [50, 50], cycles=3)
+    result = analyze("A", [0, 100], targets, settled[:measured[9] + 1], measured)
+    check_hand_computed(result)
+    assert analyze("A", [0, 100], targets, settled[:measured[6] + 1], measured) is None
+    assert "Suggested backlash compensation: -4 counts" in format_result(result)
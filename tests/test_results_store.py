@@ -0,0 +1,59 @@
+import math
+import time
+
+import pytest
+
+from results_store import ResultStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    yield store
+    store.close()
+
+
+def test_run_round_trip(store):
+    started = time.time() - 60
+    store.record_run("plan", "quick_check", 40001, [("A", 0, 100, 103, 0.5), ("B", 0, 100, None, None)],
+                     passed=True, duration_s=1.5, firmware="fw", address="sim://x", started=started,
+                     details={"stopped": False})
+    store.flush()
+    runs = store.recent_runs("40001")
+    assert runs == [{"id": 1, "started": started, "serial": "40001", "kind": "plan", "name": "quick_check",
+                     "passed": 1, "duration_s": 1.5}]
+    assert store.recent_runs("99999") == []
+
+
+def test_error_distribution(store):
+    errors = [-2, 0, 0, 1, 1, 1, 3, 10]
+    store.record_run("host", "sweep", "1", [("A", i, 1000, 1000 + e, None) for i, e in enumerate(errors)])
+    store.record_run("host", "sweep", "1", [("C", 0, 0, 500, None)])  # other axis
+    store.record_run("host", "sweep", "2", [("A", 0, 0, 500, None)])  # other controller
+    store.flush()
+    distribution = store.error_distribution("A", "1")
+    assert distribution.count == len(errors)
+    assert distribution.mean == pytest.approx(sum(errors) / len(errors))
+    assert distribution.std == pytest.approx(math.sqrt(91.5 / 8))  # population std about the mean 1.75
+    assert (distribution.minimum, distribution.maximum) == (-2, 10)
+    assert (distribution.p50, distribution.p95, distribution.p99) == (1, 10, 10)
+    assert distribution.histogram == {-2: 1, 0: 2, 1: 3, 3: 1, 10: 1}
+    assert store.error_distribution("B", "1") is None
+
+
+def test_old_samples_fall_out_of_the_window(store):
+    now = time.time()
+    store.record_run("host", "old", "1", [("A", 0, 0, 50, None)], started=now - 40 * 86400)
+    store.record_run("host", "new", "1", [("A", 0, 0, 5, None)], started=now)
+    store.flush()
+    assert store.error_distribution("A", "1", days=30).count == 1
+    assert store.error_distribution("A", "1", days=90).count == 2
+
+
+def test_daily_trend(store):
+    day = 86400.0
+    today = (time.time() // day) * day
+    store.record_run("host", "a", "1", [("A", 0, 0, 2, None), ("A", 1, 0, -6, None)], started=today - day + 10)
+    store.record_run("host", "b", "1", [("A", 0, 0, 1, None)], started=today + 10)
+    store.flush()
+    assert store.daily_trend("A", "1") == [(today - day, 2, -2.0, 6), (today, 1, 1.0, 1)]
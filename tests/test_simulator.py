@@ -0,0 +1,86 @@
+import struct
+
+import pytest
+
+from data_record import (DR_METHOD, QR_METHOD, RECORD_SIZE, STATUS_MOTOR_OFF, STATUS_MOVING, STATUS_NEGATIVE,
+                         STATUS_POSITION_MODE, parse_data_record)
+from simulator import QUESTION_MARK, SimulatedController, SimulatorError, _Profile, _trapezoid
+
+
+@pytest.fixture
+def handle(request):
+    SimulatedController.discard_machines()
+    handle = SimulatedController()
+    handle.GOpen("sim://simulator?time_scale=100")
+    yield handle
+    handle.GClose()
+    SimulatedController.discard_machines()
+
+
+def test_trapezoid_reaches_speed_and_cruises():
+    # 100000 counts at SP 25000, AC = DC = 256000: 1220.7 counts to reach speed, the same to stop
+    segments = _trapezoid(100000, 25000, 256000, 256000)
+    assert segments == [(25000 / 256000, 256000), ((100000 - 2 * 25000 ** 2 / 512000) / 25000, 0.0),
+                        (25000 / 256000, -256000)]
+    position, velocity, _, done = _Profile(0.0, 0.0, 0.0, segments).sample(10.0)
+    assert done and position == pytest.approx(100000) and velocity == pytest.approx(0, abs=1e-9)
+
+
+def test_short_move_is_triangular():
+    segments = _trapezoid(-1000, 25000, 256000, 128000)
+    (t_accel, accel), (cruise, _), (t_decel, decel) = segments
+    assert cruise == 0.0 and accel < 0 < decel
+    peak = t_accel * abs(accel)
+    assert peak < 25000 and peak == pytest.approx(t_decel * decel)
+    assert _Profile(0.0, 0.0, 0.0, segments).sample(1.0)[0] == pytest.approx(-1000)
+
+
+def test_move_takes_the_profile_time(handle):
+    handle.GCommand("SHA;SPA=25000;ACA=256000;DCA=256000;PRA=100000;BGA")
+    expected = sum(duration for duration, _ in _trapezoid(100000, 25000, 256000, 256000))
+    remaining = SimulatedController.machine_for("sim://simulator").motion_remaining("A")
+    assert remaining == pytest.approx(expected, abs=0.2)  # 2 ms of real time at time_scale 100
+    handle.GMotionComplete("A")
+    assert handle.GCommand("MG _TPA") == "100000.0000"
+
+
+def test_question_mark_ends_the_line(handle):
+    assert handle.GCommandRaw("SPA=100;XYZ;SPB=5") == ":?"
+    assert handle.GCommand("MG _SPA") == "100.0000"
+    assert handle.GCommand("MG _SPB") == "25000.0000"  # not executed after the error
+    assert handle.GCommand("TC1") == "1 Unrecognized command"
+    with pytest.raises(SimulatorError, match=QUESTION_MARK):
+        handle.GCommand("BGA")  # motor off
+    assert handle.GCommand("TC1") == "20 Begin not valid with motor off"
+
+
+def test_responses_of_a_line(handle):
+    assert handle.GCommandRaw("MG 1;DPA=5;MG _TPA") == " 1.0000\r\n:: 5.0000\r\n:"
+
+
+def test_qr_record_layout(handle):
+    handle.GCommand("DPA=123;DPB=-5;SHA")
+    raw = handle.GRecord(QR_METHOD)
+    assert len(raw) == RECORD_SIZE
+    assert struct.unpack_from("<BBH", raw) == (0x8F, 0, RECORD_SIZE)
+    record = parse_data_record(raw)
+    assert record.positions == (123, -5, 0, 0)
+    assert record.axis("A").status & STATUS_MOTOR_OFF == 0
+    assert record.axis("B").status & STATUS_MOTOR_OFF
+
+
+def test_qr_record_during_a_move(handle):
+    handle.GCommand("SHA;SPA=1000;PAA=-100000;BGA")
+    axis = parse_data_record(handle.GRecord(QR_METHOD)).axis("A")
+    assert axis.moving
+    assert axis.status & STATUS_MOVING and axis.status & STATUS_POSITION_MODE and axis.status & STATUS_NEGATIVE
+    assert axis.velocity < 0 and axis.stop_code == 0
+
+
+def test_dr_records_arrive_on_the_period(handle):
+    handle.GTimeout(100)
+    with pytest.raises(SimulatorError, match="timed out"):
+        handle.GRecord(DR_METHOD)  # no DR period set
+    handle.GCommand("DR 8")
+    numbers = [parse_data_record(handle.GRecord(DR_METHOD)).sample_number for _ in range(5)]
+    assert all(b > a and (b - a) % 8 == 0 for a, b in zip(numbers, numbers[1:]))
@@ -0,0 +1,91 @@
+import csv
+
+import pytest
+
+from soak import RollingAggregates, SoakTest, SpillWriter, format_status
+
+
+def test_window_aggregates():
+    aggregates = RollingAggregates(window_seconds=10)
+    for i, value in enumerate([3.0, 1.0, 2.0, 4.0]):
+        aggregates.add("m", value, now=100.0 + i)
+    window = aggregates.latest()["m"]
+    assert (window.start, window.end, window.count) == (100.0, 103.0, 4)
+    assert (window.minimum, window.maximum, window.mean) == (1.0, 4.0, 2.5)
+    assert (window.p50, window.p95, window.p99) == (3.0, 4.0, 4.0)
+    assert aggregates.closed == 0 and aggregates.history == {}
+
+
+def test_windows_close_into_bounded_history():
+    aggregates = RollingAggregates(window_seconds=10, history=3)
+    for window in range(5):
+        for i in range(10):
+            aggregates.add("m", float(window), now=window * 10.0 + i)
+    aggregates.roll(50.0)
+    assert aggregates.closed == 5
+    assert [summary.mean for summary in aggregates.history["m"]] == [2.0, 3.0, 4.0]
+    # Means rise by 1 every 10 s
+    assert aggregates.trend("m") == pytest.approx(360.0)
+    assert aggregates.trend("other") == 0.0
+
+
+def test_spill_rotates_and_keeps_newest_chunks(tmp_path):
+    spill = SpillWriter(str(tmp_path), chunk_rows=3, max_chunks=2)
+    for row in range(8):
+        spill.write((row,) + ("",) * (len(SpillWriter.HEADER) - 1))
+    spill.close()
+    assert len(spill.files) == 2
+    assert sorted(str(path) for path in tmp_path.iterdir()) == sorted(spill.files)
+    with open(spill.files[-1], newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == list(SpillWriter.HEADER)
+    assert [row[0] for row in rows[1:]] == ["6", "7"]
+
+
+class FlakyController:
+    """A simulated controller whose BG batches fail while failing() is True."""
+
+    def __init__(self, controller, failing):
+        self._controller = controller
+        self.failing = failing
+
+    def __getattr__(self, name):
+        return getattr(self._controller, name)
+
+    def send_batch(self, commands):
+        if commands[-1].startswith("BG") and self.failing():
+            raise ConnectionError("Controller not connected.")
+        return self._controller.send_batch(commands)
+
+
+def soak(controller, tmp_path, **kwargs):
+    return SoakTest(controller, "A", 2000, speed=200000, spill=SpillWriter(str(tmp_path)),
+                    retry_delay=0, reconnect_wait=0, **kwargs)
+
+
+def test_failed_cycles_are_counted_and_retried(controller, tmp_path):
+    moves = []
+
+    def failing():
+        moves.append(None)
+        return len(moves) in (3, 4)  # the first move of the second cycle, then of its retry
+
+    test = soak(FlakyController(controller, failing), tmp_path, should_stop=lambda: test.cycles >= 3,
+                max_failures=3)
+    status = test.run()
+    assert status.cycles == 3
+    assert status.failures == 2
+    assert status.reason == "stopped"
+    failed = status.windows["failed"]
+    assert (failed.count, failed.mean) == (5, pytest.approx(0.4))
+    with open(test.spill.files[0], newline="") as f:
+        faults = [row["fault"] for row in csv.DictReader(f) if row["fault"]]
+    assert faults == ["Controller not connected."] * 2
+
+
+def test_consecutive_failures_abort_with_reason(controller, tmp_path):
+    test = soak(FlakyController(controller, lambda: True), tmp_path, max_failures=4)
+    status = test.run()
+    assert status.cycles == 0 and status.failures == 4
+    assert status.reason == "aborted after 4 consecutive failed cycles: Controller not connected."
+    assert "  Ended: " + status.reason in format_status(status)
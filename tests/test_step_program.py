@@ -0,0 +1,29 @@
+from motor_setup import configure_axis
+from step_program import halt_commands, run_step_programs, step_targets
+
+
+def test_step_test_settles_on_every_target(controller):
+    targets = step_targets(0, 2000, 500)
+    results = run_step_programs(controller, {"A": targets, "C": targets}, speed=50000, delay_ms=0)
+    for axis in "AC":
+        assert results[axis].completed
+        assert results[axis].positions == targets
+        assert not any(results[axis].errors)
+
+
+def test_axis_speed_is_restored_after_a_step_test(controller):
+    configure_axis(controller, "A", {"sp": 5000})
+    run_step_programs(controller, {"A": step_targets(0, 1000, 500)}, speed=50000, delay_ms=0)
+    assert controller.send_command("MG _SPA") == "50000.0000"
+    configure_axis(controller, "A", {"sp": 5000})
+    assert controller.send_command("MG _SPA") == "5000.0000"
+
+
+def test_halting_a_step_test_leaves_other_threads_running(controller):
+    controller.download_program("#STEPA\nJP#STEPA\nEN\n#IDLE\nJP#IDLE\nEN\n")
+    controller.send_batch(["XQ #STEPA,0", "XQ #IDLE,3"])
+    assert halt_commands("A") == ["HX0", "STA"]
+    controller.send_batch(halt_commands("A"))
+    assert float(controller.send_command("MG _XQ0")) < 0
+    assert float(controller.send_command("MG _XQ3")) >= 0
+    controller.send_command("HX3")
@@ -0,0 +1,35 @@
+from strip_chart import _largest_triangle, _Trace
+
+
+def test_largest_triangle_picks_the_point_furthest_from_the_line():
+    bucket = [(1.0, 0.0), (1.5, 5.0), (2.0, -1.0)]
+    assert _largest_triangle(bucket, (0.0, 0.0), (3.0, 0.0)) == (1.5, 5.0)
+
+
+def test_outlier_survives_decimation():
+    trace = _Trace(bucket_width=0.1)
+    times = [i * 0.001 for i in range(2000)]  # 2 s at 1 kHz, 100 samples per bucket
+    values = [0] * len(times)
+    values[1234] = 500
+    trace.extend(times, values)
+    points = trace.points(0.0)
+    assert len(points) <= 22  # about one point per bucket
+    assert (times[1234], 500) in points
+    assert points[0] == (0.0, 0) and points[-1] == (times[-1], 0)
+
+
+def test_incremental_extend_matches_one_pass():
+    times = [i * 0.001 for i in range(3000)]
+    values = [(i * 37) % 101 - 50 for i in range(3000)]
+    whole = _Trace(0.05)
+    whole.extend(times, values)
+    pieces = _Trace(0.05)
+    for start in range(0, 3000, 7):
+        pieces.extend(times[start:start + 7], values[start:start + 7])
+    assert pieces.points(0.0) == whole.points(0.0)
+
+
+def test_points_before_start_are_dropped():
+    trace = _Trace(0.1)
+    trace.extend([i * 0.01 for i in range(500)], list(range(500)))
+    assert all(t >= 3.0 for t, _ in trace.points(3.0))